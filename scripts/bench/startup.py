@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "wikidot>=4.0.1,<5",
+#     "python-dotenv>=1.0.0",
+# ]
+# ///
+"""
+起動時間の計測
+
+各スクリプトについて以下を計測し、.state/bench/startup.json の基準値と比べる:
+  imports       : python -X importtime <script> --help でのモジュール読み込み時間の合計（ミリ秒）
+  first_request : 起動から最初のリクエストまでの時間（ミリ秒、小さな合成サイトに対して実行し、合成サイトの読み込み時間を除く）
+
+基準値より THRESHOLD の割合以上かつ MIN_DELTA_MS 以上遅くなった項目があれば終了コード1で終わる。
+--update-baseline で現在の値を基準値として保存する。
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from bench.synthetic_site import SCENARIOS, SCRIPTS_DIR, SYNTHETIC_ENV, scenario_command, write_site  # noqa: E402
+from common.paths import state_path  # noqa: E402
+from common.synthetic import SiteSize  # noqa: E402
+
+logging.basicConfig(
+    level=logging.WARN,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 回帰とみなす遅れ（基準値に対する割合と、計測の揺れを除くための最小の差）
+THRESHOLD = 0.25
+MIN_DELTA_MS = 20.0
+# 起動時間を見るための小さな合成サイトの規模（既定の規模に対する倍率）
+SITE_SCALE = 0.02
+TOP_MODULES = 5
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$")
+
+
+def measure_imports(script: str) -> tuple[float, list[tuple[str, float]]]:
+    """モジュール読み込み時間の合計（ミリ秒）と、読み込みに時間のかかった最上位のモジュール"""
+    command = [sys.executable, "-X", "importtime", str(SCRIPTS_DIR / script), "--help"]
+    proc = subprocess.run(command, capture_output=True, text=True, env={**os.environ, **SYNTHETIC_ENV})
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        # インデントが1つの行がスクリプト（とインタプリタの起動処理）から直接読み込んだモジュール
+        if match and len(match.group(3)) == 1:
+            modules.append((match.group(4), int(match.group(2)) / 1000))
+    return sum(ms for _, ms in modules), sorted(modules, key=lambda m: -m[1])[:TOP_MODULES]
+
+
+def measure_first_request(name: str, site_path: Path, state_dir: Path) -> float | None:
+    """起動から最初のリクエストまでの時間（ミリ秒）"""
+    stats_path = state_dir / "synthetic" / "stats.json"
+    stats_path.unlink(missing_ok=True)
+    env = {**os.environ, **SYNTHETIC_ENV, "SCP_JP_STATE_DIR": str(state_dir)}
+    launched = time.time()
+    subprocess.run(
+        scenario_command(name, site_path, 0.0),
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    if not stats_path.exists():
+        return None
+    stats = json.loads(stats_path.read_text(encoding="utf-8"))
+    if stats.get("first_request_at") is None:
+        return None
+    return (stats["first_request_at"] - launched - stats["load_seconds"]) * 1000
+
+
+def measure(names: list[str], workdir: Path, repeat: int) -> dict[str, dict]:
+    site_path = workdir / "site.json.gz"
+    if not site_path.exists():
+        write_site(SiteSize().scaled(SITE_SCALE), 0, site_path)
+
+    results = {}
+    for name in names:
+        script = SCENARIOS[name][0]
+        # 揺れを除くため最小値を取る
+        imports = [measure_imports(script) for _ in range(repeat)]
+        first = [measure_first_request(name, site_path, workdir / "state" / name) for _ in range(repeat)]
+        first = [ms for ms in first if ms is not None]
+        total, top = min(imports, key=lambda m: m[0])
+        results[name] = {
+            "imports": round(total, 1),
+            "first_request": round(min(first), 1) if first else None,
+            "top_imports": [[module, round(ms, 1)] for module, ms in top],
+        }
+        logger.info(
+            f"{name}: 読み込み {total:.0f}ms, 最初のリクエストまで "
+            + (f"{min(first):.0f}ms" if first else "-")
+            + f" ({', '.join(f'{m} {ms:.0f}ms' for m, ms in top)})"
+        )
+    return results
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict]) -> list[str]:
+    """基準値から回帰した項目の説明"""
+    regressions = []
+    for name, result in results.items():
+        for key in ("imports", "first_request"):
+            current, base = result.get(key), baseline.get(name, {}).get(key)
+            if current is None or not base:
+                continue
+            if current > base * (1 + THRESHOLD) and current - base > MIN_DELTA_MS:
+                regressions.append(f"{name} {key}: {current:.0f}ms（基準値 {base:.0f}ms の {current / base:.2f}倍）")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="各スクリプトの起動時間の計測")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="計測するシナリオ（複数指定可）")
+    parser.add_argument("--repeat", type=int, default=3, help="各項目の計測回数（最小値を使う）")
+    parser.add_argument("--baseline", type=Path, default=state_path("bench", "startup.json"), help="基準値のファイル")
+    parser.add_argument("--update-baseline", action="store_true", help="計測結果を基準値として保存する")
+    parser.add_argument("--workdir", type=Path, default=state_path("bench", "startup", "x").parent, help="作業ディレクトリ")
+    args = parser.parse_args()
+
+    results = measure(args.scenario or list(SCENARIOS), args.workdir, args.repeat)
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else {}
+    if args.update_baseline or not baseline:
+        args.baseline.write_text(json.dumps({**baseline, **results}, ensure_ascii=False, indent=2), encoding="utf-8")
+        logger.info(f"基準値を保存: {args.baseline}")
+        return
+
+    regressions = compare(results, baseline)
+    for regression in regressions:
+        logger.error(f"起動時間の回帰: {regression}")
+    if regressions:
+        sys.exit(1)
+    logger.info("起動時間: 基準値からの回帰なし")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "wikidot>=4.0.1,<5",
+#     "python-dotenv>=1.0.0",
+# ]
+# ///
+"""
+合成サイトによる規模検証
+
+generate : 合成サイト（.json.gz）とrename_4000jp.py用の入力TSVを生成
+scaling  : 規模を変えた合成サイトに対して各スクリプトを --synthetic で実行し、
+           所要時間・リクエスト数・最大メモリの伸びを表示する
+           （代替サーバーは同じプロセスで動くため、最大メモリには合成サイトの分も含む）
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.paths import state_path  # noqa: E402
+from common.synthetic import SiteSize, generate_site, rename_input, save_site  # noqa: E402
+
+logging.basicConfig(
+    level=logging.WARN,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+SCRIPTS_DIR = Path(__file__).resolve().parents[1]
+
+# シナリオ名 → (スクリプト, 引数)。{rename_input} は生成したTSVに置き換える
+SCENARIOS = {
+    "tagging": ("tool/new_page_tagging.py", ["--dry-run"]),
+    "notice": ("collab_deletion/notice.py", ["--dry-run"]),
+    "exec": ("collab_deletion/exec.py", ["--dry-run"]),
+    "audit": ("tool/site_audit.py", []),
+    "bulk-tag": (
+        "tool/bulk_tag.py",
+        ["--site", "scp-jp-sandbox3", "--category", "portal", "--tags=+非使用ユーザー", "--remove", "initial_*", "--dry-run"],
+    ),
+    "mirror": ("tool/source_mirror.py", ["--site", "scp-jp", "sync"]),
+    "preferences": ("temp/get_4000jp_preferences.py", []),
+    "rename": ("temp/rename_4000jp.py", ["--dry-run", "--input", "{rename_input}", "--diff-mode", "none"]),
+}
+
+# 合成サイトに対して実行するときの認証情報（代替サーバーは内容を検証しない）
+SYNTHETIC_ENV = {
+    "WIKIDOT_USERNAME": "synthetic",
+    "WIKIDOT_PASSWORD": "synthetic",
+    "DISCORD_WEBHOOK_URL": "https://discord.com/api/webhooks/0/synthetic",
+}
+
+
+def rename_input_path(site_path: Path) -> Path:
+    return site_path.with_name(site_path.name.removesuffix(".json.gz") + ".rename.tsv")
+
+
+def write_site(size: SiteSize, seed: int, path: Path) -> None:
+    started = time.perf_counter()
+    data = generate_site(size, seed=seed)
+    save_site(data, path)
+    rename_input_path(path).write_text(rename_input(data, seed=seed), encoding="utf-8")
+    pages = sum(len(site["pages"]) for site in data["sites"].values())
+    logger.info(f"合成サイトを生成: {path} ({pages}ページ, {time.perf_counter() - started:.1f}秒)")
+
+
+def cmd_generate(args) -> None:
+    base = SiteSize().scaled(args.scale)
+    overrides = {k: getattr(args, k) for k in asdict(base) if getattr(args, k) is not None}
+    size = SiteSize(**{**asdict(base), **overrides})
+    logger.info(f"規模: {asdict(size)}")
+    write_site(size, args.seed, args.output)
+
+
+def scenario_command(name: str, site_path: Path, latency: float) -> list[str]:
+    """シナリオを合成サイトに対して実行するコマンド"""
+    script, script_args = SCENARIOS[name]
+    script_args = [arg.replace("{rename_input}", str(rename_input_path(site_path))) for arg in script_args]
+    common = ["--synthetic", str(site_path), "--synthetic-latency", str(latency)]
+    # サブコマンドを持つスクリプトのため、共通オプションを先に置く
+    return [sys.executable, str(SCRIPTS_DIR / script), *common, *script_args]
+
+
+def run_scenario(name: str, site_path: Path, state_dir: Path, log_path: Path, latency: float) -> dict:
+    """1シナリオを子プロセスで実行し、所要時間・リクエスト数・最大メモリを返す"""
+    command = scenario_command(name, site_path, latency)
+    env = {**os.environ, **SYNTHETIC_ENV, "SCP_JP_STATE_DIR": str(state_dir)}
+
+    stats_path = state_dir / "synthetic" / "stats.json"
+    stats_path.unlink(missing_ok=True)
+    started = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.Popen(command, env=env, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+    seconds = time.perf_counter() - started
+
+    result = {
+        "scenario": name,
+        "seconds": round(seconds, 3),
+        "returncode": os.waitstatus_to_exitcode(status),
+        "max_rss_mib": round(usage.ru_maxrss / 1024, 1),
+        "requests": None,
+        "phases": {},
+    }
+    if stats_path.exists():
+        result["requests"] = json.loads(stats_path.read_text(encoding="utf-8"))["requests"]
+    for metrics_path in (state_dir / "metrics").glob("*.json"):
+        if not metrics_path.name.endswith(".history.json"):
+            result["phases"] = json.loads(metrics_path.read_text(encoding="utf-8"))["phases"]
+    return result
+
+
+def growth(rows: list[dict], key: str) -> float | None:
+    """最小規模から最大規模への伸びの指数（1.0で規模に比例、2.0で二乗）"""
+    first, last = rows[0], rows[-1]
+    if not first[key] or not last[key] or first["scale"] == last["scale"]:
+        return None
+    return math.log(last[key] / first[key]) / math.log(last["scale"] / first["scale"])
+
+
+def print_report(results: list[dict]) -> None:
+    print(f"{'シナリオ':<12}{'規模':>8}{'portal':>8}{'合作':>8}{'参加記事':>8}{'秒':>10}{'リクエスト':>10}{'RSS(MiB)':>10}")
+    for name in dict.fromkeys(r["scenario"] for r in results):
+        rows = [r for r in results if r["scenario"] == name]
+        for r in rows:
+            status = "" if r["returncode"] == 0 else f"  失敗 (終了コード {r['returncode']})"
+            size = r["size"]
+            print(
+                f"{name:<12}{r['scale']:>8g}{size['portal']:>8}{size['collab'] * 6:>8}{size['contest']:>8}"
+                f"{r['seconds']:>10.2f}{r['requests'] or '-':>10}{r['max_rss_mib']:>10}{status}"
+            )
+        seconds, requests = growth(rows, "seconds"), growth(rows, "requests")
+        if seconds is not None:
+            print(f"{'':<12}伸び: 時間 {seconds:.2f}" + (f" / リクエスト {requests:.2f}" if requests is not None else ""))
+
+
+def cmd_scaling(args) -> None:
+    names = args.scenario or list(SCENARIOS)
+    results = []
+    for scale in sorted(args.scales):
+        size = SiteSize().scaled(scale)
+        scale_dir = args.workdir / f"x{scale:g}"
+        site_path = scale_dir / "site.json.gz"
+        if args.regenerate or not site_path.exists():
+            write_site(size, args.seed, site_path)
+
+        for name in names:
+            state_dir = scale_dir / "state" / name
+            log_path = scale_dir / "logs" / f"{name}.log"
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+            # 2回目以降は前回の状態（検索件数のヒントなど）を引き継いだ定常時の実行になる
+            for _ in range(args.repeat):
+                result = run_scenario(name, site_path, state_dir, log_path, args.latency)
+            result.update(scale=scale, size=asdict(size))
+            results.append(result)
+            logger.info(
+                f"x{scale:g} {name}: {result['seconds']:.2f}秒, リクエスト {result['requests']}件, "
+                f"RSS {result['max_rss_mib']} MiB"
+                + ("" if result["returncode"] == 0 else f", 失敗（ログ: {log_path}）")
+            )
+
+    print_report(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        logger.info(f"結果を保存: {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成サイトによる規模検証")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード（同じシードなら同じサイト）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_generate = sub.add_parser("generate", help="合成サイトを生成")
+    p_generate.add_argument("--output", type=Path, default=state_path("synthetic", "site.json.gz"), help="出力先")
+    p_generate.add_argument("--scale", type=float, default=1.0, help="既定の規模に掛ける倍率")
+    for key, default in asdict(SiteSize()).items():
+        p_generate.add_argument(f"--{key}", type=int, help=f"{key} のページ数（既定: {default} × 倍率）")
+    p_generate.set_defaults(func=cmd_generate)
+
+    p_scaling = sub.add_parser("scaling", help="規模を変えて各スクリプトを実行")
+    p_scaling.add_argument("--scales", type=float, nargs="+", default=[1, 5, 20, 50], help="既定の規模に掛ける倍率")
+    p_scaling.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="実行するシナリオ（複数指定可）")
+    p_scaling.add_argument("--latency", type=float, default=0.05, help="1リクエストあたりの応答時間（秒）")
+    p_scaling.add_argument("--repeat", type=int, default=2, help="各シナリオの実行回数（最後の実行を記録）")
+    p_scaling.add_argument("--workdir", type=Path, default=state_path("bench", "scaling", "x").parent, help="作業ディレクトリ")
+    p_scaling.add_argument("--regenerate", action="store_true", help="生成済みの合成サイトを作り直す")
+    p_scaling.add_argument("--output", type=Path, help="結果をJSONで保存")
+    p_scaling.set_defaults(func=cmd_scaling)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
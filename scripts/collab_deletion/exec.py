@@ -4,13 +4,15 @@
 # dependencies = [
 #     "wikidot>=4.0.1,<5",
 #     "python-dotenv>=1.0.0",
-#     "requests>=2.31.0",
 # ]
 # ///
 """
 剪定通知済みページの処理
 - rating <= -3: タグ全削除 + deleted:カテゴリにリネーム
 - rating >= -2: 剪定通知タグのみ削除（回復扱い）
+
+--processes を指定するとページごとの処理をジョブキューに登録し、複数のワーカープロセスで実行する
+（中断しても同じ月のうちに再実行すれば続きから処理する）。
 """
 
 import argparse
@@ -18,11 +20,22 @@ import logging
 import os
 import random
 import string
-import requests
-from datetime import datetime, UTC
-from dotenv import load_dotenv
+import sys
+from datetime import datetime, timedelta, UTC
+from pathlib import Path
 import wikidot
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.cli import add_common_arguments, apply_common_arguments, load_env  # noqa: E402
+from common.discord import COLOR_ERROR, COLOR_SUCCESS, COLOR_WARNING, send_discord_notification  # noqa: E402
+from common.metrics import RunMetrics  # noqa: E402
+from common.page_ids import get_page_ids  # noqa: E402
+from common.rating_history import RatingHistory  # noqa: E402
+from common.retry import commit_tags, rename  # noqa: E402
+from common.search import search  # noqa: E402
+from common.session import create_client  # noqa: E402
+from common.verify import Expectation, discord_field, verify  # noqa: E402
+
 logging.basicConfig(
     level=logging.WARN,
     format="%(asctime)s [%(levelname)s] %(message)s",
@@ -34,10 +47,6 @@ logger.setLevel(logging.INFO)
 NOTICE_TAG = "合作記事剪定通知"
 FORUM_THREAD_ID = 12464623
 
-COLOR_SUCCESS = 0x00FF00
-COLOR_WARNING = 0xFFFF00
-COLOR_ERROR = 0xFF0000
-
 
 def generate_random_suffix(length: int = 6) -> str:
     """ランダムな英数字文字列を生成"""
@@ -45,32 +54,6 @@ def generate_random_suffix(length: int = 6) -> str:
     return "".join(random.choices(chars, k=length))
 
 
-def send_discord_notification(
-    webhook_url: str,
-    title: str,
-    description: str,
-    fields: list[dict] | None = None,
-    color: int = COLOR_SUCCESS,
-) -> bool:
-    """Discord webhookにembed形式で通知を送信"""
-    embed = {
-        "title": title,
-        "description": description,
-        "color": color,
-        "timestamp": datetime.now(UTC).isoformat(),
-        "footer": {"text": "SCP-JP Scripts"},
-    }
-    if fields:
-        embed["fields"] = fields
-
-    try:
-        response = requests.post(webhook_url, json={"embeds": [embed]}, timeout=10)
-        return 200 <= response.status_code < 300
-    except requests.RequestException as e:
-        logger.exception(f"Error sending Discord notification: {e}")
-        return False
-
-
 def find_notice_post(thread, year_month: str) -> int | None:
     """当月の通知ポストを探す"""
     pattern = f"剪定対象合作の削除通知のお知らせ({year_month})"
@@ -118,30 +101,93 @@ def post_forum_delete_notice(
         return {"posted": False, "error": str(e)}
 
 
+def run_queued(site_name: str, tasks: list[tuple[str, dict]], args, results: dict) -> None:
+    """削除・回復をジョブキューに登録してワーカープロセスで実行し、結果をresultsに反映する"""
+    from common.jobqueue import DONE, JobQueue, run_workers
+
+    job = f"collab-exec-{datetime.now().strftime('%Y-%m')}"
+    with JobQueue() as queue:
+        queue.enqueue(job, site_name, tasks)
+        run_workers(job, args.processes)
+        # 前回中断した実行で登録したタスクも含めて報告する
+        for task in queue.results(job):
+            if task.status != DONE:
+                results["errors"].append({"page": task.key, "error": task.error or task.status})
+            else:
+                entry = dict(task.payload["info"])
+                results[entry.pop("result")].append(entry)
+        if not results["errors"]:
+            queue.delete(job)
+
+
+def format_rating_trend(entry: dict) -> str:
+    """通知時点からのrating推移を表示用に整形"""
+    if entry.get("notice_rating") is None:
+        return f"rating: {entry['rating']}"
+    return f"rating: {entry['notice_rating']:g} → {entry['rating']}"
+
+
 def main():
     parser = argparse.ArgumentParser(description="剪定実行スクリプト")
     parser.add_argument("--dry-run", action="store_true", help="実際の変更を行わずに対象を表示")
+    parser.add_argument("--processes", type=int, default=0, help="ジョブキューに登録し、このプロセス数のワーカーで実行")
+    add_common_arguments(parser)
     args = parser.parse_args()
+    if args.synthetic and args.processes:
+        # 合成サイトはプロセスごとに別のコピーになり、ワーカーの書き込みがこのプロセスから見えない
+        parser.error("--synthetic と --processes は併用できません")
+    apply_common_arguments(args)
 
-    load_dotenv()
+    load_env()
     webhook_url = os.environ["DISCORD_WEBHOOK_URL"]
     results = {
         "deleted": [],
         "recovered": [],
         "errors": [],
         "forum": None,
+        "crossings": [],
+        "expected": [],
+        "drifts": [],
     }
 
     if args.dry_run:
         logger.info("=== DRY-RUN MODE ===")
 
-    with wikidot.Client(
-        username=os.environ["WIKIDOT_USERNAME"],
-        password=os.environ["WIKIDOT_PASSWORD"],
-    ) as client:
+    with (
+        RunMetrics("collab-exec", dry_run=args.dry_run) as run_metrics,
+        create_client(
+            username=os.environ["WIKIDOT_USERNAME"],
+            password=os.environ["WIKIDOT_PASSWORD"],
+        ) as client,
+    ):
+        run_metrics.start_phase("scan")
         site = client.site.get("scp-jp")
-        pages = site.pages.search(tags=[NOTICE_TAG])
-
+        pages = search(site, fields=("tags", "rating"), tags=[NOTICE_TAG])
+
+        # 通知時点のratingは履歴から参照する（再取得しない）
+        with RatingHistory() as history:
+            notice_ratings = {}
+            for page in pages:
+                observation = history.latest(site.unix_name, page.fullname, source="notice")
+                notice_ratings[page.fullname] = observation.rating if observation else None
+            now = datetime.now(UTC)
+            if not args.dry_run:
+                history.record(site.unix_name, pages, source="exec", observed_at=now)
+
+            # 期間の終わりは含まないため、今回記録した（秒単位に丸めた）ratingも含まれるよう翌日までとする
+            month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            results["crossings"] = history.crossings(site.unix_name, -3, month_start, now + timedelta(days=1))
+
+        run_metrics.start_phase("process")
+        queued = args.processes > 0 and not args.dry_run
+        if queued:
+            # ジョブキュー（sqlite3・subprocess）は --processes のときだけ読み込む
+            from common.jobqueue import page_task
+        elif not args.dry_run:
+            # commit_tagsがページごとにIDを取得しないよう、まとめて（キャッシュにない分だけ）設定する
+            get_page_ids(site, pages)
+
+        tasks = []
         for page in pages:
             try:
                 if page.rating <= -3:
@@ -155,42 +201,66 @@ def main():
                     else:
                         new_name = f"deleted:{original_fullname}-{random_suffix}"
 
+                    entry = {
+                        "original": original_fullname,
+                        "new": new_name,
+                        "rating": page.rating,
+                        "notice_rating": notice_ratings.get(original_fullname),
+                    }
+                    if queued:
+                        task = page_task(tags=[], rename_to=new_name, info={"result": "deleted", **entry})
+                        tasks.append((page.fullname, task))
+                        continue
                     if args.dry_run:
                         logger.info(f"[DRY-RUN] DELETE: {original_fullname} -> {new_name} (rating: {page.rating})")
                     else:
                         for tag in list(page.tags):
                             page.tags.remove(tag)
-                        page.commit_tags()
-                        page.rename(new_name)
+                        commit_tags(page)
+                        rename(page, new_name)
+                        run_metrics.count("pages_mutated")
                         logger.info(f"DELETE: {original_fullname} -> {new_name} (rating: {page.rating})")
 
-                    results["deleted"].append(
-                        {
-                            "original": original_fullname,
-                            "new": new_name,
-                            "rating": page.rating,
-                        }
-                    )
+                    results["deleted"].append(entry)
 
                 else:
                     # 回復処理: 通知タグのみ削除
+                    entry = {
+                        "page": page.fullname,
+                        "rating": page.rating,
+                        "notice_rating": notice_ratings.get(page.fullname),
+                    }
+                    if queued:
+                        new_tags = [tag for tag in page.tags if tag != NOTICE_TAG]
+                        tasks.append((page.fullname, page_task(tags=new_tags, info={"result": "recovered", **entry})))
+                        continue
                     if args.dry_run:
                         logger.info(f"[DRY-RUN] RECOVER: {page.fullname} (rating: {page.rating}): -[{NOTICE_TAG}]")
                     else:
                         page.tags.remove(NOTICE_TAG)
-                        page.commit_tags()
+                        commit_tags(page)
+                        run_metrics.count("pages_mutated")
                         logger.info(f"RECOVER: {page.fullname} (rating: {page.rating}): -[{NOTICE_TAG}]")
 
-                    results["recovered"].append(
-                        {"page": page.fullname, "rating": page.rating}
-                    )
+                    results["recovered"].append(entry)
 
             except Exception as e:
                 logger.exception(f"Error processing page {page.fullname}: {e}")
                 results["errors"].append({"page": page.fullname, "error": str(e)})
 
+        if queued:
+            run_queued(site.unix_name, tasks, args, results)
+
+        # 事後検証: 処理したページをまとめて読み直す
+        if not args.dry_run and (results["deleted"] or results["recovered"]):
+            run_metrics.start_phase("verify")
+            results["expected"] = [Expectation(d["new"], tags=(), gone=d["original"]) for d in results["deleted"]]
+            results["expected"] += [Expectation(r["page"], tags_absent=(NOTICE_TAG,)) for r in results["recovered"]]
+            results["drifts"] = verify(site, results["expected"])
+
         # フォーラム投稿（削除または回復処理があった場合）
         if results["deleted"] or results["recovered"]:
+            run_metrics.start_phase("forum")
             results["forum"] = post_forum_delete_notice(site, dry_run=args.dry_run)
 
     # Discord通知（dry-run時は送信しない）
@@ -205,7 +275,7 @@ def main():
 
     deleted_list = "\n".join(
         [
-            f"- {d['original']} -> {d['new']} (rating: {d['rating']})"
+            f"- {d['original']} -> {d['new']} ({format_rating_trend(d)})"
             for d in results["deleted"][:5]
         ]
     )
@@ -213,7 +283,7 @@ def main():
         deleted_list += f"\n...他 {len(results['deleted']) - 5}件"
 
     recovered_list = "\n".join(
-        [f"- {r['page']} (rating: {r['rating']})" for r in results["recovered"][:5]]
+        [f"- {r['page']} ({format_rating_trend(r)})" for r in results["recovered"][:5]]
     )
     if len(results["recovered"]) > 5:
         recovered_list += f"\n...他 {len(results['recovered']) - 5}件"
@@ -240,6 +310,16 @@ def main():
         },
     ]
 
+    if results["crossings"]:
+        downward = sum(1 for c in results["crossings"] if c.downward)
+        fields.append(
+            {
+                "name": "今月のrating推移 (-3基準)",
+                "value": f"-3以下へ下落: {downward}件\n-3超へ回復: {len(results['crossings']) - downward}件",
+                "inline": False,
+            }
+        )
+
     if results["forum"]:
         if results["forum"].get("posted"):
             replied_to = results["forum"].get("replied_to")
@@ -254,9 +334,14 @@ def main():
             }
         )
 
-    if results["errors"] or (results["forum"] and not results["forum"].get("posted")):
+    if results["expected"]:
+        fields.append(discord_field(results["expected"], results["drifts"]))
+
+    fields.append(run_metrics.discord_field())
+
+    if results["errors"] or results["drifts"] or (results["forum"] and not results["forum"].get("posted")):
         color = COLOR_ERROR
-    elif results["deleted"]:
+    elif results["deleted"] or run_metrics.regressions:
         color = COLOR_WARNING
     else:
         color = COLOR_SUCCESS
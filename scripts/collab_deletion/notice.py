@@ -4,22 +4,34 @@
 # dependencies = [
 #     "wikidot>=4.0.1,<5",
 #     "python-dotenv>=1.0.0",
-#     "requests>=2.31.0",
 # ]
 # ///
 """
 低評価剪定対象合作ページへの剪定通知タグ付与
 条件: rating <= -3
+
+--deadline を指定すると ratingの低い順に処理し、時間予算を使い切りそうになった残りは次回に持ち越す。
+フォーラムへの通知はタグを付けたページがあれば持ち越しの有無によらず投稿する（定期実行では --deadline を使わない）。
 """
 
 import argparse
 import logging
 import os
-import requests
-from datetime import datetime, UTC
-from dotenv import load_dotenv
+import sys
+from datetime import datetime
+from pathlib import Path
 import wikidot
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.cli import add_common_arguments, apply_common_arguments, load_env  # noqa: E402
+from common.deadline import Backlog, Deadline  # noqa: E402
+from common.discord import COLOR_ERROR, COLOR_SUCCESS, COLOR_WARNING, send_discord_notification  # noqa: E402
+from common.metrics import RunMetrics  # noqa: E402
+from common.rating_history import RatingHistory  # noqa: E402
+from common.rules import COLLAB_NOTICE_RULE, apply_fixes, scan_site  # noqa: E402
+from common.session import create_client  # noqa: E402
+from common.verify import Expectation, discord_field, verify  # noqa: E402
+
 logging.basicConfig(
     level=logging.WARN,
     format="%(asctime)s [%(levelname)s] %(message)s",
@@ -28,48 +40,8 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-COLLAB_CATEGORIES = [
-    "anomalous-jp",
-    "extranormal-events-jp",
-    "video-log-of-scp-1779-jp",
-    "poem",
-    "log-of-unexplained-locations-jp",
-    "scp-flavor",
-]
-
-NOTICE_TAG = "合作記事剪定通知"
 FORUM_THREAD_ID = 12464623
 
-COLOR_SUCCESS = 0x00FF00
-COLOR_WARNING = 0xFFFF00
-COLOR_ERROR = 0xFF0000
-
-
-def send_discord_notification(
-    webhook_url: str,
-    title: str,
-    description: str,
-    fields: list[dict] | None = None,
-    color: int = COLOR_SUCCESS,
-) -> bool:
-    """Discord webhookにembed形式で通知を送信"""
-    embed = {
-        "title": title,
-        "description": description,
-        "color": color,
-        "timestamp": datetime.now(UTC).isoformat(),
-        "footer": {"text": "SCP-JP Scripts"},
-    }
-    if fields:
-        embed["fields"] = fields
-
-    try:
-        response = requests.post(webhook_url, json={"embeds": [embed]}, timeout=10)
-        return 200 <= response.status_code < 300
-    except requests.RequestException as e:
-        logger.exception(f"Error sending Discord notification: {e}")
-        return False
-
 
 def post_forum_notice(site: wikidot.module.site.Site, dry_run: bool = False) -> dict:
     """フォーラムに剪定通知を投稿"""
@@ -107,47 +79,61 @@ def post_forum_notice(site: wikidot.module.site.Site, dry_run: bool = False) ->
 def main():
     parser = argparse.ArgumentParser(description="剪定通知タグ付与スクリプト")
     parser.add_argument("--dry-run", action="store_true", help="実際の変更を行わずに対象を表示")
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        help="時間予算（秒）。超えそうになったら残りを .state/backlog/ に保存して次回に持ち越す",
+    )
+    add_common_arguments(parser)
     args = parser.parse_args()
+    apply_common_arguments(args)
+    deadline = Deadline(args.deadline) if args.deadline else None
 
-    load_dotenv()
+    load_env()
     webhook_url = os.environ["DISCORD_WEBHOOK_URL"]
-    results = {"processed": [], "errors": [], "forum": None}
+    results = {"processed": [], "errors": [], "deferred": [], "forum": None, "expected": [], "drifts": []}
+    backlog = Backlog("collab-notice")
+    if backlog:
+        logger.info(f"前回からの持ち越し: {len(backlog)}件")
 
     if args.dry_run:
         logger.info("=== DRY-RUN MODE ===")
 
-    with wikidot.Client(
-        username=os.environ["WIKIDOT_USERNAME"],
-        password=os.environ["WIKIDOT_PASSWORD"],
-    ) as client:
+    with (
+        RunMetrics("collab-notice", dry_run=args.dry_run) as run_metrics,
+        create_client(
+            username=os.environ["WIKIDOT_USERNAME"],
+            password=os.environ["WIKIDOT_PASSWORD"],
+        ) as client,
+    ):
+        run_metrics.start_phase("scan")
         site = client.site.get("scp-jp")
 
-        for category in COLLAB_CATEGORIES:
-            # rating <= -3 かつ通知タグなしのページを検索
-            pages = site.pages.search(
-                category=category,
-                rating="<=-3",
-                tags=[f"-{NOTICE_TAG}"]
-            )
-
-            for page in pages:
-                try:
-                    if args.dry_run:
-                        logger.info(f"[DRY-RUN] {page.fullname} (rating: {page.rating}): +[{NOTICE_TAG}]")
-                    else:
-                        page.tags.append(NOTICE_TAG)
-                        page.commit_tags()
-                        logger.info(f"{page.fullname} (rating: {page.rating}): +[{NOTICE_TAG}]")
-
-                    results["processed"].append(
-                        {"page": page.fullname, "rating": page.rating}
-                    )
-                except Exception as e:
-                    logger.exception(f"Error processing page {page.fullname}: {e}")
-                    results["errors"].append({"page": page.fullname, "error": str(e)})
-
-        # フォーラム投稿（処理対象がある場合のみ）
+        # 合作カテゴリを1回だけスキャンし、rating <= -3 かつ通知タグなしのページにタグ付与
+        scan = scan_site(site, [COLLAB_NOTICE_RULE])
+        if not args.dry_run:
+            with RatingHistory() as history:
+                history.record(site.unix_name, scan.pages, source="notice")
+        run_metrics.start_phase("fix")
+        fixed = apply_fixes(scan.violations, dry_run=args.dry_run, deadline=deadline, backlog=backlog)
+        results["processed"] = fixed["processed"]
+        results["errors"] = fixed["errors"]
+        results["deferred"] = fixed["deferred"]
+        if not args.dry_run:
+            backlog.save(results["deferred"])
+
+        # 事後検証: タグを付けたページをまとめて読み直す
+        if not args.dry_run and results["processed"]:
+            run_metrics.start_phase("verify")
+            results["expected"] = [
+                Expectation(p["page"], tags_present=tuple(p["added"]), tags_absent=tuple(p["removed"]))
+                for p in results["processed"]
+            ]
+            results["drifts"] = verify(site, results["expected"])
+
+        # フォーラム投稿（タグを付けたページがあれば、持ち越しの有無によらず投稿する）
         if results["processed"]:
+            run_metrics.start_phase("forum")
             results["forum"] = post_forum_notice(site, dry_run=args.dry_run)
 
     # Discord通知（dry-run時は送信しない）
@@ -155,6 +141,8 @@ def main():
         logger.info("=== SUMMARY ===")
         logger.info(f"処理対象: {len(results['processed'])}件")
         logger.info(f"エラー: {len(results['errors'])}件")
+        if deadline is not None:
+            logger.info(f"時間予算: {deadline.describe()}, 持ち越し {len(results['deferred'])}件")
         if results["forum"]:
             logger.info(f"フォーラム投稿: {'予定' if results['forum'].get('posted') else 'なし'}")
         return
@@ -195,8 +183,18 @@ def main():
             }
         )
 
-    if results["errors"] or (results["forum"] and not results["forum"].get("posted")):
+    if results["expected"]:
+        fields.append(discord_field(results["expected"], results["drifts"]))
+
+    if deadline is not None:
+        fields.append(deadline.discord_field(carried_over=len(backlog)))
+
+    fields.append(run_metrics.discord_field())
+
+    if results["errors"] or results["drifts"] or (results["forum"] and not results["forum"].get("posted")):
         color = COLOR_ERROR
+    elif run_metrics.regressions or results["deferred"]:
+        color = COLOR_WARNING
     else:
         color = COLOR_SUCCESS
 
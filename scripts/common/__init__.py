@@ -0,0 +1,12 @@
+"""
+スクリプト共通モジュール
+
+各スクリプトからは以下のようにパスを通して読み込む:
+
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from common.rules import ...
+"""
+
+import logging
+
+logging.getLogger(__name__).setLevel(logging.INFO)
@@ -0,0 +1,96 @@
+"""
+バックリンクインデックス
+
+ページのfullname → そのページを参照しているページのfullname集合を保持する。
+参照元の探索はインデックス参照のみで行い、サイトをクロールしない。
+参照元のないページも空の集合として持ち、どのページについて構築したかが分かるようにする。
+"""
+
+import json
+import logging
+import re
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+
+class BacklinkIndex:
+    """fullname → 参照元fullnameの集合"""
+
+    def __init__(self, referrers: dict[str, set[str]] | None = None):
+        self._referrers: dict[str, set[str]] = referrers or {}
+
+    def __len__(self) -> int:
+        return len(self._referrers)
+
+    def missing(self, fullnames) -> list[str]:
+        """インデックスを構築していないページ"""
+        return [fullname for fullname in fullnames if fullname not in self._referrers]
+
+    def update(self, other: "BacklinkIndex") -> None:
+        """別に構築したページの参照元を加える"""
+        self._referrers.update(other._referrers)
+
+    def referrers(self, fullname: str) -> set[str]:
+        """fullnameを参照しているページ（自分自身は除く）"""
+        return self._referrers.get(fullname, set()) - {fullname}
+
+    def referrers_of(self, fullnames) -> dict[str, set[str]]:
+        """複数ページの参照元を 参照元 → 参照先の集合 の形で返す"""
+        result: dict[str, set[str]] = {}
+        for target in fullnames:
+            for referrer in self.referrers(target):
+                result.setdefault(referrer, set()).add(target)
+        return result
+
+    def save(self, path: Path) -> None:
+        path.write_text(
+            json.dumps({k: sorted(v) for k, v in self._referrers.items()}, ensure_ascii=False, indent=1),
+            encoding="utf-8",
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "BacklinkIndex":
+        data = json.loads(path.read_text(encoding="utf-8"))
+        return cls({k: set(v) for k, v in data.items()})
+
+    @classmethod
+    def from_backlinks_module(cls, site, pages) -> "BacklinkIndex":
+        """
+        サイトのBacklinksModuleから対象ページの参照元を一括取得して構築
+
+        pagesはページIDが取得済みであること（PageCollection.get_page_ids()）。
+        """
+        pages = list(pages)
+        responses = site.amc_request(
+            [{"moduleName": "backlinks/BacklinksModule", "page_id": page.id} for page in pages]
+        )
+
+        referrers = {}
+        for page, response in zip(pages, responses, strict=True):
+            html = BeautifulSoup(response.json()["body"], "lxml")
+            referrers[page.fullname] = {
+                a["href"].strip("/") for a in html.select("a[href]") if a["href"].startswith("/")
+            }
+        logger.info(f"バックリンク取得: {len(pages)}ページ, 参照元 {sum(len(v) for v in referrers.values())}件")
+        return cls(referrers)
+
+    @classmethod
+    def from_mirror(cls, mirror, targets) -> "BacklinkIndex":
+        """ローカルのソースミラーを走査して対象ページの参照元を構築（リクエストなし）"""
+        targets = sorted(set(targets), key=len, reverse=True)
+        referrers: dict[str, set[str]] = {target: set() for target in targets}
+        if not targets:
+            return cls(referrers)
+
+        # 長いfullnameを優先し、後ろに名前の続きがある場合は別ページとみなす
+        pattern = re.compile(
+            r"(?<![a-z0-9:-])(" + "|".join(re.escape(t) for t in targets) + r")(?![a-z0-9-])", re.IGNORECASE
+        )
+        for fullname, source in mirror.items():
+            for match in pattern.finditer(source):
+                referrers[match.group(1).lower()].add(fullname)
+        logger.info(f"バックリンク構築（ミラー）: {len(targets)}ページ, 参照元 {sum(len(v) for v in referrers.values())}件")
+        return cls(referrers)
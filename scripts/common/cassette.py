@@ -0,0 +1,172 @@
+"""
+HTTPカセットの記録と再生
+
+記録: 共有トランスポート（common.transport）を通る全リクエスト/レスポンス（Wikidot・Discord）を
+      gzip圧縮したJSONLに1行ずつ書き出す。リクエストヘッダ（Cookie）は保存せず、
+      パスワード・Set-Cookieの値・webhookトークンは伏せ字にする。
+再生: 記録したレスポンスを接続プールの代わりに返す。応答時間は記録時の値に倍率を掛けて再現する
+      （0で待たない）。ネットワークには一切接続しない。
+
+再生時の照合は (メソッド, URL, 本文) の完全一致を優先し、一致しなければ
+(メソッド, URL, moduleName/action/event) が同じ記録を記録順に返す（ランダムなリネーム先など）。
+"""
+
+import asyncio
+import base64
+import gzip
+import json
+import logging
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode
+
+import httpx
+
+from .transport import get_transport
+
+logger = logging.getLogger(__name__)
+
+REDACTED = "***"
+_SECRET_FIELDS = {"password"}
+_KEEP_RESPONSE_HEADERS = {"content-type", "set-cookie", "location"}
+_WEBHOOK_PATTERN = re.compile(r"(/api/webhooks/\d+/)[^/?]+")
+
+
+def _scrub_url(url: str) -> str:
+    return _WEBHOOK_PATTERN.sub(rf"\g<1>{REDACTED}", url)
+
+
+def _scrub_body(request: httpx.Request) -> str:
+    content = request.content.decode("utf-8", errors="replace")
+    if request.headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+        fields = [(k, REDACTED if k in _SECRET_FIELDS else v) for k, v in parse_qsl(content, keep_blank_values=True)]
+        return urlencode(fields)
+    return content
+
+
+def _scrub_set_cookie(value: str) -> str:
+    name, _, rest = value.partition("=")
+    _, sep, attributes = rest.partition(";")
+    return f"{name}={REDACTED}{sep}{attributes}"
+
+
+def _coarse_key(method: str, url: str, body: str) -> tuple:
+    fields = dict(parse_qsl(body, keep_blank_values=True))
+    return (method, url, fields.get("moduleName"), fields.get("action"), fields.get("event"))
+
+
+class CassetteRecorder:
+    """トランスポートのフックとして全リクエストを記録する"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, request: httpx.Request):
+        started = time.perf_counter()
+        entry = {
+            "method": request.method,
+            "url": _scrub_url(str(request.url)),
+            "body": _scrub_body(request),
+        }
+
+        def after(response: httpx.Response | None, error: BaseException | None) -> None:
+            entry["elapsed"] = round(time.perf_counter() - started, 4)
+            if response is None:
+                entry["error"] = type(error).__name__
+            else:
+                entry["status"] = response.status_code
+                entry["headers"] = [
+                    [k, _scrub_set_cookie(v) if k.lower() == "set-cookie" else v]
+                    for k, v in response.headers.multi_items()
+                    if k.lower() in _KEEP_RESPONSE_HEADERS
+                ]
+                try:
+                    entry["text"] = response.content.decode("utf-8")
+                except UnicodeDecodeError:
+                    entry["content"] = base64.b64encode(response.content).decode("ascii")
+            with self._lock:
+                self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self.count += 1
+
+        return after
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+        logger.info(f"カセットを記録: {self.path} ({self.count}件)")
+
+
+class CassettePlayer:
+    """記録したレスポンスを返すトランスポートのバックエンド"""
+
+    def __init__(self, path: Path, speed: float = 1.0):
+        self.path = path
+        self.speed = speed
+        self._exact: dict[tuple, deque] = defaultdict(deque)
+        self._coarse: dict[tuple, deque] = defaultdict(deque)
+        self._lock = threading.Lock()
+        self.served = 0
+        self.missed = 0
+
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                self._exact[(entry["method"], entry["url"], entry["body"])].append(entry)
+                self._coarse[_coarse_key(entry["method"], entry["url"], entry["body"])].append(entry)
+
+    def _take(self, request: httpx.Request) -> dict:
+        method, url, body = request.method, _scrub_url(str(request.url)), _scrub_body(request)
+        with self._lock:
+            for queue in (self._exact.get((method, url, body)), self._coarse.get(_coarse_key(method, url, body))):
+                while queue:
+                    entry = queue.popleft()
+                    if not entry.get("_used"):
+                        entry["_used"] = True
+                        self.served += 1
+                        return entry
+            self.missed += 1
+        raise httpx.ConnectError(f"カセットに記録がありません: {method} {url}", request=request)
+
+    def _response(self, entry: dict, request: httpx.Request) -> httpx.Response:
+        if "error" in entry:
+            raise httpx.ConnectError(f"記録時のエラー: {entry['error']}", request=request)
+        return httpx.Response(
+            entry["status"],
+            headers=entry["headers"],
+            content=entry["text"].encode("utf-8") if "text" in entry else base64.b64decode(entry["content"]),
+            request=request,
+        )
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        entry = self._take(request)
+        if self.speed:
+            time.sleep(entry["elapsed"] * self.speed)
+        return self._response(entry, request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        entry = self._take(request)
+        if self.speed:
+            await asyncio.sleep(entry["elapsed"] * self.speed)
+        return self._response(entry, request)
+
+    def close(self) -> None:
+        logger.info(f"カセットを再生: {self.path} (応答 {self.served}件, 未記録 {self.missed}件)")
+
+
+def start_recording(path: Path) -> CassetteRecorder:
+    recorder = CassetteRecorder(path)
+    get_transport().add_hook(recorder)
+    return recorder
+
+
+def start_replay(path: Path, speed: float = 1.0) -> CassettePlayer:
+    player = CassettePlayer(path, speed=speed)
+    get_transport().set_backend(player)
+    return player
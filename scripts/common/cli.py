@@ -0,0 +1,102 @@
+"""
+全スクリプト共通のコマンドライン引数
+"""
+
+import argparse
+import atexit
+import logging
+import os
+import sys
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def add_common_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("共通オプション")
+    cassette = group.add_mutually_exclusive_group()
+    cassette.add_argument("--record", type=Path, metavar="CASSETTE", help="全HTTP通信をカセット（.jsonl.gz）に記録")
+    cassette.add_argument("--replay", type=Path, metavar="CASSETTE", help="記録したカセットを再生（ネットワークに接続しない）")
+    cassette.add_argument(
+        "--synthetic",
+        type=Path,
+        metavar="SITE",
+        help="合成サイト（scripts/bench/synthetic_site.py generate）を相手に実行（ネットワークに接続しない）",
+    )
+    group.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1.0,
+        help="再生時の応答時間の倍率（0で待たない、既定: 記録時と同じ）",
+    )
+    group.add_argument(
+        "--synthetic-latency",
+        type=float,
+        default=0.0,
+        help="合成サイトの1リクエストあたりの応答時間（秒）",
+    )
+    group.add_argument(
+        "--profile",
+        nargs="?",
+        const="full",
+        choices=["full", "wall"],
+        help="フェーズごとの経過時間・フレームグラフ用のスタック・CPU・メモリを計測し .state/profile/ に書き出す"
+        "（wall: CPU・メモリを計測せず、ほぼ通常の速度で経過時間だけを見る）",
+    )
+
+
+def apply_common_arguments(args: argparse.Namespace) -> None:
+    """共通オプションを有効にする（parse_args直後に呼ぶ）"""
+    if args.record or args.replay or args.synthetic:
+        # 実行ごとに通信の流れが変わらないよう、記録・再生・合成サイトではセッション・ページIDのキャッシュを使わない
+        os.environ["SCP_JP_SESSION_CACHE"] = "0"
+        os.environ["SCP_JP_PAGE_ID_CACHE"] = "0"
+
+    if args.record:
+        from .cassette import start_recording
+
+        recorder = start_recording(args.record)
+        atexit.register(recorder.close)
+        logger.info(f"記録モード: {args.record}")
+
+    if args.replay:
+        from .cassette import start_replay
+
+        player = start_replay(args.replay, speed=args.replay_speed)
+        atexit.register(player.close)
+        logger.info(f"再生モード: {args.replay} (速度 x{args.replay_speed:g})")
+
+    if args.synthetic:
+        from .synthetic import start_synthetic
+
+        server = start_synthetic(args.synthetic, latency=args.synthetic_latency)
+        atexit.register(server.close)
+        logger.info(f"合成サイト: {args.synthetic} (応答時間 {args.synthetic_latency:g}秒)")
+
+    from .search import enable_search_cache
+
+    # 同じ実行の中で重なる検索は取得済みの結果から返す
+    search_cache = enable_search_cache()
+    atexit.register(lambda: search_cache.hits and logger.info(f"検索キャッシュ: {search_cache.hits}件の検索を再利用"))
+
+    if args.profile:
+        from .profiling import start_profiling
+
+        profiler = start_profiling(Path(sys.argv[0]).stem, mode=args.profile)
+        atexit.register(profiler.stop)
+
+
+def load_env() -> None:
+    """
+    スクリプトのディレクトリから上にたどって見つかった .env を環境変数に読み込む
+
+    GitHub Actionsなど .env を置かない環境ではpython-dotenvを読み込まずに済ませる。
+    """
+    script_dir = Path(sys.argv[0]).resolve().parent
+    for directory in (script_dir, *script_dir.parents):
+        if (directory / ".env").is_file():
+            from dotenv import load_dotenv
+
+            load_dotenv(directory / ".env")
+            return
+
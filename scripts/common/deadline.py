@@ -0,0 +1,112 @@
+"""
+時間予算つきの実行
+
+定期実行には時間制限があり、大量の未処理があると途中で打ち切られて通知も送られない。
+Deadline は処理速度を測りながら、次の1件を終える前に予算（後処理の分を残す）を使い切りそうなら
+そこで止める。止めた残りは Backlog（.state/backlog/<job>.json）に保存し、次回の実行で優先して処理する。
+1回の実行で複数のタスクを処理するときは、share で各タスクが使える時間を残りの予算の一部に限る。
+"""
+
+import json
+import logging
+import time
+
+from .paths import state_path
+
+logger = logging.getLogger(__name__)
+
+# 事後検証・フォーラム投稿・Discord通知のために残しておく時間（秒）
+RESERVE = 60.0
+# 1件あたりの所要時間の見積もりに掛ける余裕
+SAFETY = 2.0
+
+
+class Deadline:
+    """開始からseconds秒の時間予算（Noneなら制限なし）"""
+
+    def __init__(self, seconds: float | None, reserve: float = RESERVE):
+        self.seconds = seconds
+        self.reserve = reserve
+        self.started = time.monotonic()
+        self.done = 0
+        self.deferred = 0
+        self._busy = 0.0
+        self._item_started: float | None = None
+        self._share_until: float | None = None
+        self._share_deferred = False
+
+    def remaining(self) -> float:
+        if self.seconds is None:
+            return float("inf")
+        return self.seconds - (time.monotonic() - self.started)
+
+    def share(self, fraction: float) -> None:
+        """以降の処理（次のshareまで）に使える時間を、残りの予算（後処理の分を除く）のfractionまでにする"""
+        if self.seconds is None:
+            return
+        self._share_until = time.monotonic() + max(self.remaining() - self.reserve, 0.0) * fraction
+        self._share_deferred = False
+
+    def _available(self) -> float:
+        available = self.remaining() - self.reserve
+        if self._share_until is not None:
+            available = min(available, self._share_until - time.monotonic())
+        return available
+
+    def per_item(self) -> float:
+        """これまでの1件あたりの所要時間（まだ1件も終えていなければ0）"""
+        return self._busy / self.done if self.done else 0.0
+
+    def allows(self) -> bool:
+        """次の1件を始めてよいか（始めてよければ計測を始める）"""
+        if self._available() < self.per_item() * SAFETY:
+            if not self._share_deferred:
+                logger.warning(f"時間予算の残りが少ないため、以降の処理を次回に持ち越します（{self.describe()}）")
+                self._share_deferred = True
+            self.deferred += 1
+            return False
+        self._item_started = time.monotonic()
+        return True
+
+    def finish(self) -> None:
+        """allowsで始めた1件を終えたことを記録する"""
+        if self._item_started is not None:
+            self._busy += time.monotonic() - self._item_started
+            self._item_started = None
+            self.done += 1
+
+    def describe(self) -> str:
+        rate = f"{1 / self.per_item():.1f}件/秒" if self.per_item() else "-"
+        remaining = f", 残り {self.remaining():.0f}秒" if self.seconds is not None else ""
+        return f"処理 {self.done}件 ({rate}){remaining}"
+
+    def discord_field(self, carried_over: int) -> dict:
+        """Discord embed用のフィールド"""
+        value = f"{self.describe()}\n持ち越し: {self.deferred}件"
+        if carried_over:
+            value += f"\n前回からの持ち越し: {carried_over}件"
+        return {"name": "時間予算", "value": value, "inline": False}
+
+
+class Backlog:
+    """前回の実行で時間予算により持ち越したページ"""
+
+    def __init__(self, job: str):
+        self.path = state_path("backlog", f"{job}.json")
+        self.pages: set[str] = set()
+        if self.path.exists():
+            self.pages = set(json.loads(self.path.read_text(encoding="utf-8")))
+
+    def __contains__(self, fullname: str) -> bool:
+        return fullname in self.pages
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def save(self, deferred: list[str]) -> None:
+        """今回持ち越したページで置き換える（なければ削除する）"""
+        if not deferred:
+            self.path.unlink(missing_ok=True)
+            return
+        logger.info(f"持ち越し {len(deferred)}件を保存: {self.path}")
+        self.path.write_text(json.dumps(sorted(deferred), ensure_ascii=False), encoding="utf-8")
@@ -0,0 +1,46 @@
+"""
+Discord webhook通知
+
+Wikidotと同じ共有接続プール（common.transport）を使って送信する。
+"""
+
+import logging
+from datetime import datetime, UTC
+
+import httpx
+
+from .transport import http_client
+
+logger = logging.getLogger(__name__)
+
+# Discord embed colors
+COLOR_SUCCESS = 0x00FF00
+COLOR_WARNING = 0xFFFF00
+COLOR_ERROR = 0xFF0000
+
+
+def send_discord_notification(
+    webhook_url: str,
+    title: str,
+    description: str,
+    fields: list[dict] | None = None,
+    color: int = COLOR_SUCCESS,
+) -> bool:
+    """Discord webhookにembed形式で通知を送信"""
+    embed = {
+        "title": title,
+        "description": description,
+        "color": color,
+        "timestamp": datetime.now(UTC).isoformat(),
+        "footer": {"text": "SCP-JP Scripts"},
+    }
+    if fields:
+        embed["fields"] = fields
+
+    try:
+        with http_client(timeout=10) as client:
+            response = client.post(webhook_url, json={"embeds": [embed]})
+        return 200 <= response.status_code < 300
+    except httpx.HTTPError as e:
+        logger.exception(f"Error sending Discord notification: {e}")
+        return False
@@ -0,0 +1,366 @@
+"""
+ページ単位のタスクを永続化するジョブキュー
+
+大量のページ操作（コンテストのリネーム、タグの一括操作、剪定）をページごとのタスクとして
+.state/jobqueue.sqlite3 に登録し、複数のワーカープロセス（tool/job_worker.py）がリースして実行する。
+リースには期限（visibility timeout）があり、ワーカーが異常終了しても期限が切れれば別のワーカーが取り直す。
+同じホストのワーカーがプロセスごと終了していれば、期限を待たずに取り直す。
+同じジョブ・同じキーのタスクは二重に登録されないため、中断した実行は同じ引数で再実行すれば続きから進む。
+
+タスクは1ページに対する「タグの保存 → リネーム → 編集」の組（page_task）で、
+ワーカーはリースしたタスクをまとめて検索・タグ保存・編集し、失敗時は反映済みかを確かめてから再試行する。
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from . import metrics
+from .page_edit import PageEdit, edit_pages
+from .page_ids import get_page_ids
+from .paths import REPO_ROOT, state_path
+from .retry import commit_tags, rename
+from .search import search_many
+from .tag_ops import save_tags_bulk
+
+logger = logging.getLogger(__name__)
+
+# 1回にリースするタスク数と、その処理に許す時間（秒）
+LEASE_SIZE = 50
+VISIBILITY_TIMEOUT = 300.0
+# リース期限切れ（ワーカーの異常終了）がこの回数に達したタスクは失敗とする
+MAX_ATTEMPTS = 3
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+WORKER_SCRIPT = REPO_ROOT / "scripts" / "tool" / "job_worker.py"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    job TEXT NOT NULL,
+    site TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL NOT NULL DEFAULT 0,
+    worker TEXT,
+    error TEXT,
+    UNIQUE (job, key)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (job, status, lease_until);
+"""
+
+
+@dataclass(frozen=True)
+class Task:
+    """キュー上の1ページ分のタスク"""
+
+    id: int
+    job: str
+    site: str
+    key: str
+    payload: dict
+    status: str
+    attempts: int
+    error: str | None
+
+
+def page_task(
+    tags: list[str] | None = None,
+    rename_to: str | None = None,
+    edit: dict | None = None,
+    info: dict | None = None,
+) -> dict:
+    """
+    1ページに対する操作のペイロード
+
+    tags: 保存するタグ列、rename_to: リネーム先、edit: {"title", "source", "comment"}（Noneの項目は変更しない）。
+    infoは実行には使わず、結果の報告に使う任意の値。
+    """
+    return {"tags": tags, "rename_to": rename_to, "edit": edit, "info": info or {}}
+
+
+def _holder() -> str:
+    """リースの保持者（同じホストでプロセスの生存を確かめられるよう、ホスト名とPIDを含める）"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _holder_alive(holder: str | None) -> bool:
+    host, _, pid = (holder or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        # 別のホストのワーカーは期限まで待つ
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """SQLiteによるリース付きのタスクキュー（プロセス間で共有する）"""
+
+    def __init__(self, path: Path | None = None):
+        self.path = path or state_path("jobqueue.sqlite3")
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "JobQueue":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _transaction(self):
+        # リースは読んでから書くため、最初から書き込みロックを取る
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def enqueue(self, job: str, site: str, tasks: list[tuple[str, dict]]) -> int:
+        """(キー, ペイロード) のタスクを登録する（登録済みのキーは無視）。新たに登録した件数を返す"""
+        conn = self._transaction()
+        try:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (job, site, key, payload) VALUES (?, ?, ?, ?)",
+                [(job, site, key, json.dumps(payload, ensure_ascii=False)) for key, payload in tasks],
+            )
+            added = conn.total_changes - before
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        logger.info(f"ジョブ {job}: {added}件を登録（登録済み {len(tasks) - added}件）")
+        return added
+
+    def lease(self, job: str, limit: int = LEASE_SIZE, visibility: float = VISIBILITY_TIMEOUT) -> list[Task]:
+        """未処理・リース期限切れのタスクを最大limit件リースする"""
+        now = time.time()
+        conn = self._transaction()
+        try:
+            holders = conn.execute(
+                "SELECT DISTINCT worker FROM tasks WHERE job = ? AND status = ? AND lease_until >= ?",
+                (job, LEASED, now),
+            ).fetchall()
+            for (holder,) in holders:
+                if not _holder_alive(holder):
+                    logger.warning(f"ジョブ {job}: 終了したワーカー {holder} のリースを取り直します")
+                    conn.execute(
+                        "UPDATE tasks SET lease_until = 0 WHERE job = ? AND status = ? AND worker = ?",
+                        (job, LEASED, holder),
+                    )
+            conn.execute(
+                "UPDATE tasks SET status = ?, error = 'リース期限切れの回数が上限に達しました'"
+                " WHERE job = ? AND status = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, job, LEASED, now, MAX_ATTEMPTS),
+            )
+            rows = conn.execute(
+                "SELECT id FROM tasks WHERE job = ? AND (status = ? OR (status = ? AND lease_until < ?))"
+                " ORDER BY id LIMIT ?",
+                (job, PENDING, LEASED, now, limit),
+            ).fetchall()
+            ids = [row[0] for row in rows]
+            conn.executemany(
+                "UPDATE tasks SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                [(LEASED, _holder(), now + visibility, task_id) for task_id in ids],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self._tasks("id IN ({})".format(",".join("?" * len(ids))), ids) if ids else []
+
+    def ack(self, task: Task) -> None:
+        """実行が終わったタスクを完了にする"""
+        with self.conn:
+            self.conn.execute("UPDATE tasks SET status = ?, error = NULL WHERE id = ?", (DONE, task.id))
+
+    def fail(self, task: Task, error: Exception) -> None:
+        """実行に失敗したタスクを失敗にする（書き込みの再試行は実行時に済んでいる）"""
+        with self.conn:
+            self.conn.execute("UPDATE tasks SET status = ?, error = ? WHERE id = ?", (FAILED, str(error), task.id))
+
+    def retry_failed(self, job: str) -> int:
+        """失敗したタスクを未処理に戻す"""
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE tasks SET status = ?, attempts = 0, error = NULL WHERE job = ? AND status = ?",
+                (PENDING, job, FAILED),
+            )
+        return cursor.rowcount
+
+    def counts(self, job: str) -> dict[str, int]:
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM tasks WHERE job = ? GROUP BY status", (job,))
+        return {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0, **dict(rows.fetchall())}
+
+    def jobs(self) -> list[str]:
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT job FROM tasks ORDER BY job")]
+
+    def results(self, job: str) -> list[Task]:
+        return self._tasks("job = ?", [job])
+
+    def delete(self, job: str) -> None:
+        """ジョブのタスクを削除する（正常に終わったジョブを次回の実行に持ち越さない）"""
+        with self.conn:
+            self.conn.execute("DELETE FROM tasks WHERE job = ?", (job,))
+
+    def _tasks(self, where: str, params: list) -> list[Task]:
+        rows = self.conn.execute(
+            f"SELECT id, job, site, key, payload, status, attempts, error FROM tasks WHERE {where} ORDER BY id",
+            params,
+        )
+        return [
+            Task(id, job, site, key, json.loads(payload), status, attempts, error)
+            for id, job, site, key, payload, status, attempts, error in rows
+        ]
+
+
+# ----------
+# タスクの実行
+# ----------
+
+
+def _find_pages(site, tasks: list[Task]) -> list:
+    """タスクのページを取得する（リネーム済みで旧名がなければリネーム先を返す）"""
+    found = search_many(site, [{"fullname": task.key} for task in tasks], fields=("tags", "title"))
+    pages = [result[0] if len(result) else None for result in found]
+
+    missing = [i for i, page in enumerate(pages) if page is None and tasks[i].payload.get("rename_to")]
+    if missing:
+        renamed = search_many(
+            site, [{"fullname": tasks[i].payload["rename_to"]} for i in missing], fields=("tags", "title")
+        )
+        for i, result in zip(missing, renamed):
+            pages[i] = result[0] if len(result) else None
+    return pages
+
+
+def execute_tasks(site, tasks: list[Task]) -> list[Exception | None]:
+    """
+    同じサイトのタスクをまとめて実行する
+
+    タグ保存・編集はそれぞれまとめて送る。途中まで反映済みのタスク（前回のワーカーの異常終了など）は
+    反映済みの操作を飛ばして続きから実行する。戻り値は tasks と同順の、成功ならNone・失敗なら例外のリスト。
+    """
+    results: list[Exception | None] = [None] * len(tasks)
+    pages = _find_pages(site, tasks)
+    for i, page in enumerate(pages):
+        if page is None:
+            results[i] = LookupError(f"ページが見つかりません: {tasks[i].key}")
+
+    def pending(step: str) -> list[int]:
+        return [i for i, task in enumerate(tasks) if results[i] is None and task.payload.get(step) is not None]
+
+    # タグ: まとめて保存し、失敗したページだけ確認付きで保存し直す
+    tag_changes = [i for i in pending("tags") if pages[i].tags != tasks[i].payload["tags"]]
+    errors = save_tags_bulk(site, [(pages[i], list(tasks[i].payload["tags"])) for i in tag_changes])
+    for i, error in zip(tag_changes, errors):
+        if error is None:
+            continue
+        pages[i].tags = list(tasks[i].payload["tags"])
+        try:
+            commit_tags(pages[i])
+        except Exception as e:
+            results[i] = e
+
+    for i in pending("rename_to"):
+        if pages[i].fullname == tasks[i].payload["rename_to"]:
+            continue
+        try:
+            rename(pages[i], tasks[i].payload["rename_to"])
+            metrics.count("pages_mutated")
+        except Exception as e:
+            results[i] = e
+
+    edits = pending("edit")
+    if edits:
+        try:
+            get_page_ids(site, [pages[i] for i in edits])
+        except Exception as e:
+            for i in edits:
+                results[i] = e
+            edits = []
+        page_edits = [
+            PageEdit(
+                pages[i],
+                title=tasks[i].payload["edit"].get("title") or pages[i].title,
+                source=tasks[i].payload["edit"]["source"],
+                comment=tasks[i].payload["edit"].get("comment", ""),
+            )
+            for i in edits
+        ]
+        for i, error in zip(edits, edit_pages(site, page_edits)):
+            results[i] = error
+    return results
+
+
+def work(
+    client,
+    queue: JobQueue,
+    job: str,
+    worker: str,
+    lease_size: int = LEASE_SIZE,
+    visibility: float = VISIBILITY_TIMEOUT,
+) -> dict[str, int]:
+    """ジョブのタスクがなくなるまでリース → 実行 → 完了/失敗 を繰り返す（workerはログ用の名前）"""
+    done = failed = 0
+    sites = {}
+    while tasks := queue.lease(job, lease_size, visibility):
+        by_site: dict[str, list[Task]] = {}
+        for task in tasks:
+            by_site.setdefault(task.site, []).append(task)
+        for site_name, site_tasks in by_site.items():
+            if site_name not in sites:
+                sites[site_name] = client.site.get(site_name)
+            try:
+                errors = execute_tasks(sites[site_name], site_tasks)
+            except Exception as e:
+                logger.exception(f"[{worker}] タスクの実行に失敗: {e}")
+                errors = [e] * len(site_tasks)
+            for task, error in zip(site_tasks, errors):
+                if error is None:
+                    queue.ack(task)
+                    done += 1
+                else:
+                    logger.error(f"[{worker}] {task.key}: {error}")
+                    queue.fail(task, error)
+                    failed += 1
+        logger.info(f"[{worker}] 完了 {done}件, 失敗 {failed}件")
+    return {"done": done, "failed": failed}
+
+
+def run_workers(job: str, processes: int, worker_args: list[str] | None = None) -> None:
+    """
+    ジョブを processes 個のワーカープロセス（tool/job_worker.py）で実行し、全員の終了を待つ
+
+    worker_argsは各ワーカーにそのまま渡す引数（--lease-size など）。
+    """
+    logger.info(f"ジョブ {job}: ワーカー{processes}プロセスで実行します")
+    command = [sys.executable, str(WORKER_SCRIPT), "--job", job, *(worker_args or [])]
+    workers = [subprocess.Popen([*command, "--name", f"w{i}"], env=os.environ.copy()) for i in range(processes)]
+    try:
+        codes = [worker.wait() for worker in workers]
+    except BaseException:
+        for worker in workers:
+            worker.terminate()
+        raise
+    if any(codes):
+        logger.warning(f"ジョブ {job}: 異常終了したワーカーがあります（終了コード {codes}）")
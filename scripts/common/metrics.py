@@ -0,0 +1,204 @@
+"""
+実行単位のメトリクス
+
+フェーズごとの所要時間・リクエスト数・送受信バイト数・再試行の対象になった失敗応答・
+スキャン/変更したページ数を集計し、.state/metrics/ に以下を書き出す:
+  - <job>.json          : 今回の実行の集計
+  - <job>.prom          : 同じ内容のOpenMetrics形式
+  - <job>.history.json  : 直近の実行の集計（回帰検出の基準）
+
+所要時間またはリクエスト数が直近の中央値の REGRESSION_RATIO 倍を超えた実行は回帰として報告する。
+"""
+
+import json
+import logging
+import statistics
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, UTC
+from pathlib import Path
+
+from .paths import state_path
+from .transport import get_transport
+
+logger = logging.getLogger(__name__)
+
+HISTORY_SIZE = 30
+BASELINE_RUNS = 7
+MIN_BASELINE_RUNS = 3
+REGRESSION_RATIO = 1.5
+
+_current: "RunMetrics | None" = None
+
+
+def count(name: str, n: int = 1) -> None:
+    """実行中のメトリクスにカウンタを加算（計測していなければ何もしない）"""
+    if _current is not None:
+        _current.count(name, n)
+
+
+def current_phase() -> str | None:
+    """実行中のメトリクスの現在のフェーズ（計測していなければNone）"""
+    return _current._phase if _current is not None else None
+
+
+class RunMetrics:
+    """1回の実行のメトリクス（with文で計測期間を囲む）"""
+
+    def __init__(self, job: str, dry_run: bool = False, root: Path | None = None):
+        self.job = job
+        self.dry_run = dry_run
+        self.root = root or state_path("metrics", f"{job}.json").parent
+        self.started_at = datetime.now(UTC)
+        self.duration = 0.0
+        self.phases: dict[str, float] = defaultdict(float)
+        self.requests: dict[str, int] = defaultdict(int)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+        self.counters: dict[str, int] = defaultdict(int)
+        self.regressions: list[str] = []
+        self._phase = "setup"
+        self._phase_start = 0.0
+        self._lock = threading.Lock()
+        self._start = 0.0
+
+    # ----------
+    # 計測
+    # ----------
+
+    def __enter__(self) -> "RunMetrics":
+        global _current
+        _current = self
+        self._start = self._phase_start = time.perf_counter()
+        get_transport().add_hook(self._on_request)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        global _current
+        get_transport().remove_hook(self._on_request)
+        _current = None
+        self.start_phase(self._phase)
+        self.duration = time.perf_counter() - self._start
+        self.finish()
+
+    def start_phase(self, name: str) -> None:
+        """現在のフェーズを終えて次のフェーズの計測を始める"""
+        now = time.perf_counter()
+        self.phases[self._phase] += now - self._phase_start
+        self._phase, self._phase_start = name, now
+
+    @contextmanager
+    def phase(self, name: str):
+        previous = self._phase
+        self.start_phase(name)
+        try:
+            yield
+        finally:
+            self.start_phase(previous)
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def _on_request(self, request):
+        phase = self._phase
+        with self._lock:
+            self.requests[phase] += 1
+            self.bytes_sent += len(request.content)
+
+        def after(response, error):
+            with self._lock:
+                if response is not None:
+                    self.bytes_received += len(response.content)
+                # wikidot.py はHTTPエラー・例外・try_again応答を再試行する
+                if error is not None or response.status_code >= 400 or b'"try_again"' in response.content:
+                    self.retries += 1
+
+        return after
+
+    # ----------
+    # 集計・出力
+    # ----------
+
+    @property
+    def total_requests(self) -> int:
+        return sum(self.requests.values())
+
+    def as_dict(self) -> dict:
+        return {
+            "job": self.job,
+            "dry_run": self.dry_run,
+            "started_at": self.started_at.isoformat(),
+            "duration": round(self.duration, 3),
+            "phases": {k: round(v, 3) for k, v in self.phases.items()},
+            "requests": self.total_requests,
+            "requests_by_phase": dict(self.requests),
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "retries": self.retries,
+            "counters": dict(self.counters),
+        }
+
+    def openmetrics(self) -> str:
+        job = self.job
+        lines = [
+            "# TYPE scp_jp_run_duration_seconds gauge",
+            f'scp_jp_run_duration_seconds{{job="{job}"}} {self.duration:.3f}',
+            "# TYPE scp_jp_phase_duration_seconds gauge",
+            *(f'scp_jp_phase_duration_seconds{{job="{job}",phase="{k}"}} {v:.3f}' for k, v in self.phases.items()),
+            "# TYPE scp_jp_requests counter",
+            *(f'scp_jp_requests_total{{job="{job}",phase="{k}"}} {v}' for k, v in self.requests.items()),
+            "# TYPE scp_jp_bytes counter",
+            f'scp_jp_bytes_total{{job="{job}",direction="sent"}} {self.bytes_sent}',
+            f'scp_jp_bytes_total{{job="{job}",direction="received"}} {self.bytes_received}',
+            "# TYPE scp_jp_retries counter",
+            f'scp_jp_retries_total{{job="{job}"}} {self.retries}',
+        ]
+        for name, value in self.counters.items():
+            lines += [f"# TYPE scp_jp_{name} counter", f'scp_jp_{name}_total{{job="{job}"}} {value}']
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def _detect_regressions(self, history: list[dict]) -> list[str]:
+        baseline = [h for h in history if h.get("dry_run") == self.dry_run][-BASELINE_RUNS:]
+        if len(baseline) < MIN_BASELINE_RUNS:
+            return []
+        regressions = []
+        for key, label, current in (
+            ("duration", "所要時間", self.duration),
+            ("requests", "リクエスト数", self.total_requests),
+        ):
+            median = statistics.median(h[key] for h in baseline)
+            if median > 0 and current > median * REGRESSION_RATIO:
+                regressions.append(f"{label}: {current:.4g} (中央値 {median:.4g} の {current / median:.1f}倍)")
+        return regressions
+
+    def finish(self) -> None:
+        history_path = self.root / f"{self.job}.history.json"
+        history = json.loads(history_path.read_text(encoding="utf-8")) if history_path.exists() else []
+        self.regressions = self._detect_regressions(history)
+        for regression in self.regressions:
+            logger.warning(f"性能の回帰: {regression}")
+
+        summary = self.as_dict()
+        (self.root / f"{self.job}.json").write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+        (self.root / f"{self.job}.prom").write_text(self.openmetrics(), encoding="utf-8")
+        history = (history + [summary])[-HISTORY_SIZE:]
+        history_path.write_text(json.dumps(history, ensure_ascii=False), encoding="utf-8")
+
+        logger.info(
+            f"メトリクス: {self.duration:.1f}秒, リクエスト {self.total_requests}件, "
+            f"受信 {self.bytes_received / 1024:.0f} KiB, 再試行 {self.retries}件"
+        )
+
+    def discord_field(self) -> dict:
+        """Discord embed用のフィールド（回帰があれば警告として表示）"""
+        value = f"所要時間: {self.duration:.1f}秒\nリクエスト: {self.total_requests}件"
+        if self.retries:
+            value += f"\n再試行: {self.retries}件"
+        if self.regressions:
+            value = "⚠ 直近の実行より遅くなっています\n" + "\n".join(self.regressions) + "\n" + value
+        return {"name": "実行メトリクス", "value": value, "inline": False}
@@ -0,0 +1,123 @@
+"""
+ページ編集のパイプライン
+
+page.edit は1ページごとに ロック取得 → 保存 → 保存後のページ検索 を順に往復する。
+edit_pages はロック取得と保存を段に分け、1回のamc_requestで「前の往復でロックを取ったページの保存」と
+「次のページのロック取得」をまとめて送る。N ページの編集はおよそ N / batch_size + 1 往復で終わる。
+同時に保持するロックは最大 2 × batch_size で、保存できなかったページのロックは必ず解放する。
+"""
+
+import logging
+from dataclasses import dataclass
+
+from wikidot.common import exceptions
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10
+
+
+@dataclass
+class PageEdit:
+    """1ページ分の編集内容（pageはidを取得済みであること）"""
+
+    page: "object"
+    title: str
+    source: str
+    comment: str = ""
+
+
+def _lock_body(edit: PageEdit, force_lock: bool) -> dict:
+    body = {"mode": "page", "wiki_page": edit.page.fullname, "moduleName": "edit/PageEditModule"}
+    if force_lock:
+        body["force_lock"] = "yes"
+    return body
+
+
+def _save_body(edit: PageEdit, lock: dict) -> dict:
+    return {
+        "action": "WikiPageAction",
+        "event": "savePage",
+        "moduleName": "Empty",
+        "mode": "page",
+        "lock_id": lock["lock_id"],
+        "lock_secret": lock["lock_secret"],
+        "revision_id": lock.get("page_revision_id", ""),
+        "wiki_page": edit.page.fullname,
+        "page_id": edit.page.id,
+        "title": edit.title,
+        "source": edit.source,
+        "comments": edit.comment,
+    }
+
+
+def _release_body(edit: PageEdit, lock: dict) -> dict:
+    return {
+        "action": "WikiPageAction",
+        "event": "removePageEditLock",
+        "moduleName": "Empty",
+        "lock_id": lock["lock_id"],
+        "lock_secret": lock["lock_secret"],
+        "page_id": edit.page.id,
+        "leave_draft": "no",
+    }
+
+
+def edit_pages(
+    site, edits: list[PageEdit], force_lock: bool = True, batch_size: int = BATCH_SIZE
+) -> list[Exception | None]:
+    """
+    複数ページを編集する
+
+    戻り値は edits と同順の、成功ならNone・失敗なら例外のリスト。
+    """
+    results: list[Exception | None] = [None] * len(edits)
+    batches = [range(i, min(i + batch_size, len(edits))) for i in range(0, len(edits), batch_size)]
+    locks: dict[int, dict] = {}
+    releases: list[dict] = []
+
+    try:
+        for round_no in range(len(batches) + 1):
+            saving = [i for i in batches[round_no - 1] if i in locks] if round_no else []
+            locking = list(batches[round_no]) if round_no < len(batches) else []
+            bodies = [_save_body(edits[i], locks[i]) for i in saving]
+            bodies += [_lock_body(edits[i], force_lock) for i in locking]
+            if not bodies:
+                continue
+            # 前の往復で保存に失敗したロックの解放も同じ往復で送る
+            responses = site.amc_request(bodies + releases, return_exceptions=True)
+            releases = []
+
+            for i, response in zip(saving, responses):
+                lock = locks.pop(i)
+                if isinstance(response, Exception):
+                    results[i] = response
+                    releases.append(_release_body(edits[i], lock))
+                else:
+                    metrics.count("pages_mutated")
+
+            for i, response in zip(locking, responses[len(saving) :]):
+                if isinstance(response, Exception):
+                    results[i] = response
+                    continue
+                data = response.json()
+                if data.get("locked") or data.get("other_locks"):
+                    message = f"Page {edits[i].page.fullname} is locked or other locks exist"
+                    results[i] = exceptions.TargetErrorException(message)
+                    if "lock_id" in data:
+                        releases.append(_release_body(edits[i], data))
+                    continue
+                locks[i] = data
+    finally:
+        # 中断された場合も取得済みのロックは解放する
+        releases += [_release_body(edits[i], lock) for i, lock in locks.items()]
+        for i in locks:
+            if results[i] is None:
+                results[i] = RuntimeError("編集が中断されました")
+        if releases:
+            for response in site.amc_request(releases, return_exceptions=True):
+                if isinstance(response, Exception):
+                    logger.warning(f"編集ロックの解放に失敗: {response}")
+    return results
@@ -0,0 +1,147 @@
+"""
+ページIDの永続キャッシュ
+
+(サイト, fullname) → ページID を .state/page_ids.sqlite3 に保存し、全スクリプトで共有する。
+PageCollection.get_page_ids はページごとに1回のGETでIDを取得するが、ページIDはページが存在する限り
+変わらないため、get_page_ids はキャッシュにないページだけを取得する。
+
+スクリプトが行ったリネームは retry.rename から反映する。スクリプトの外での変更に備え、
+プロセスごとにサイトごとの最初の参照で最近の更新をチェックポイント以降だけ読み、
+新規作成・リネームのあったfullnameの登録を捨てる（遡り切れなければそのサイトの登録をすべて捨てる）。
+"""
+
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from . import metrics
+from .paths import state_path
+from .recent_changes import FLAG_NEW, FLAG_RENAMED, ChangeFeed
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS page_ids (
+    site TEXT NOT NULL,
+    fullname TEXT NOT NULL,
+    page_id INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (site, fullname)
+);
+CREATE INDEX IF NOT EXISTS page_ids_page_id ON page_ids (site, page_id);
+"""
+
+# SQLiteの1文あたりのパラメータ数に収まるよう分けて引く
+LOOKUP_CHUNK_SIZE = 500
+
+# このプロセスで最近の更新を反映済みのサイト
+_synced: set[str] = set()
+
+
+def page_id_cache_enabled() -> bool:
+    """キャッシュを使うか（SCP_JP_PAGE_ID_CACHE=0 で無効）"""
+    return os.environ.get("SCP_JP_PAGE_ID_CACHE", "1") != "0"
+
+
+class PageIdCache:
+    """SQLiteによるページIDのキャッシュ（プロセス間で共有する）"""
+
+    def __init__(self, path: Path | None = None):
+        self.path = path or state_path("page_ids.sqlite3")
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "PageIdCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def get(self, site: str, fullnames: list[str]) -> dict[str, int]:
+        found = {}
+        for i in range(0, len(fullnames), LOOKUP_CHUNK_SIZE):
+            chunk = fullnames[i : i + LOOKUP_CHUNK_SIZE]
+            rows = self.conn.execute(
+                f"SELECT fullname, page_id FROM page_ids WHERE site = ? AND fullname IN ({','.join('?' * len(chunk))})",
+                (site, *chunk),
+            )
+            found.update(rows)
+        return found
+
+    def put(self, site: str, ids: dict[str, int]) -> None:
+        """登録する（同じIDを別のfullnameで登録していれば、リネーム済みとして捨てる）"""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        for fullname, page_id in ids.items():
+            self.conn.execute(
+                "DELETE FROM page_ids WHERE site = ? AND page_id = ? AND fullname != ?", (site, page_id, fullname)
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO page_ids (site, fullname, page_id, updated_at) VALUES (?, ?, ?, ?)",
+                (site, fullname, page_id, now),
+            )
+        self.conn.execute("COMMIT")
+
+    def clear(self, site: str) -> None:
+        self.conn.execute("DELETE FROM page_ids WHERE site = ?", (site,))
+
+    def sync(self, site) -> None:
+        """最近の更新のうち、登録より後に新規作成・リネームされたfullnameの登録を捨てる"""
+        feed = ChangeFeed(site.unix_name, path=state_path("page_ids", f"{site.unix_name}.changes.json"))
+        batch = feed.poll(site)
+        if not batch.complete:
+            self.clear(site.unix_name)
+            logger.info(f"{site.unix_name}: 最近の更新を遡り切れないため、ページIDのキャッシュを破棄しました")
+        else:
+            changes = [c for c in batch.changes if c.flags & {FLAG_NEW, FLAG_RENAMED}]
+            self.conn.executemany(
+                "DELETE FROM page_ids WHERE site = ? AND fullname = ? AND updated_at < ?",
+                [(site.unix_name, c.fullname, c.changed_at) for c in changes],
+            )
+        feed.commit(batch)
+
+
+def get_page_ids(site, pages) -> None:
+    """
+    PageCollection.get_page_ids の代わりに使う
+
+    キャッシュにあるページはIDを設定し、ないページだけを取得してキャッシュに登録する。
+    """
+    from wikidot.module.page import PageCollection
+
+    targets = [page for page in pages if not page.is_id_acquired()]
+    if not targets:
+        return
+    if not page_id_cache_enabled():
+        PageCollection(site, targets).get_page_ids()
+        return
+
+    with PageIdCache() as cache:
+        if site.unix_name not in _synced:
+            cache.sync(site)
+            _synced.add(site.unix_name)
+
+        cached = cache.get(site.unix_name, [page.fullname for page in targets])
+        for page in targets:
+            if page.fullname in cached:
+                page.id = cached[page.fullname]
+        missing = [page for page in targets if not page.is_id_acquired()]
+        metrics.count("page_id_cache_hits", len(targets) - len(missing))
+        if missing:
+            PageCollection(site, missing).get_page_ids()
+            cache.put(site.unix_name, {page.fullname: page.id for page in missing})
+    logger.debug(f"{site.unix_name}: ページID キャッシュ {len(targets) - len(missing)}件, 取得 {len(missing)}件")
+
+
+def record_rename(site_name: str, new_fullname: str, page_id: int) -> None:
+    """スクリプトが行ったリネームをキャッシュに反映する（リネーム元の登録は同じIDとして捨てられる）"""
+    if not page_id_cache_enabled():
+        return
+    with PageIdCache() as cache:
+        cache.put(site_name, {new_fullname: page_id})
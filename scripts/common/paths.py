@@ -0,0 +1,18 @@
+"""
+スクリプト間で共有するローカル状態の保存先
+"""
+
+import os
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+# 実行間で引き継ぐ状態（GitHub Actionsではactions/cacheで復元される）
+STATE_DIR = Path(os.environ.get("SCP_JP_STATE_DIR", REPO_ROOT / ".state"))
+
+
+def state_path(*parts: str) -> Path:
+    """STATE_DIR配下のパスを返す（親ディレクトリは作成済み）"""
+    path = STATE_DIR.joinpath(*parts)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
@@ -0,0 +1,170 @@
+"""
+実行プロファイル（--profile）
+
+1回の実行について以下を .state/profile/<job>-<日時>.* に書き出す:
+  - .prof   : メインスレッドのcProfile（pstats形式、snakeviz等で閲覧）
+  - .folded : 全スレッドのスタックを一定間隔で採取したcollapsed stack形式
+              （先頭はRunMetricsのフェーズ名。flamegraph.pl / speedscope でフレームグラフにできる）
+  - .txt    : フェーズごとの経過時間、CPU時間の上位関数、tracemallocのピーク時の確保元
+
+サンプリングは通信待ちも含む経過時間、cProfileはCPU時間の内訳を見るためのもの。
+cProfileとtracemallocは関数呼び出し・確保のたびにコストがかかり、実行が数倍遅くなる。
+mode="wall" ではサンプリングだけを行う（ほぼ通常の速度で、経過時間の内訳とフレームグラフを得る）。
+"""
+
+import cProfile
+import io
+import logging
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from . import metrics
+from .paths import state_path
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("full", "wall")
+SAMPLE_INTERVAL = 0.005
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 15
+# ピーク時の確保元はこの割合以上増えたときだけ取り直す。スナップショットは重いため、
+# 取得にかかった時間の SNAPSHOT_COST_RATIO 倍は間隔を空ける（計測のための停止を5%以内に抑える）
+SNAPSHOT_GROWTH = 1.25
+SNAPSHOT_COST_RATIO = 20
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # collapsed stack形式の区切り文字を含めない
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})".replace(";", ":")
+
+
+class Profiler:
+    """cProfile・スタックサンプリング・tracemallocをまとめて計測する"""
+
+    def __init__(self, job: str, mode: str = "full", root: Path | None = None, interval: float = SAMPLE_INTERVAL):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"未知のプロファイルモード: {mode}")
+        self.job = job
+        self.full = mode == "full"
+        self.interval = interval
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.prefix = (root or state_path("profile", "x").parent) / f"{job}-{stamp}"
+        self.prefix.parent.mkdir(parents=True, exist_ok=True)
+        self.stacks: Counter[str] = Counter()
+        self.phase_seconds: dict[str, float] = defaultdict(float)
+        self.peak_allocations: list[tracemalloc.Statistic] = []
+        self._profile = cProfile.Profile()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+        self._started = 0.0
+        self._snapshot_peak = 0
+        self._next_snapshot = 0.0
+
+    def start(self) -> "Profiler":
+        self._started = time.perf_counter()
+        if self.full:
+            tracemalloc.start()
+        self._sampler.start()
+        if self.full:
+            self._profile.enable()
+        return self
+
+    def stop(self) -> None:
+        duration = time.perf_counter() - self._started
+        self._stop.set()
+        self._sampler.join()
+        peak = None
+        if self.full:
+            self._profile.disable()
+            _, peak = tracemalloc.get_traced_memory()
+            if not self.peak_allocations:
+                self._take_snapshot()
+            tracemalloc.stop()
+        self._write(duration, peak)
+
+    # ----------
+    # 採取
+    # ----------
+
+    def _sample_loop(self) -> None:
+        names = {}
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            phase = metrics.current_phase() or "main"
+            self.phase_seconds[phase] += now - last
+            last = now
+
+            own = threading.get_ident()
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                self.stacks[";".join([phase, names.get(ident, str(ident)), *reversed(labels)])] += 1
+
+            if not self.full:
+                continue
+            current, _ = tracemalloc.get_traced_memory()
+            if current > self._snapshot_peak * SNAPSHOT_GROWTH and now >= self._next_snapshot:
+                self._take_snapshot()
+                finished = time.perf_counter()
+                self._snapshot_peak = current
+                self._next_snapshot = finished + (finished - now) * SNAPSHOT_COST_RATIO
+
+    def _take_snapshot(self) -> None:
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        )
+        self.peak_allocations = snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+
+    # ----------
+    # 出力
+    # ----------
+
+    def _write(self, duration: float, peak: int | None) -> None:
+        folded = self.prefix.with_suffix(".folded")
+        folded.write_text("".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common()), encoding="utf-8")
+        outputs = [folded]
+
+        phases = sorted(self.phase_seconds.items(), key=lambda item: -item[1])
+        lines = [f"# プロファイル: {self.job} ({duration:.1f}秒)", "", "## フェーズごとの経過時間"]
+        for phase, seconds in phases:
+            lines.append(f"{phase:<20}{seconds:>9.2f}秒 {seconds / duration:>6.1%}")
+
+        if peak is not None:
+            lines += ["", f"## メモリ（tracemalloc）: ピーク {peak / 1024 / 1024:.1f} MiB", ""]
+            for stat in self.peak_allocations:
+                frame = stat.traceback[0]
+                lines.append(f"{stat.size / 1024 / 1024:>9.1f} MiB {stat.count:>9}個  {frame.filename}:{frame.lineno}")
+
+            prof = self.prefix.with_suffix(".prof")
+            self._profile.dump_stats(prof)
+            outputs.append(prof)
+            cpu = io.StringIO()
+            pstats.Stats(self._profile, stream=cpu).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            lines += ["", "## CPU時間（メインスレッド、累積の上位）", cpu.getvalue()]
+
+        report = self.prefix.with_suffix(".txt")
+        report.write_text("\n".join(lines), encoding="utf-8")
+
+        summary = ", ".join(f"{k} {v:.1f}秒" for k, v in phases)
+        if peak is not None:
+            summary += f", メモリのピーク {peak / 1024 / 1024:.1f} MiB"
+        logger.info(f"プロファイル: {duration:.1f}秒 ({summary})")
+        logger.info(f"プロファイルを保存: {report} / " + " / ".join(path.name for path in outputs))
+
+
+def start_profiling(job: str, mode: str = "full") -> Profiler:
+    return Profiler(job, mode=mode).start()
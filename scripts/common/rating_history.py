@@ -0,0 +1,118 @@
+"""
+剪定対象合作ページのrating履歴ストア
+
+定期実行のたびに取得済みのratingを追記するだけなので、追加のリクエストは発生しない。
+exec.pyの回復傾向レポートや「今月-3を下回ったページ数」の集計に使う。
+"""
+
+import logging
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime, UTC
+from pathlib import Path
+
+from .paths import state_path
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ratings (
+    site TEXT NOT NULL,
+    fullname TEXT NOT NULL,
+    observed_at TEXT NOT NULL,
+    rating REAL NOT NULL,
+    source TEXT NOT NULL,
+    PRIMARY KEY (site, fullname, observed_at)
+);
+CREATE INDEX IF NOT EXISTS ratings_observed_at ON ratings (site, observed_at);
+"""
+
+
+@dataclass(frozen=True)
+class Observation:
+    """ある時点のrating"""
+
+    fullname: str
+    observed_at: datetime
+    rating: float
+
+
+@dataclass(frozen=True)
+class Crossing:
+    """閾値をまたいだratingの変化"""
+
+    fullname: str
+    observed_at: datetime
+    before: float
+    after: float
+
+    @property
+    def downward(self) -> bool:
+        return self.after < self.before
+
+
+class RatingHistory:
+    """SQLiteによるrating時系列ストア"""
+
+    def __init__(self, path: Path | None = None):
+        self.path = path or state_path("rating_history.sqlite3")
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "RatingHistory":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def record(self, site: str, pages, source: str, observed_at: datetime | None = None) -> int:
+        """検索結果のページ群のratingを1トランザクションで追記する"""
+        observed = (observed_at or datetime.now(UTC)).isoformat(timespec="seconds")
+        rows = [(site, page.fullname, observed, page.rating, source) for page in pages if page.rating is not None]
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO ratings VALUES (?, ?, ?, ?, ?)", rows)
+        logger.info(f"rating履歴: {site} {len(rows)}件を記録 ({source})")
+        return len(rows)
+
+    def history(self, site: str, fullname: str, since: datetime | None = None) -> list[Observation]:
+        """ページのrating推移（古い順）"""
+        rows = self.conn.execute(
+            "SELECT fullname, observed_at, rating FROM ratings"
+            " WHERE site = ? AND fullname = ? AND observed_at >= ? ORDER BY observed_at",
+            (site, fullname, since.isoformat(timespec="seconds") if since else ""),
+        ).fetchall()
+        return [Observation(r[0], datetime.fromisoformat(r[1]), r[2]) for r in rows]
+
+    def latest(
+        self, site: str, fullname: str, before: datetime | None = None, source: str | None = None
+    ) -> Observation | None:
+        """指定時刻より前の最新のrating（sourceで記録元を絞り込める）"""
+        row = self.conn.execute(
+            "SELECT fullname, observed_at, rating FROM ratings"
+            " WHERE site = ? AND fullname = ? AND observed_at < ? AND (? IS NULL OR source = ?)"
+            " ORDER BY observed_at DESC LIMIT 1",
+            (site, fullname, before.isoformat(timespec="seconds") if before else "~", source, source),
+        ).fetchone()
+        return Observation(row[0], datetime.fromisoformat(row[1]), row[2]) if row else None
+
+    def crossings(self, site: str, threshold: float, start: datetime, end: datetime) -> list[Crossing]:
+        """期間内に閾値をまたいだ変化（rating <= threshold への下落と、そこからの回復）"""
+        rows = self.conn.execute(
+            "SELECT fullname, observed_at, rating FROM ratings"
+            " WHERE site = ? AND observed_at < ? ORDER BY fullname, observed_at",
+            (site, end.isoformat(timespec="seconds")),
+        ).fetchall()
+
+        start_key = start.isoformat(timespec="seconds")
+        results = []
+        previous: tuple[str, float] | None = None
+        for fullname, observed_at, rating in rows:
+            if previous is not None and previous[0] == fullname and observed_at >= start_key:
+                before = previous[1]
+                if (before > threshold) != (rating > threshold):
+                    results.append(Crossing(fullname, datetime.fromisoformat(observed_at), before, rating))
+            previous = (fullname, rating)
+        return results
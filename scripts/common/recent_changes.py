@@ -0,0 +1,146 @@
+"""
+サイトの最近の更新（changes/SiteChangesListModule）の差分取得
+
+どこまで読んだか（チェックポイント）を .state/recent_changes/<site>.json に保存し、
+それより新しい更新だけを返す。チェックポイントより古い更新に達した時点でページ送りを止めるため、
+前回から更新が少なければ1リクエストで終わる。
+"""
+
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from .paths import state_path
+
+logger = logging.getLogger(__name__)
+
+PER_PAGE = 50
+# これより遡る必要がある場合は取りこぼしとみなし、全件スキャンに任せる
+MAX_PAGES = 10
+
+# 更新の種類（WikidotのSiteChangesListModuleの表示）
+# N=新規作成, R=リネーム・移動, A=タグの変更, S=ソース, T=タイトル, M=メタデータ, F=ファイル
+FLAG_NEW = "N"
+FLAG_RENAMED = "R"
+FLAG_TAGS = "A"
+
+
+@dataclass(frozen=True)
+class Change:
+    """最近の更新の1行"""
+
+    fullname: str
+    revision: int
+    changed_at: int
+    changed_by: str | None
+    flags: frozenset[str]
+
+    @property
+    def key(self) -> str:
+        return f"{self.fullname}#{self.revision}"
+
+
+@dataclass
+class ChangeBatch:
+    """前回のチェックポイント以降の更新（新しい順）
+
+    completeがFalseならチェックポイントまで遡れていない（初回・取りこぼしの可能性あり）
+    """
+
+    site: str
+    changes: list[Change]
+    complete: bool
+
+
+def _parse(soup: BeautifulSoup) -> list[Change]:
+    changes = []
+    for item in soup.select("div.changes-list-item"):
+        title = item.select_one("td.title a")
+        odate = item.select_one("td.mod-date span.odate")
+        if title is None or odate is None:
+            continue
+        timestamp = re.search(r"time_(\d+)", " ".join(odate.get("class", [])))
+        revision = re.search(r"(\d+)", item.select_one("td.revision-no").get_text())
+        user = item.select_one("td.mod-by span.printuser a[href*='user:info/']")
+        changes.append(
+            Change(
+                fullname=str(title.get("href", "")).strip("/"),
+                revision=int(revision.group(1)) if revision else 0,
+                changed_at=int(timestamp.group(1)) if timestamp else 0,
+                changed_by=user["href"].rsplit("user:info/", 1)[1] if user else None,
+                flags=frozenset(span.get_text().strip() for span in item.select("td.flags span")),
+            )
+        )
+    return changes
+
+
+class ChangeFeed:
+    """1サイト分の最近の更新をチェックポイント以降だけ読む"""
+
+    def __init__(self, site_name: str, persist: bool = True, path: Path | None = None):
+        self.site_name = site_name
+        self.persist = persist
+        self.path = path or state_path("recent_changes", f"{site_name}.json")
+        self.last: int | None = None
+        self.seen: set[str] = set()
+        if self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            self.last, self.seen = data["last"], set(data["seen"])
+
+    def _is_new(self, change: Change) -> bool:
+        return change.changed_at > self.last or (change.changed_at == self.last and change.key not in self.seen)
+
+    def poll(self, site) -> ChangeBatch:
+        """チェックポイント以降の更新を取得する（チェックポイントはcommitするまで進めない）"""
+        if self.last is None:
+            # 初回は現在位置を覚えるだけ（それ以前の分は全件スキャンで扱う）
+            response = site.amc_request([self._body(1)])[0]
+            return ChangeBatch(self.site_name, _parse(BeautifulSoup(response.json()["body"], "lxml")), complete=False)
+
+        changes = []
+        for page_no in range(1, MAX_PAGES + 1):
+            response = site.amc_request([self._body(page_no)])[0]
+            rows = _parse(BeautifulSoup(response.json()["body"], "lxml"))
+            changes.extend(c for c in rows if self._is_new(c))
+            if len(rows) < PER_PAGE or any(c.changed_at < self.last for c in rows):
+                return ChangeBatch(self.site_name, changes, complete=True)
+        logger.warning(f"{self.site_name}: 最近の更新を{MAX_PAGES * PER_PAGE}件遡ってもチェックポイントに達しませんでした")
+        return ChangeBatch(self.site_name, changes, complete=False)
+
+    def commit(self, batch: ChangeBatch) -> None:
+        """処理済みの更新までチェックポイントを進める"""
+        if not batch.changes:
+            if self.last is None:
+                self.last = 0
+                self._save()
+            return
+        latest = max(c.changed_at for c in batch.changes)
+        keys = {c.key for c in batch.changes if c.changed_at == latest}
+        if latest == self.last:
+            self.seen |= keys
+        elif self.last is None or latest > self.last:
+            self.last, self.seen = latest, keys
+        self._save()
+
+    def _save(self) -> None:
+        if not self.persist:
+            return
+        data = {"last": self.last, "seen": sorted(self.seen)}
+        # ページIDのキャッシュは複数のワーカープロセスが同じチェックポイントを読み書きする
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.path)
+
+    @staticmethod
+    def _body(page_no: int) -> dict:
+        return {
+            "moduleName": "changes/SiteChangesListModule",
+            "perpage": str(PER_PAGE),
+            "page": page_no,
+            "options": "{'all':true}",
+        }
@@ -0,0 +1,95 @@
+"""
+書き込みの再試行と失敗後の状態確認
+
+commit_tags / rename がタイムアウト等で失敗しても、サーバー側では反映済みのことがある
+（wikidot.py自身の再試行が反映済みの書き込みを送り直して失敗することもある）。
+失敗したらまず現在の状態を取得し、意図どおりなら成功として扱う。
+反映されておらず一時的な失敗であれば間隔を空けて再試行し、それでも駄目ならエラーにする。
+"""
+
+import logging
+import time
+from collections.abc import Callable
+
+import httpx
+from wikidot.common import exceptions
+
+from . import metrics
+from .search import search, search_many
+
+logger = logging.getLogger(__name__)
+
+# 再試行までの待ち時間（秒）。要素数が再試行の回数になる
+RETRY_DELAYS = (2.0, 5.0, 15.0)
+
+
+def _is_transient(error: Exception) -> bool:
+    """再試行すれば成功しうる失敗か（権限・名前の重複などはFalse）"""
+    if isinstance(error, exceptions.WikidotStatusCodeException):
+        return error.status_code == "try_again"
+    return isinstance(
+        error,
+        (exceptions.AMCHttpStatusCodeException, exceptions.ResponseDataException, httpx.TransportError),
+    )
+
+
+def write_verified(write: Callable[[], object], verify: Callable[[], bool], description: str) -> None:
+    """
+    writeを実行し、失敗したらverifyで反映済みかを確かめてから再試行する
+
+    verifyは書き込みが意図どおり反映されていればTrueを返す。反映済みでなく、
+    再試行しても成功しない失敗ならwriteの例外をそのまま送出する。
+    """
+    for attempt, delay in enumerate((*RETRY_DELAYS, None), start=1):
+        try:
+            write()
+            return
+        except exceptions.LoginRequiredException:
+            raise
+        except Exception as e:
+            error = e
+
+        try:
+            if verify():
+                logger.info(f"{description}: 失敗応答でしたが反映済みでした ({error})")
+                metrics.count("writes_verified")
+                return
+        except Exception as e:
+            logger.warning(f"{description}: 反映の確認に失敗: {e}")
+
+        if delay is None or not _is_transient(error):
+            raise error
+        logger.warning(f"{description}: 失敗したため{delay:g}秒後に再試行 ({attempt}/{len(RETRY_DELAYS)}): {error}")
+        metrics.count("write_retries")
+        time.sleep(delay)
+
+
+def commit_tags(page) -> None:
+    """page.tagsを保存する（失敗時は現在のタグを確認してから再試行）"""
+    intended = set(page.tags)
+
+    def verify() -> bool:
+        found = search(page.site, fields=("tags",), fullname=page.fullname)
+        return len(found) == 1 and set(found[0].tags) == intended
+
+    write_verified(page.commit_tags, verify, f"{page.fullname} のタグ保存")
+
+
+def rename(page, new_fullname: str):
+    """ページをリネームする（失敗時は新旧のページの有無を確認してから再試行）"""
+    old_fullname = page.fullname
+
+    def verify() -> bool:
+        new, old = search_many(page.site, [{"fullname": new_fullname}, {"fullname": old_fullname}], fields=())
+        return len(new) == 1 and len(old) == 0
+
+    write_verified(lambda: page.rename(new_fullname), verify, f"{old_fullname} のリネーム")
+    if page.fullname != new_fullname:
+        # 確認で反映済みと分かった場合は page.rename と同じく属性を更新する
+        page.fullname = new_fullname
+        page.category, page.name = new_fullname.split(":", 1) if ":" in new_fullname else ("_default", new_fullname)
+
+    from .page_ids import record_rename
+
+    record_rename(page.site.unix_name, new_fullname, page.id)
+    return page
@@ -0,0 +1,333 @@
+"""
+タグ付与・剪定ルールの宣言とルールエンジン
+
+サイトごとに1回だけページ一覧を取得し、全ルールを各ページに評価する。
+ルールを追加してもリクエスト数は増えない。
+"""
+
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+import wikidot
+
+from . import metrics
+from .deadline import Backlog, Deadline
+from .retry import commit_tags
+from .search import search_all, search_many
+
+logger = logging.getLogger(__name__)
+
+COLLAB_CATEGORIES = [
+    "anomalous-jp",
+    "extranormal-events-jp",
+    "video-log-of-scp-1779-jp",
+    "poem",
+    "log-of-unexplained-locations-jp",
+    "scp-flavor",
+]
+
+NOTICE_TAG = "合作記事剪定通知"
+INACTIVE_USER_TAG = "非使用ユーザー"
+INITIAL_TAGS = [f"initial_{c}" for c in "abcdefghijklmnopqrstuvwxyz0123456789"] + ["initial_null"]
+
+# スキャン時に常に取得するフィールド（修正とrating履歴の記録に使う）
+SCAN_FIELDS = ("tags", "rating")
+# ページIDはこの件数ずつまとめて設定する（時間予算で持ち越すページの分まで先に取得しないよう、まとめすぎない）
+PAGE_ID_CHUNK_SIZE = 50
+
+
+@dataclass(frozen=True)
+class TagFix:
+    """ルール違反に対するタグ修正内容（add/removeが空なら報告のみ）"""
+
+    add: tuple[str, ...] = ()
+    remove: tuple[str, ...] = ()
+    note: str = ""
+
+    @property
+    def fixable(self) -> bool:
+        return bool(self.add or self.remove)
+
+
+@dataclass(frozen=True)
+class Rule:
+    """1つのルール定義。checkは違反があればTagFixを、なければNoneを返す
+
+    fieldsはcheckが参照するSCAN_FIELDS以外のページ属性（検索で追加取得する）
+    priorityは時間予算があるときの処理順（小さいほど先、Noneなら検索順）
+    """
+
+    name: str
+    site: str
+    categories: tuple[str, ...]
+    check: Callable[["wikidot.Page"], TagFix | None]
+    description: str = ""
+    fields: tuple[str, ...] = ()
+    priority: Callable[["wikidot.Page"], float] | None = None
+
+
+@dataclass
+class Violation:
+    """ページに対するルール違反"""
+
+    rule: Rule
+    page: "wikidot.Page"
+    fix: TagFix
+
+
+@dataclass
+class ScanResult:
+    """1サイト分のスキャン結果"""
+
+    site: str
+    scanned: int = 0
+    pages: list["wikidot.Page"] = field(default_factory=list)
+    violations: list[Violation] = field(default_factory=list)
+
+
+def get_initial_tag(unix_name: str) -> str:
+    """unix_nameの頭文字からinitial_Xタグを生成"""
+    if not unix_name:
+        return "initial_null"
+    first_char = unix_name[0].lower()
+    if first_char.isalnum():
+        return f"initial_{first_char}"
+    return "initial_null"
+
+
+def _check_collab_tags(page) -> TagFix | None:
+    """合作カテゴリ: jp / 剪定対象-子 タグが必要"""
+    if page.name.startswith("_"):
+        return None
+    missing = tuple(t for t in ("jp", "剪定対象-子") if t not in page.tags)
+    return TagFix(add=missing) if missing else None
+
+
+def _check_collab_notice(page) -> TagFix | None:
+    """合作カテゴリ: rating <= -3 なら剪定通知タグが必要"""
+    if page.rating <= -3 and NOTICE_TAG not in page.tags:
+        return TagFix(add=(NOTICE_TAG,))
+    return None
+
+
+def _check_portal_initial(page) -> TagFix | None:
+    """ポータル: 非使用ユーザー以外はinitial_*タグがちょうど1つ必要"""
+    if page.name.startswith("_") or INACTIVE_USER_TAG in page.tags:
+        return None
+    initial_tags = [t for t in page.tags if t in INITIAL_TAGS]
+    if len(initial_tags) == 1:
+        return None
+    if len(initial_tags) > 1:
+        return TagFix(note=f"initial_*タグが複数: {initial_tags}")
+    if page.created_by:
+        return TagFix(add=(get_initial_tag(page.created_by.unix_name),))
+    return TagFix(add=(INACTIVE_USER_TAG,))
+
+
+def _check_inactive_user_initial(page) -> TagFix | None:
+    """ポータル: 非使用ユーザーにはinitial_*タグを付けない"""
+    if INACTIVE_USER_TAG not in page.tags:
+        return None
+    initial_tags = tuple(t for t in page.tags if t in INITIAL_TAGS)
+    return TagFix(remove=initial_tags) if initial_tags else None
+
+
+COLLAB_TAG_RULE = Rule(
+    name="collab-tags",
+    site="scp-jp",
+    categories=tuple(COLLAB_CATEGORIES),
+    check=_check_collab_tags,
+    description="剪定対象合作に jp / 剪定対象-子 タグを付与",
+)
+
+COLLAB_NOTICE_RULE = Rule(
+    name="collab-notice",
+    site="scp-jp",
+    categories=tuple(COLLAB_CATEGORIES),
+    check=_check_collab_notice,
+    description=f"rating <= -3 の剪定対象合作に {NOTICE_TAG} タグを付与",
+    # ratingの低いページから通知する
+    priority=lambda page: page.rating,
+)
+
+PORTAL_INITIAL_RULE = Rule(
+    name="portal-initial",
+    site="scp-jp-sandbox3",
+    categories=("portal",),
+    check=_check_portal_initial,
+    description="SB3ポータルに initial_X タグを1つ付与",
+    fields=("created_by",),
+)
+
+INACTIVE_USER_INITIAL_RULE = Rule(
+    name="inactive-user-initial",
+    site="scp-jp-sandbox3",
+    categories=("portal",),
+    check=_check_inactive_user_initial,
+    description=f"{INACTIVE_USER_TAG} のポータルから initial_* タグを削除",
+)
+
+ALL_RULES = [
+    COLLAB_TAG_RULE,
+    COLLAB_NOTICE_RULE,
+    PORTAL_INITIAL_RULE,
+    INACTIVE_USER_INITIAL_RULE,
+]
+
+
+def scan_site(site: "wikidot.Site", rules: list[Rule]) -> ScanResult:
+    """サイトを1回だけ検索し、全ルールを各ページに評価する"""
+    rules = [r for r in rules if r.site == site.unix_name]
+    result = ScanResult(site=site.unix_name)
+    if not rules:
+        return result
+
+    categories = sorted({c for r in rules for c in r.categories})
+    pages = search_all(site, fields=_scan_fields(rules), category=" ".join(categories))
+    _evaluate(result, list(pages), rules)
+
+    logger.info(f"{site.unix_name}: {result.scanned}ページをスキャン, 違反 {len(result.violations)}件")
+    return result
+
+
+def check_pages(site: "wikidot.Site", rules: list[Rule], fullnames: list[str]) -> ScanResult:
+    """指定したページだけを取得して全ルールを評価する（最近の更新の差分処理用）"""
+    rules = [r for r in rules if r.site == site.unix_name]
+    result = ScanResult(site=site.unix_name)
+    categories = {c for r in rules for c in r.categories}
+    targets = [f for f in dict.fromkeys(fullnames) if (f.split(":", 1)[0] if ":" in f else "_default") in categories]
+    if not targets:
+        return result
+
+    # 削除・リネーム済みのページは検索結果に現れない
+    collections = search_many(site, [{"fullname": f} for f in targets], fields=_scan_fields(rules))
+    _evaluate(result, [page for collection in collections for page in collection], rules)
+
+    logger.info(f"{site.unix_name}: 更新された{result.scanned}ページを確認, 違反 {len(result.violations)}件")
+    return result
+
+
+def _scan_fields(rules: list[Rule]) -> tuple[str, ...]:
+    return SCAN_FIELDS + tuple(f for r in rules for f in r.fields)
+
+
+def _evaluate(result: ScanResult, pages: list["wikidot.Page"], rules: list[Rule]) -> None:
+    result.scanned = len(pages)
+    metrics.count("pages_scanned", result.scanned)
+    result.pages = pages
+
+    for page in pages:
+        for rule in rules:
+            if page.category not in rule.categories:
+                continue
+            fix = rule.check(page)
+            if fix is not None:
+                result.violations.append(Violation(rule=rule, page=page, fix=fix))
+
+
+def _priority(fullname: str, violations: list[Violation], backlog: Backlog | None) -> tuple:
+    """前回持ち越したページを先に、次にルールのpriorityの小さい順"""
+    keys = [v.rule.priority(v.page) for v in violations if v.rule.priority is not None]
+    return (backlog is None or fullname not in backlog, min(keys, default=0))
+
+
+def _prefetch_page_ids(pages) -> None:
+    """commit_tagsの前にページIDをキャッシュから設定し、キャッシュにない分だけを取得する"""
+    from .page_ids import get_page_ids
+
+    by_site: dict[str, tuple] = {}
+    for page in pages:
+        by_site.setdefault(page.site.unix_name, (page.site, []))[1].append(page)
+    for site, site_pages in by_site.values():
+        get_page_ids(site, site_pages)
+
+
+def apply_fixes(
+    violations: list[Violation],
+    dry_run: bool = False,
+    deadline: Deadline | None = None,
+    backlog: Backlog | None = None,
+) -> dict:
+    """
+    違反をページ単位にまとめ、1ページ1回のcommit_tagsで修正する
+
+    deadlineを渡すと優先度の順に処理し、時間予算を使い切りそうになった残りのページはdeferredに入れる。
+    """
+    results = {"processed": [], "reported": [], "errors": [], "deferred": []}
+
+    by_page: dict[str, list[Violation]] = {}
+    for violation in violations:
+        if not violation.fix.fixable:
+            results["reported"].append(
+                {"page": violation.page.fullname, "rule": violation.rule.name, "note": violation.fix.note}
+            )
+            continue
+        by_page.setdefault(violation.page.fullname, []).append(violation)
+
+    pages = list(by_page.items())
+    if deadline is not None:
+        pages.sort(key=lambda item: _priority(*item, backlog))
+
+    for i, (fullname, page_violations) in enumerate(pages):
+        if not dry_run and i % PAGE_ID_CHUNK_SIZE == 0:
+            _prefetch_page_ids([v[0].page for _, v in pages[i : i + PAGE_ID_CHUNK_SIZE]])
+        if deadline is not None and not deadline.allows():
+            results["deferred"].append(fullname)
+            continue
+        page = page_violations[0].page
+        to_remove = [t for v in page_violations for t in v.fix.remove if t in page.tags]
+        to_add = []
+        for v in page_violations:
+            for tag in v.fix.add:
+                if tag not in page.tags and tag not in to_add:
+                    to_add.append(tag)
+        entry = {
+            "page": fullname,
+            "rating": page.rating,
+            "rules": [v.rule.name for v in page_violations],
+            "added": to_add,
+            "removed": to_remove,
+        }
+
+        try:
+            if dry_run:
+                logger.info(f"[DRY-RUN] {fullname}: +{to_add} -{to_remove}")
+            else:
+                for tag in to_remove:
+                    page.tags.remove(tag)
+                page.tags.extend(to_add)
+                commit_tags(page)
+                metrics.count("pages_mutated")
+                logger.info(f"{fullname}: +{to_add} -{to_remove}")
+            results["processed"].append(entry)
+        except Exception as e:
+            logger.exception(f"Error processing page {fullname}: {e}")
+            results["errors"].append({"page": fullname, "error": str(e)})
+        finally:
+            if deadline is not None:
+                deadline.finish()
+
+    return results
+
+
+def run_rules(
+    client: "wikidot.Client",
+    rules: list[Rule],
+    dry_run: bool = False,
+    on_scan: Callable[[ScanResult], None] | None = None,
+    deadline: Deadline | None = None,
+    backlog: Backlog | None = None,
+) -> dict:
+    """ルールの対象サイトごとに1回スキャンして修正までを行う"""
+    results = {"scanned": 0, "processed": [], "reported": [], "errors": [], "deferred": []}
+    for site_name in dict.fromkeys(r.site for r in rules):
+        site = client.site.get(site_name)
+        scan = scan_site(site, rules)
+        if on_scan is not None:
+            on_scan(scan)
+        fixed = apply_fixes(scan.violations, dry_run=dry_run, deadline=deadline, backlog=backlog)
+        results["scanned"] += scan.scanned
+        for key in ("processed", "reported", "errors", "deferred"):
+            results[key].extend(fixed[key])
+    return results
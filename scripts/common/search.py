@@ -0,0 +1,517 @@
+"""
+取得フィールドを絞ったListPages検索
+
+site.pages.search は常に全フィールド（作成者・更新者・コメント者のユーザー要素や日時を含む）を
+取得する。ここでは呼び出し側が宣言したフィールドだけをmodule_bodyに含め、レスポンスを小さくする。
+宣言しなかったフィールドはPage上でNoneになる。
+
+ページ送りは前回の件数（.state/search_hints.json）から必要なoffsetを先読みし、
+複数の検索もまとめて1回のamc_requestで送る。
+
+件数の多い検索（search_all）は名前の頭文字ごとの検索に分けて並列に取得する。
+
+SearchCache が有効な間は取得済みの結果を再利用する。同じ検索だけでなく、
+カテゴリの一部・タグ条件・fullnameで絞った検索も取得済みの上位集合から手元で絞り込んで返す。
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any
+from urllib.parse import parse_qs
+
+from bs4 import BeautifulSoup
+from wikidot.common import exceptions
+from wikidot.module.page import Page, PageCollection, PageConstants, SearchPagesQuery
+from wikidot.util.parser import user as user_parser
+
+from . import metrics
+from .paths import state_path
+from .transport import get_transport
+
+logger = logging.getLogger(__name__)
+
+# Pageの属性名 → ListPagesのフィールド名
+FIELD_KEYS: dict[str, tuple[str, ...]] = {
+    "fullname": ("fullname",),
+    "name": ("name",),
+    "category": ("category",),
+    "title": ("title",),
+    "children_count": ("children",),
+    "comments_count": ("comments",),
+    "size": ("size",),
+    "rating": ("rating",),
+    "votes_count": ("rating_votes",),
+    "rating_percent": ("rating_percent",),
+    "revisions_count": ("revisions",),
+    "parent_fullname": ("parent_fullname",),
+    "tags": ("tags", "_tags"),
+    "created_by": ("created_by_linked",),
+    "created_at": ("created_at",),
+    "updated_by": ("updated_by_linked",),
+    "updated_at": ("updated_at",),
+    "commented_by": ("commented_by_linked",),
+    "commented_at": ("commented_at",),
+}
+
+# 常に取得するフィールド（ページ操作に必要）
+BASE_FIELDS = ("fullname", "name", "category")
+
+_INT_KEYS = {"children", "comments", "size", "rating_votes", "revisions"}
+_DATE_KEYS = {"created_at", "updated_at", "commented_at"}
+_USER_KEYS = {"created_by_linked", "updated_by_linked", "commented_by_linked"}
+_ATTR_OF_KEY = {key: attr for attr, keys in FIELD_KEYS.items() for key in keys}
+
+
+def _module_body(fields: tuple[str, ...]) -> str:
+    keys = [key for attr in fields for key in FIELD_KEYS[attr]]
+    return (
+        '[[div class="page"]]\n'
+        + "".join(
+            f'[[span class="set {key}"]]'
+            f'[[span class="name"]] {key} [[/span]]'
+            f'[[span class="value"]] %%{key}%% [[/span]]'
+            f"[[/span]]"
+            for key in keys
+        )
+        + "\n[[/div]]"
+    )
+
+
+def _normalize_fields(fields) -> tuple[str, ...]:
+    unknown = set(fields) - FIELD_KEYS.keys()
+    if unknown:
+        raise ValueError(f"未知のフィールド: {', '.join(sorted(unknown))}")
+    return tuple(dict.fromkeys([*BASE_FIELDS, *fields]))
+
+
+def _extract_value(key: str, value_element, is_5star: bool) -> Any:
+    """値の要素をpickle可能な値にする（日時はunix時刻、ユーザーはprintuser要素のHTML）"""
+    if value_element is None:
+        return None
+    if key in _DATE_KEYS:
+        odate = value_element.select_one("span.odate")
+        timestamp = re.search(r"time_(\d+)", " ".join(odate.get("class", []))) if odate is not None else None
+        return int(timestamp.group(1)) if timestamp else None
+    if key in _USER_KEYS:
+        printuser = value_element.select_one("span.printuser")
+        return str(printuser) if printuser is not None else None
+    text = value_element.text.strip()
+    if key in ("tags", "_tags"):
+        return text.split()
+    if key in _INT_KEYS:
+        return int(text) if text else None
+    if key == "rating":
+        return float(text) if is_5star else int(text)
+    if key == "rating_percent":
+        return float(text) / 100 if is_5star else None
+    return text
+
+
+def _extract_rows(soup: BeautifulSoup) -> list[dict[str, Any]]:
+    rows = []
+    for page_element in soup.select("div.page"):
+        params: dict[str, Any] = dict.fromkeys(FIELD_KEYS)
+        hidden_tags: list[str] = []
+        is_5star = page_element.select_one("span.rating span.page-rate-list-pages-start") is not None
+
+        for set_element in page_element.select("span.set"):
+            key_element = set_element.select_one("span.name")
+            if key_element is None:
+                raise exceptions.NoElementException("Cannot find key element in set")
+            key = key_element.text.strip()
+            value = _extract_value(key, set_element.select_one("span.value"), is_5star)
+            if key == "_tags":
+                hidden_tags = value or []
+            else:
+                params[_ATTR_OF_KEY[key]] = value
+
+        if params["tags"] is not None or hidden_tags:
+            params["tags"] = (params["tags"] or []) + hidden_tags
+        rows.append(params)
+    return rows
+
+
+def _total_pages(soup: BeautifulSoup) -> int:
+    pager = soup.select_one("div.pager")
+    if pager is None:
+        return 1
+    # 最終ページは現在のページ（span.current）として表示されることもあるため、番号の最大値を取る
+    numbers = [int(text) for span in pager.select("span.target, span.current") if (text := span.text.strip()).isdigit()]
+    if not numbers:
+        raise exceptions.NoElementException("Cannot find last pager link")
+    return max(numbers)
+
+
+def _parse_body(body: str) -> tuple[int, list[dict[str, Any]]]:
+    """ListPagesの応答1件を (ページ送り数, ページごとの値) にする（ワーカープロセスでも実行する）"""
+    soup = BeautifulSoup(body, "lxml")
+    return _total_pages(soup), _extract_rows(soup)
+
+
+def _build_pages(site, rows: list[dict[str, Any]]) -> list[Page]:
+    users: dict[str, Any] = {}
+
+    def _user(html: str | None):
+        if html is None:
+            return None
+        if html not in users:
+            users[html] = user_parser(site.client, BeautifulSoup(html, "lxml").select_one("span.printuser"))
+        return users[html]
+
+    pages = []
+    for row in rows:
+        params = dict(row)
+        for key in _DATE_KEYS | _USER_KEYS:
+            attr = _ATTR_OF_KEY[key]
+            if params[attr] is None:
+                continue
+            params[attr] = datetime.fromtimestamp(params[attr]) if key in _DATE_KEYS else _user(params[attr])
+        pages.append(Page(site, **params))
+    return pages
+
+
+class _SizeHints:
+    """検索ごとの前回のページ送り数（先読みするoffsetの数に使う）"""
+
+    def __init__(self):
+        self.path = state_path("search_hints.json")
+        self.hints: dict[str, int] = {}
+        self.changed = False
+        if self.path.exists():
+            try:
+                self.hints = json.loads(self.path.read_text(encoding="utf-8"))
+            except json.JSONDecodeError:
+                self.hints = {}
+
+    @staticmethod
+    def key(site, query: dict) -> str:
+        return f"{site.unix_name}:{json.dumps(query, ensure_ascii=False, sort_keys=True, default=str)}"
+
+    def get(self, key: str) -> int:
+        return self.hints.get(key, 1)
+
+    def set(self, key: str, total: int) -> None:
+        # 1ページで収まる検索は既定値と同じなので記録しない
+        value = total if total > 1 else None
+        if self.hints.get(key) == value:
+            return
+        if value is None:
+            del self.hints[key]
+        else:
+            self.hints[key] = value
+        self.changed = True
+
+    def save(self) -> None:
+        """変わった件数があれば保存する（ワーカープロセスや監視モードと同時に書いても壊れないよう置き換える）"""
+        if not self.changed:
+            return
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(self.hints, ensure_ascii=False, indent=1), encoding="utf-8")
+        tmp.replace(self.path)
+        self.changed = False
+
+
+def _request(site, bodies: list[dict], parser: Executor | None = None) -> list[tuple[int, list[dict[str, Any]]]]:
+    """ListPagesの応答を取得して解析する（parserがあればそのワーカーで解析する）"""
+    try:
+        responses = site.amc_request(bodies)
+    except exceptions.WikidotStatusCodeException as e:
+        if e.status_code == "not_ok":
+            raise exceptions.ForbiddenException("Failed to get pages, target site may be private") from e
+        raise
+    texts = [response.json()["body"] for response in responses]
+    if parser is None or len(texts) < 2:
+        return [_parse_body(text) for text in texts]
+    return list(parser.map(_parse_body, texts))
+
+
+# ----------
+# 実行中の検索キャッシュ
+# ----------
+
+# 結果の集合に影響しない検索パラメータ
+_PAGING_KEYS = ("perPage", "separate", "wrapper")
+# 手元で絞り込める検索パラメータ（それ以外は上位集合と一致している必要がある）
+_NARROWABLE_KEYS = ("category", "tags", "fullname", "limit")
+
+_cache: "SearchCache | None" = None
+
+
+def _cache_query(query: dict) -> dict:
+    normalized = SearchPagesQuery(**query).as_dict()
+    for key in _PAGING_KEYS:
+        normalized.pop(key, None)
+    return normalized
+
+
+_DEFAULT_QUERY = _cache_query({})
+
+
+def _tag_matcher(expression: str):
+    """ListPagesのtags条件（+必須 -除外 それ以外はいずれか）を手元で評価する関数（評価できなければNone）"""
+    required, excluded, any_of = set(), set(), set()
+    for term in expression.split():
+        if term.startswith("=") or term == "-":
+            return None
+        if term.startswith("+"):
+            required.add(term[1:])
+        elif term.startswith("-"):
+            excluded.add(term[1:])
+        else:
+            any_of.add(term)
+
+    def matches(page: Page) -> bool:
+        tags = set(page.tags)
+        return required <= tags and tags.isdisjoint(excluded) and (not any_of or not tags.isdisjoint(any_of))
+
+    return matches
+
+
+def _narrow(base: dict, query: dict, pages: list[Page]) -> list[Page] | None:
+    """baseの結果pagesからqueryの結果を求める（求められなければNone）"""
+    if base == query:
+        return list(pages)
+    # 上位集合は全件取得した検索に限る
+    if base.get("offset") or "limit" in base or query.get("offset") or "fullname" in base:
+        return None
+    if any(base.get(k) != query.get(k) for k in (base.keys() | query.keys()) - set(_NARROWABLE_KEYS)):
+        return None
+
+    base_categories, categories = base["category"].split(), query["category"].split()
+    if base_categories != categories:
+        if any(c == "*" or c.startswith("-") for c in categories):
+            return None
+        if base_categories != ["*"] and not set(categories) <= set(base_categories):
+            return None
+        pages = [page for page in pages if page.category in categories]
+
+    if query.get("tags") != base.get("tags"):
+        if base.get("tags"):
+            return None
+        matches = _tag_matcher(query["tags"])
+        if matches is None:
+            return None
+        pages = [page for page in pages if matches(page)]
+
+    if "fullname" in query:
+        pages = [page for page in pages if page.fullname == query["fullname"]]
+    if "limit" in query:
+        pages = pages[: int(query["limit"])]
+    return pages
+
+
+class SearchCache:
+    """
+    実行中の検索結果のキャッシュ（with文、または enable_search_cache で有効にする）
+
+    サイトへの書き込み（AMCのaction）があれば、そのサイトの結果は破棄する。
+    """
+
+    def __init__(self):
+        self.entries: dict[str, list[tuple[dict, frozenset[str], list[Page]]]] = defaultdict(list)
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._previous: "SearchCache | None" = None
+
+    def __enter__(self) -> "SearchCache":
+        global _cache
+        self._previous, _cache = _cache, self
+        get_transport().add_hook(self._on_request)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        global _cache
+        _cache = self._previous
+        get_transport().remove_hook(self._on_request)
+
+    def lookup(self, site, query: dict, fields: tuple[str, ...]) -> PageCollection | None:
+        query = _cache_query(query)
+        with self._lock:
+            entries = list(self.entries.get(site.unix_name, ()))
+        for base, base_fields, pages in reversed(entries):
+            if not base_fields.issuperset(fields):
+                continue
+            if "tags" not in base_fields and query.get("tags") != base.get("tags"):
+                continue
+            narrowed = _narrow(base, query, pages)
+            if narrowed is None:
+                narrowed = self._find_page(base, query, pages)
+            if narrowed is not None:
+                with self._lock:
+                    self.hits += 1
+                metrics.count("search_cache_hits")
+                return PageCollection(site, narrowed)
+        return None
+
+    @staticmethod
+    def _find_page(base: dict, query: dict, pages: list[Page]) -> list[Page] | None:
+        """fullnameだけを指定した検索は、どの検索の結果にでも含まれていればそのページを返す"""
+        if "fullname" not in query or query != {**_DEFAULT_QUERY, "fullname": query["fullname"]}:
+            return None
+        found = [page for page in pages if page.fullname == query["fullname"]]
+        return found or None
+
+    def store(self, site, query: dict, fields: tuple[str, ...], pages: list[Page]) -> None:
+        with self._lock:
+            self.entries[site.unix_name].append((_cache_query(query), frozenset(fields), list(pages)))
+
+    def invalidate(self, site_name: str) -> None:
+        with self._lock:
+            self.entries.pop(site_name, None)
+
+    def _on_request(self, request):
+        if request.url.path != "/ajax-module-connector.php":
+            return None
+        if "action" in parse_qs(request.content.decode("utf-8", "replace")):
+            self.invalidate(request.url.host.removesuffix(".wikidot.com"))
+        return None
+
+
+def enable_search_cache() -> SearchCache:
+    """プロセスの終了まで検索キャッシュを有効にする"""
+    return SearchCache().__enter__()
+
+
+def search_many(
+    site, queries: list[dict], fields=("tags",), parser: Executor | None = None, cache: bool = True
+) -> list[PageCollection]:
+    """
+    複数のListPages検索を、宣言したフィールドだけ取得してまとめて実行する
+
+    queriesは site.pages.search と同じキーワードの辞書。戻り値は queries と同順。
+    前回の結果から必要なoffsetを先読みするため、件数が大きく変わらなければ1往復で終わる。
+    SearchCache が有効なら、取得済みの結果から求められる検索は送信しない。
+    cache=False なら取得済みの結果を使わずに送信し、そのサイトの取得済みの結果を破棄する
+    （別プロセスでの書き込みのように、キャッシュが破棄されない変更のあとの読み直し用）。
+    parserを渡すと応答の解析をそのExecutor（ProcessPoolExecutor）で並列に行う。
+    """
+    fields = _normalize_fields(fields)
+    store = _cache
+    if store is None:
+        return _fetch(site, queries, fields, parser)
+    if not cache:
+        store.invalidate(site.unix_name)
+
+    cached = [store.lookup(site, query, fields) for query in queries]
+    missing = [query for query, result in zip(queries, cached) if result is None]
+    fetched = _fetch(site, missing, fields, parser) if missing else []
+    for query, collection in zip(missing, fetched):
+        store.store(site, query, fields, collection)
+    remaining = iter(fetched)
+    return [result if result is not None else next(remaining) for result in cached]
+
+
+def _fetch(site, queries: list[dict], fields: tuple[str, ...], parser: Executor | None = None) -> list[PageCollection]:
+    module_body = _module_body(fields)
+    hints = _SizeHints()
+
+    plans = []
+    for query in queries:
+        query_dict = SearchPagesQuery(**query).as_dict()
+        query_dict["moduleName"] = "list/ListPagesModule"
+        query_dict["module_body"] = module_body
+        per_page = query_dict.get("perPage") or PageConstants.DEFAULT_PER_PAGE
+        key = _SizeHints.key(site, query)
+        plans.append({"query": query_dict, "per_page": per_page, "key": key, "fetched": hints.get(key)})
+
+    def _bodies(plan: dict, start: int, stop: int) -> list[dict]:
+        base = plan["query"].get("offset", 0)
+        return [{**plan["query"], "offset": base + i * plan["per_page"]} for i in range(start, stop)]
+
+    # 1往復目: 各検索の先頭 + 前回の件数分の先読み
+    bodies = [body for plan in plans for body in _bodies(plan, 0, plan["fetched"])]
+    parsed = iter(_request(site, bodies, parser))
+    for plan in plans:
+        plan["parsed"] = [next(parsed) for _ in range(plan["fetched"])]
+        plan["total"] = plan["parsed"][0][0]
+
+    # 2往復目: 前回より増えた分
+    extra = [(plan, body) for plan in plans for body in _bodies(plan, plan["fetched"], plan["total"])]
+    if extra:
+        logger.info(f"ページ送りの追加取得: {len(extra)}件")
+        for (plan, _), result in zip(extra, _request(site, [body for _, body in extra], parser), strict=True):
+            plan["parsed"].append(result)
+
+    results = []
+    for plan in plans:
+        pages = [page for _, rows in plan["parsed"][: plan["total"]] for page in _build_pages(site, rows)]
+        results.append(PageCollection(site, pages))
+        hints.set(plan["key"], plan["total"])
+    hints.save()
+    return results
+
+
+def search(site, fields=("tags",), **query) -> PageCollection:
+    """宣言したフィールドだけを取得するListPages検索（site.pages.search の代替）"""
+    return search_many(site, [query], fields=fields)[0]
+
+
+# ----------
+# 分割検索
+# ----------
+
+# 互いに重ならない分割: 名前の頭文字（ListPagesのnameは % を任意の文字列として扱う）と、_で始まる隠しページ
+# （unix名は英小文字・数字・-・_ だけからなり、先頭の - は取り除かれる）
+PARTITIONS = [{"name": f"{c}%"} for c in "abcdefghijklmnopqrstuvwxyz0123456789"] + [{"pagetype": "hidden"}]
+# 前回のページ送り数がこれ以上の検索は分割する
+PARTITION_MIN_PAGES = 8
+
+
+def _count(site, query: dict) -> int:
+    """検索に一致するページ数（perPage=1の検索のページ送り数）"""
+    body = {**SearchPagesQuery(**query).as_dict(), "perPage": 1, "offset": 0}
+    body.update(moduleName="list/ListPagesModule", module_body=_module_body(BASE_FIELDS[:1]))
+    total, rows = _request(site, [body])[0]
+    return total if total > 1 else len(rows)
+
+
+def search_partitioned(site, fields=("tags",), **query) -> PageCollection:
+    """
+    検索を PARTITIONS ごとの検索に分けて並列に取得し、重複を除いてまとめる
+
+    各分割は件数が小さくoffsetが浅いため、前回の件数が分からなくても2往復で揃う。
+    取得の並列数はamc_requestの同時実行数（クライアントのsemaphore_limit）に従い、
+    処理時間の大半を占める応答の解析も同じ数（CPU数まで）のワーカープロセスで並列に行う。
+    分割しない検索の件数と照合し、足りなければ分割せずに取得し直す。結果の順序は保たない。
+    """
+    if "name" in query or "pagetype" in query or "offset" in query or "limit" in query:
+        return search(site, fields=fields, **query)
+
+    workers = min(site.client.amc_client.config.semaphore_limit, os.cpu_count() or 1)
+    parser = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            expected = executor.submit(_count, site, query)
+            slices = search_many(site, [{**query, **part} for part in PARTITIONS], fields=fields, parser=parser)
+            expected = expected.result()
+    finally:
+        if parser is not None:
+            parser.shutdown()
+
+    merged = list({page.fullname: page for collection in slices for page in collection}.values())
+    per_page = SearchPagesQuery(**query).as_dict().get("perPage") or PageConstants.DEFAULT_PER_PAGE
+    hints = _SizeHints()
+    hints.set(_SizeHints.key(site, query), math.ceil(expected / per_page))
+    hints.save()
+    if len(merged) < expected:
+        logger.warning(f"分割検索の件数が一致しません（{len(merged)} / {expected}件）。分割せずに取得し直します")
+        return search(site, fields=fields, **query)
+    logger.info(f"分割検索: {len(PARTITIONS)}分割, {len(merged)}件, 解析ワーカー{workers}")
+    # 分割しない検索の結果として記録し、カテゴリの一部やタグ条件で絞った検索にも使えるようにする
+    if _cache is not None:
+        _cache.store(site, query, _normalize_fields(fields), merged)
+    return PageCollection(site, merged)
+
+
+def search_all(site, fields=("tags",), **query) -> PageCollection:
+    """カテゴリ全体のような大きな検索。前回の件数が多ければ search_partitioned で取得する"""
+    if _SizeHints().get(_SizeHints.key(site, query)) >= PARTITION_MIN_PAGES:
+        return search_partitioned(site, fields=fields, **query)
+    return search(site, fields=fields, **query)
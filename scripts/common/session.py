@@ -0,0 +1,134 @@
+"""
+Wikidotクライアントの生成とログインセッションのキャッシュ
+
+ログインで得たWIKIDOT_SESSION_IDをディスクに保存し、次回以降の実行で再利用する。
+キャッシュが期限切れか、サイト側で無効と判定された場合のみ再ログインする。
+"""
+
+import json
+import logging
+import os
+from datetime import datetime, timedelta, UTC
+from pathlib import Path
+
+import wikidot
+from wikidot.connector.ajax import AjaxModuleConnectorConfig
+from wikidot.module.auth import HTTPAuthentication
+
+from .transport import TransportConfig, install
+
+logger = logging.getLogger(__name__)
+
+SESSION_COOKIE = "WIKIDOT_SESSION_ID"
+SESSION_MAX_AGE = timedelta(hours=24)
+# ログイン中のみ閲覧できる軽量なモジュール（セッションの有効性確認に使う）
+SESSION_CHECK_MODULE = "dashboard/messages/DMInboxModule"
+
+
+def session_cache_enabled() -> bool:
+    """キャッシュを使うか（SCP_JP_SESSION_CACHE=0 で無効、GitHub Actionsでは既定で無効）"""
+    default = "0" if os.environ.get("GITHUB_ACTIONS") == "true" else "1"
+    return os.environ.get("SCP_JP_SESSION_CACHE", default) != "0"
+
+
+def session_cache_path() -> Path:
+    cache_home = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    return cache_home / "scp-jp-scripts" / "session.json"
+
+
+class SessionCachingClient(wikidot.Client):
+    """
+    キャッシュしたセッションで動作するクライアント
+
+    ログアウトするとキャッシュしたセッションが無効になるため、終了時にログアウトしない。
+    """
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.is_logged_in = False
+        self.username = None
+
+    def attach_session(self, username: str, session_id: str) -> None:
+        self.amc_client.header.set_cookie(SESSION_COOKIE, session_id)
+        self.is_logged_in = True
+        self.username = username
+
+    def session_is_valid(self) -> bool:
+        """ログインが必要なモジュールを1回呼び、セッションが受け付けられるか確認"""
+        response = self.amc_client.request([{"moduleName": SESSION_CHECK_MODULE}], return_exceptions=True)[0]
+        return not isinstance(response, Exception)
+
+
+def _load_session(path: Path, username: str) -> str | None:
+    if not path.exists():
+        return None
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+    entry = data.get(username)
+    if not entry:
+        return None
+    saved_at = datetime.fromisoformat(entry["saved_at"])
+    if datetime.now(UTC) - saved_at > SESSION_MAX_AGE:
+        logger.info("キャッシュしたセッションは期限切れ")
+        return None
+    return entry["session_id"]
+
+
+def _save_session(path: Path, username: str, session_id: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+    data = {}
+    if path.exists():
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            data = {}
+    data[username] = {"session_id": session_id, "saved_at": datetime.now(UTC).isoformat()}
+
+    # 所有者のみ読み書きできるファイルとして作成してから書き込む
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.chmod(path, 0o600)
+
+
+def create_client(
+    username: str | None = None,
+    password: str | None = None,
+    amc_config: AjaxModuleConnectorConfig | None = None,
+) -> wikidot.Client:
+    """
+    Wikidotクライアントを生成
+
+    username/password指定時はキャッシュしたセッションを優先して使い、
+    無効な場合のみログインしてキャッシュを更新する。
+    通信は並列数に合わせた共有の接続プールを使う。
+    """
+    workers = amc_config.semaphore_limit if amc_config is not None else AjaxModuleConnectorConfig().semaphore_limit
+    install(TransportConfig.for_concurrency(workers))
+
+    if username is None or password is None:
+        return wikidot.Client(amc_config=amc_config)
+
+    if not session_cache_enabled():
+        return wikidot.Client(username=username, password=password, amc_config=amc_config)
+
+    path = session_cache_path()
+    client = SessionCachingClient(amc_config=amc_config)
+
+    session_id = _load_session(path, username)
+    if session_id is not None:
+        client.attach_session(username, session_id)
+        if client.session_is_valid():
+            logger.info("キャッシュしたセッションを再利用")
+            return client
+        logger.info("キャッシュしたセッションが無効のため再ログイン")
+        client.amc_client.header.delete_cookie(SESSION_COOKIE)
+
+    HTTPAuthentication.login(client, username, password)
+    client.attach_session(username, client.amc_client.header.cookie[SESSION_COOKIE])
+    _save_session(path, username, client.amc_client.header.cookie[SESSION_COOKIE])
+    return client
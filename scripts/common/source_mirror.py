@@ -0,0 +1,182 @@
+"""
+ページソースのローカルミラー
+
+サイトごとに以下の2ファイルで保持する:
+  - sources.bin : zlib圧縮したソースを追記していくBLOBファイル（mmapで読む）
+  - index.json  : fullname → {offset, length, revisions} のオフセットインデックス
+
+同期はListPagesの一覧で得たリビジョン数を比較し、変わったページのソースだけを取得する。
+"""
+
+import json
+import logging
+import mmap
+import re
+import zlib
+from collections.abc import Iterator
+from pathlib import Path
+
+from .paths import state_path
+from .search import search_all
+
+logger = logging.getLogger(__name__)
+
+SYNC_CHUNK_SIZE = 100
+# 無効になった領域がこの割合を超えたらBLOBファイルを詰め直す
+COMPACT_RATIO = 0.5
+
+
+def _category_of(fullname: str) -> str:
+    return fullname.split(":", 1)[0] if ":" in fullname else "_default"
+
+
+class SourceMirror:
+    """1サイト分のソースミラー"""
+
+    def __init__(self, site_name: str, root: Path | None = None):
+        self.site_name = site_name
+        self.root = root or state_path("mirror", site_name, "index.json").parent
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.blob_path = self.root / "sources.bin"
+        self.index_path = self.root / "index.json"
+        self.index: dict[str, dict] = {}
+        if self.index_path.exists():
+            self.index = json.loads(self.index_path.read_text(encoding="utf-8"))
+        self.blob_path.touch()
+        self._mmap: mmap.mmap | None = None
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, fullname: str) -> bool:
+        return fullname in self.index
+
+    def _save_index(self) -> None:
+        tmp = self.index_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.index, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        tmp.replace(self.index_path)
+
+    def _view(self) -> mmap.mmap | bytes:
+        if self._mmap is None:
+            if self.blob_path.stat().st_size == 0:
+                return b""
+            with open(self.blob_path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self) -> "SourceMirror":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ----------
+    # 読み出し
+    # ----------
+
+    def get(self, fullname: str) -> str | None:
+        entry = self.index.get(fullname)
+        if entry is None:
+            return None
+        view = self._view()
+        return zlib.decompress(view[entry["offset"] : entry["offset"] + entry["length"]]).decode("utf-8")
+
+    def items(self) -> Iterator[tuple[str, str]]:
+        """(fullname, source) をBLOBファイル内の順に返す"""
+        view = self._view()
+        for fullname, entry in sorted(self.index.items(), key=lambda kv: kv[1]["offset"]):
+            yield fullname, zlib.decompress(view[entry["offset"] : entry["offset"] + entry["length"]]).decode("utf-8")
+
+    def grep(self, pattern: str | re.Pattern, flags: int = 0) -> Iterator[tuple[str, int, str]]:
+        """正規表現に一致する行を (fullname, 行番号, 行) で返す"""
+        regex = re.compile(pattern, flags) if isinstance(pattern, str) else pattern
+        for fullname, source in self.items():
+            if regex.search(source) is None:
+                continue
+            for lineno, line in enumerate(source.split("\n"), start=1):
+                if regex.search(line):
+                    yield fullname, lineno, line
+
+    # ----------
+    # 同期
+    # ----------
+
+    def _append(self, sources: list[tuple[str, int, str]]) -> None:
+        """(fullname, revisions, source) をBLOBファイルに追記してインデックスを更新"""
+        self.close()
+        with open(self.blob_path, "ab") as f:
+            for fullname, revisions, source in sources:
+                blob = zlib.compress(source.encode("utf-8"), 6)
+                offset = f.tell()
+                f.write(blob)
+                self.index[fullname] = {"offset": offset, "length": len(blob), "revisions": revisions}
+        self._save_index()
+
+    def compact(self) -> None:
+        """無効になった領域を除いてBLOBファイルを詰め直す"""
+        self.close()
+        tmp = self.blob_path.with_suffix(".tmp")
+        new_index = {}
+        with open(self.blob_path, "rb") as src, open(tmp, "wb") as dst:
+            for fullname, entry in sorted(self.index.items(), key=lambda kv: kv[1]["offset"]):
+                src.seek(entry["offset"])
+                blob = src.read(entry["length"])
+                new_index[fullname] = {**entry, "offset": dst.tell()}
+                dst.write(blob)
+        tmp.replace(self.blob_path)
+        self.index = new_index
+        self._save_index()
+
+    def sync(self, site, category: str = "*", pages=None) -> dict:
+        """
+        リビジョン数が変わったページ・新規ページのソースだけを取得してミラーを更新
+
+        categoryはListPagesと同じ指定（スペース区切りで複数可）。一覧にないページの削除は
+        そのカテゴリ内のエントリに限る。pagesを渡した場合は一覧取得を省略する。
+        """
+        from wikidot.module.page import PageCollection
+
+        from .page_ids import get_page_ids
+
+        if pages is None:
+            pages = search_all(site, fields=("revisions_count",), category=category)
+        listed = {page.fullname: page for page in pages}
+
+        changed = [
+            page
+            for fullname, page in listed.items()
+            if self.index.get(fullname, {}).get("revisions") != page.revisions_count
+        ]
+        removed = [
+            fullname
+            for fullname in self.index
+            if fullname not in listed and (category == "*" or _category_of(fullname) in category.split())
+        ]
+        logger.info(f"{self.site_name}: 一覧 {len(listed)}件, 更新 {len(changed)}件, 削除 {len(removed)}件")
+
+        for fullname in removed:
+            del self.index[fullname]
+
+        for i in range(0, len(changed), SYNC_CHUNK_SIZE):
+            chunk = PageCollection(site, changed[i : i + SYNC_CHUNK_SIZE])
+            get_page_ids(site, chunk)
+            chunk.get_page_sources()
+            self._append([(page.fullname, page.revisions_count, page.source.wiki_text) for page in chunk])
+            for page in chunk:
+                page.source = None
+            logger.info(f"{self.site_name}: ソース取得 {min(i + SYNC_CHUNK_SIZE, len(changed))}/{len(changed)}")
+
+        self._save_index()
+
+        live = sum(entry["length"] for entry in self.index.values())
+        total = self.blob_path.stat().st_size
+        if total and (total - live) / total > COMPACT_RATIO:
+            logger.info(f"{self.site_name}: BLOBファイルを詰め直し ({total} -> {live} bytes)")
+            self.compact()
+
+        return {"listed": len(listed), "updated": len(changed), "removed": len(removed)}
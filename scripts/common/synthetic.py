@@ -0,0 +1,794 @@
+"""
+規模検証用の合成サイト
+
+generate_site はscp-jp / scp-jp-sandbox3 を模したページ群を乱数シードから決定的に生成する:
+  - 合作カテゴリ（COLLAB_CATEGORIES）: jp / 剪定対象-子 タグの欠落、低評価、剪定通知済みのページを一定割合で含む
+  - portal: initial_* タグの欠落・重複、非使用ユーザー、作成者不明のページを一定割合で含む
+  - 4000jpコンテストの参加記事: SCP-4000-JP を含むソース、フラグメント、記事間リンク、
+    parse_preferences の各書式で希望順位を書いた最初のポストを持つディスカッション
+  - scp-4000-jp-xxx を参照する一般記事（バックリンク）
+
+SyntheticWikidot は生成したサイトを共有トランスポート（common.transport）のバックエンドとして応答する
+代替サーバー。サイト情報・ログイン・ユーザー情報・ページID・ListPages・ソース・フォーラム・
+最近の更新・saveTags/renamePage/savePage を実装し、変更はメモリ上のサイトにだけ反映する（ファイルは書き換えない）。
+"""
+
+import asyncio
+import gzip
+import html
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from urllib.parse import parse_qsl, unquote
+
+import httpx
+
+from .paths import state_path
+from .rules import COLLAB_CATEGORIES, INACTIVE_USER_TAG, INITIAL_TAGS, NOTICE_TAG, get_initial_tag
+from .transport import get_transport
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+MAIN_SITE = "scp-jp"
+SANDBOX_SITE = "scp-jp-sandbox3"
+CONTEST_TAG = "4000jp"
+HUB_TAG = "ハブ"
+# collab_deletion/notice.py, exec.py の通知スレッド
+NOTICE_THREAD_ID = 12464623
+
+PER_PAGE_DEFAULT = 250
+POSTS_PER_PAGE = 20
+
+
+@dataclass(frozen=True)
+class SiteSize:
+    """生成するサイトの規模"""
+
+    portal: int = 1000
+    collab: int = 100  # 合作カテゴリごと
+    contest: int = 50
+    articles: int = 500
+    users: int = 500
+
+    def scaled(self, factor: float) -> "SiteSize":
+        return SiteSize(**{k: max(1, round(v * factor)) for k, v in asdict(self).items()})
+
+
+# ----------
+# 生成
+# ----------
+
+_SYLLABLES = [
+    "ka", "ki", "ku", "ke", "ko", "sa", "shi", "su", "se", "so", "ta", "chi", "tsu", "te", "to",
+    "na", "ni", "nu", "ne", "no", "ha", "hi", "fu", "he", "ho", "ma", "mi", "mu", "me", "mo",
+    "ya", "yu", "yo", "ra", "ri", "ru", "re", "ro", "wa", "n",
+]  # fmt: skip
+_TITLE_WORDS = ["記録", "夜", "海", "扉", "影", "図書館", "時計", "鏡", "階段", "駅", "標本", "手紙", "庭", "灯台", "残響"]
+_SENTENCES = [
+    "財団はこの現象について継続的な調査を行っている。",
+    "対象は標準的な収容手順に従って保管されている。",
+    "以下は回収された文書の抜粋である。",
+    "この記録は閲覧権限レベル3以上の職員に限定される。",
+    "補遺の内容は現在も精査中である。",
+    "観測された異常性は周期的に変化する。",
+    "関係者への聞き取り調査の結果を以下に示す。",
+]
+_REPLIES = ["拝読しました。", "面白かったです。", "設定の作り込みが良いですね。", "ナンバーの希望、了解しました。", "+1しました。"]
+
+
+class _Generator:
+    def __init__(self, size: SiteSize, seed: int):
+        self.size = size
+        self.rng = random.Random(seed)
+        self.now = int(time.time())
+        self.next_id = {"page": 1_000_000, "thread": 10_000_000, "post": 50_000_000}
+        self.used_names: set[str] = set()
+        self.users = [self._user(i) for i in range(size.users)]
+
+    def _id(self, kind: str) -> int:
+        self.next_id[kind] += 1
+        return self.next_id[kind]
+
+    def _word(self, syllables: tuple[int, int] = (2, 4)) -> str:
+        return "".join(self.rng.choice(_SYLLABLES) for _ in range(self.rng.randint(*syllables)))
+
+    def _unique(self, prefix: str) -> str:
+        while True:
+            name = f"{prefix}{self._word()}"
+            if self.rng.random() < 0.3:
+                name += f"-{self.rng.randint(1, 99)}"
+            if name not in self.used_names:
+                self.used_names.add(name)
+                return name
+
+    def _user(self, index: int) -> dict:
+        name = self._word((2, 5))
+        # 一部は頭文字が英数字以外（initial_null）
+        if self.rng.random() < 0.05:
+            name = self.rng.choice("_-") + name
+        elif self.rng.random() < 0.05:
+            name = f"{self.rng.randint(0, 9)}{name}"
+        return {"id": 100_000 + index, "unix_name": f"{name}{index}", "name": f"{name.capitalize()}{index}"}
+
+    def _timestamp(self, max_age_days: int = 365 * 5) -> int:
+        return self.now - self.rng.randint(0, max_age_days * 86400)
+
+    def _author(self) -> int:
+        return self.rng.randrange(len(self.users))
+
+    def _text(self, min_sentences: int, max_sentences: int) -> str:
+        return "\n\n".join(self.rng.choice(_SENTENCES) for _ in range(self.rng.randint(min_sentences, max_sentences)))
+
+    def _page(self, fullname: str, title: str, tags: list[str], source: str, **extra) -> dict:
+        page = {
+            "id": self._id("page"),
+            "fullname": fullname,
+            "title": title,
+            "tags": tags,
+            "rating": 0,
+            "votes": 0,
+            "created_by": self._author(),
+            "created_at": self._timestamp(),
+            "revisions": self.rng.randint(1, 30),
+            "source": source,
+            "thread": None,
+        }
+        page.update(extra)
+        return page
+
+    def _rating(self, mean: float, sd: float) -> tuple[int, int]:
+        rating = round(self.rng.gauss(mean, sd))
+        votes = abs(rating) + self.rng.randint(0, 20)
+        return rating, votes
+
+    def _printable_title(self) -> str:
+        return "".join(self.rng.choice(_TITLE_WORDS) for _ in range(self.rng.randint(1, 3)))
+
+    # ----- scp-jp -----
+
+    def collab_pages(self) -> list[dict]:
+        pages = []
+        for category in COLLAB_CATEGORIES:
+            pages.append(self._page(f"{category}:_template", "テンプレート", [], "%%content%%", created_by=None))
+            for _ in range(self.size.collab):
+                roll = self.rng.random()
+                # 約8割はタグ付与済み、残りはどちらかまたは両方が欠けている
+                tags = ["jp", "剪定対象-子"] if roll < 0.8 else (["jp"] if roll < 0.9 else [])
+                tags += self.rng.sample(["tale", "goi-format", "記録", "合作", "お題"], self.rng.randint(0, 2))
+                rating, votes = self._rating(8, 7)
+                if self.rng.random() < 0.03:
+                    tags.append(NOTICE_TAG)
+                    rating, votes = self._rating(-3, 2)
+                pages.append(
+                    self._page(
+                        f"{category}:{self._unique('')}",
+                        self._printable_title(),
+                        tags,
+                        self._text(3, 40),
+                        rating=rating,
+                        votes=votes,
+                    )
+                )
+        return pages
+
+    def contest_pages(self) -> tuple[list[dict], list[dict]]:
+        entries = [f"scp-4000-jp-{self._unique('')}" for _ in range(self.size.contest)]
+        pages = [
+            self._page("scp-4000-jp", "SCP-4000-JP", [CONTEST_TAG], "[[include :scp-jp:component:placeholder]]"),
+            self._page(
+                "scp-4000-jp-hub",
+                "SCP-4000-JPコンテスト ハブ",
+                [CONTEST_TAG, HUB_TAG],
+                "\n".join(f"* [[[{name}]]]" for name in entries),
+            ),
+        ]
+        threads = []
+        for name in entries:
+            lines = [
+                "[[include :scp-jp:component:license-box]]",
+                "**アイテム番号:** SCP-4000-JP",
+                "**オブジェクトクラス:** " + self.rng.choice(["Safe", "Euclid", "Keter", "Thaumiel"]),
+                self._text(5, 60),
+                f"[[image http://scp-jp.wikidot.com/local--files/{name}/scp-4000-jp.jpg]]",
+            ]
+            if self.rng.random() < 0.3:
+                lines.append(f"[[include fragment:{name}-1]]")
+            for other in self.rng.sample(entries, min(len(entries), self.rng.randint(0, 2))):
+                lines.append(f"[[[{other}|関連するSCP-4000-JP]]]")
+            lines.append("« [[[SCP-3999-JP]]] | SCP-4000-JP | [[[SCP-4001-JP]]] »")
+            rating, votes = self._rating(15, 12)
+            page = self._page(
+                name,
+                f"SCP-4000-JP - {self._printable_title()}" if self.rng.random() < 0.9 else self._printable_title(),
+                [CONTEST_TAG, "scp", "jp", "_cc"] + self.rng.sample(["euclid", "keter", "safe", "人型"], 1),
+                "\n\n".join(lines),
+                rating=rating,
+                votes=votes,
+                created_at=self._timestamp(30),
+            )
+            # 一部の参加記事にはディスカッションがない
+            if self.rng.random() < 0.95:
+                thread = self._thread(f"{name} のディスカッション", page, self._preference_post())
+                page["thread"] = thread["id"]
+                threads.append(thread)
+            pages.append(page)
+        return pages, threads
+
+    def article_pages(self, contest: list[dict]) -> list[dict]:
+        entries = [p["fullname"] for p in contest if p["fullname"].startswith("scp-4000-jp-") and p["thread"]]
+        pages = []
+        for i in range(self.size.articles):
+            lines = [self._text(3, 40)]
+            # 一部の一般記事はコンテスト参加記事を参照する
+            if entries and self.rng.random() < 0.1:
+                lines.append(f"関連: [[[{self.rng.choice(entries)}]]]")
+            rating, votes = self._rating(20, 15)
+            pages.append(
+                self._page(
+                    f"scp-{i + 1:03d}-jp",
+                    f"SCP-{i + 1:03d}-JP",
+                    ["scp", "jp"],
+                    "\n\n".join(lines),
+                    rating=rating,
+                    votes=votes,
+                )
+            )
+        return pages
+
+    def _preference_post(self) -> str:
+        numbers = [f"4{self.rng.randint(0, 999):03d}" for _ in range(5)]
+        style = self.rng.randrange(5)
+        if style == 0:
+            body = "<br/>\n".join(f"<strong>第{i}希望:</strong> SCP-{n}-JP" for i, n in enumerate(numbers, 1))
+        elif style == 1:
+            body = "<br/>\n".join(f"第{i}希望: SCP-{n}-JP" for i, n in enumerate(numbers, 1))
+        elif style == 2:
+            body = "<br/>\n".join(f"{i}: {n}" for i, n in enumerate(numbers, 1))
+        elif style == 3:
+            body = "<br/>\n".join(f"第{i}希望: SCP-{n}-JP" for i, n in enumerate(numbers[:2], 1))
+            body += "<br/>\n第3希望: 4X00最小<br/>\n以下、残存の中で最も小さい番号"
+        else:
+            body = f"第1希望: SCP-{numbers[0]}-JP<br/>\n第2希望～: 利用可能なSCP-411X-JPのうち最も若い番号"
+        return f"<p>ナンバーの希望です。</p>\n<p>{body}</p>\n<p>よろしくお願いします。</p>"
+
+    def _thread(self, title: str, page: dict | None, first_post: str) -> dict:
+        created_by = page["created_by"] if page and page["created_by"] is not None else self._author()
+        created_at = page["created_at"] if page else self._timestamp()
+        posts = [
+            {"id": self._id("post"), "title": "", "text": first_post, "created_by": created_by, "created_at": created_at}
+        ]
+        for _ in range(self.rng.randint(0, 6)):
+            posts.append(
+                {
+                    "id": self._id("post"),
+                    "title": "",
+                    "text": f"<p>{self.rng.choice(_REPLIES)}</p>",
+                    "created_by": self._author(),
+                    "created_at": created_at + self.rng.randint(60, 86400 * 7),
+                }
+            )
+        return {
+            "id": self._id("thread"),
+            "title": title,
+            "description": "",
+            "created_by": created_by,
+            "created_at": created_at,
+            "posts": posts,
+        }
+
+    def notice_thread(self) -> dict:
+        thread = self._thread("剪定対象合作の削除通知", None, "<p>剪定対象合作の削除通知はこのスレッドで行います。</p>")
+        thread["id"] = NOTICE_THREAD_ID
+        for months_ago in range(1, 4):
+            created_at = self.now - months_ago * 30 * 86400
+            year_month = time.strftime("%Y/%m", time.localtime(created_at))
+            thread["posts"].append(
+                {
+                    "id": self._id("post"),
+                    "title": f"剪定対象合作の削除通知のお知らせ({year_month})",
+                    "text": "<p>以下の剪定対象合作に削除通知タグを付与しました。</p>",
+                    "created_by": self._author(),
+                    "created_at": created_at,
+                }
+            )
+        return thread
+
+    # ----- scp-jp-sandbox3 -----
+
+    def portal_pages(self) -> list[dict]:
+        pages = [self._page("portal:_template", "テンプレート", [], "%%content%%", created_by=None)]
+        for _ in range(self.size.portal):
+            author = self._author()
+            tags = [get_initial_tag(self.users[author]["unix_name"])]
+            roll = self.rng.random()
+            if roll < 0.1:
+                tags = []  # initial_* タグ未付与
+            elif roll < 0.13:
+                tags.append(self.rng.choice(INITIAL_TAGS))  # initial_* タグが複数
+            elif roll < 0.23:
+                tags.append(INACTIVE_USER_TAG)  # 非使用ユーザー（initial_* が残っている）
+            elif roll < 0.25:
+                author = None  # 作成者不明
+                tags = []
+            pages.append(
+                self._page(
+                    f"portal:{self._unique('')}",
+                    f"{self._printable_title()}のポータル",
+                    tags,
+                    "[[include :scp-jp-sandbox3:component:portal]]\n" + self._text(1, 5),
+                    created_by=author,
+                )
+            )
+        return pages
+
+    def build(self) -> dict:
+        contest, threads = self.contest_pages()
+        main_pages = self.collab_pages() + contest + self.article_pages(contest)
+        return {
+            "version": FORMAT_VERSION,
+            "size": asdict(self.size),
+            "users": self.users,
+            "sites": {
+                MAIN_SITE: {
+                    "id": 578002,
+                    "title": "SCP財団",
+                    "pages": main_pages,
+                    "threads": threads + [self.notice_thread()],
+                },
+                SANDBOX_SITE: {
+                    "id": 3396310,
+                    "title": "SCP-JP Sandbox III",
+                    "pages": self.portal_pages(),
+                    "threads": [],
+                },
+            },
+        }
+
+
+def generate_site(size: SiteSize, seed: int = 0) -> dict:
+    """規模と乱数シードから合成サイトを生成（同じ引数なら同じ内容）"""
+    return _Generator(size, seed).build()
+
+
+def save_site(data: dict, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def load_site(path: Path) -> dict:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != FORMAT_VERSION:
+        raise ValueError(f"未対応の合成サイト形式: {path}")
+    return data
+
+
+def rename_input(data: dict, seed: int = 0) -> str:
+    """rename_4000jp.py の入力TSV（コンテスト参加記事への番号割り当て）"""
+    rng = random.Random(seed)
+    entries = [p["fullname"] for p in data["sites"][MAIN_SITE]["pages"] if p["fullname"].startswith("scp-4000-jp-")]
+    entries = [name for name in entries if name != "scp-4000-jp-hub"]
+    numbers = rng.sample(range(4001, 4001 + max(999, len(entries) * 2)), len(entries))
+    lines = ["ナンバー\tページ名"] + [f"{num}\t{name}" for num, name in zip(numbers, entries, strict=True)]
+    return "\n".join(lines) + "\n"
+
+
+# ----------
+# 代替サーバー
+# ----------
+
+_SET_KEY_PATTERN = re.compile(r'\[\[span class="set ([a-z_]+)"\]\]')
+_NORENDER_SUFFIX = "/norender/true/noredirect/true"
+# ListPagesの結果（offset・perPage以外）を決める条件
+_LISTING_KEYS = ("pagetype", "category", "tags", "fullname", "name", "order", "limit")
+
+
+class _SiteState:
+    """1サイト分のページ・スレッド（ListPagesの結果はサイトが変わるまでキャッシュ）"""
+
+    def __init__(self, unix_name: str, data: dict):
+        self.unix_name = unix_name
+        self.id = data["id"]
+        self.title = data["title"]
+        self.pages_by_id = {page["id"]: page for page in data["pages"]}
+        self.pages_by_name = {page["fullname"]: page for page in data["pages"]}
+        self.threads = {thread["id"]: thread for thread in data["threads"]}
+        self.version = 0
+        # 最近の更新（古い順）。生成時点のページは作成だけを記録する。changed_byがNoneならログイン中のアカウント
+        self.changes = sorted(
+            (
+                {"at": p["created_at"], "page": p["id"], "flags": "N", "revision": 0, "changed_by": p["created_by"]}
+                for p in data["pages"]
+            ),
+            key=lambda c: (c["at"], c["page"]),
+        )
+        self._listings: dict[tuple, tuple[int, list[dict]]] = {}
+
+    def listing(self, query: dict) -> list[dict]:
+        key = tuple(query.get(k) for k in _LISTING_KEYS)
+        cached = self._listings.get(key)
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+        pages = [page for page in self.pages_by_id.values() if _matches(page, query)]
+        field, _, direction = query.get("order", "created_at desc").partition(" ")
+        field = field if field in ("created_at", "fullname", "title", "rating") else "created_at"
+        pages.sort(key=lambda p: (p[field], p["id"]), reverse=direction.strip() == "desc")
+        if query.get("limit"):
+            pages = pages[: int(query["limit"])]
+        self._listings[key] = (self.version, pages)
+        return pages
+
+    def rename(self, page: dict, new_name: str) -> bool:
+        if new_name in self.pages_by_name:
+            return False
+        del self.pages_by_name[page["fullname"]]
+        page["fullname"] = new_name
+        self.pages_by_name[new_name] = page
+        self.version += 1
+        self.record_change(page, "R")
+        return True
+
+    def record_change(self, page: dict, flags: str, changed_by: int | None = None) -> None:
+        entry = {"at": int(time.time()), "page": page["id"], "flags": flags, "revision": page["revisions"]}
+        self.changes.append({**entry, "changed_by": changed_by})
+
+
+def _category(fullname: str) -> str:
+    return fullname.split(":", 1)[0] if ":" in fullname else "_default"
+
+
+def _name(fullname: str) -> str:
+    return fullname.split(":", 1)[1] if ":" in fullname else fullname
+
+
+def _like(value: str, pattern: str) -> bool:
+    """ListPagesの name/fullname 条件（% は任意の文字列）"""
+    return re.fullmatch(".*".join(re.escape(part) for part in pattern.split("%")), value) is not None
+
+
+def _matches(page: dict, query: dict) -> bool:
+    fullname = page["fullname"]
+    pagetype = query.get("pagetype", "*")
+    if pagetype != "*" and _name(fullname).startswith("_") != (pagetype == "hidden"):
+        return False
+    categories = query.get("category", "*").split()
+    if "*" not in categories and _category(fullname) not in categories:
+        return False
+    if "fullname" in query and not _like(fullname, query["fullname"]):
+        return False
+    if "name" in query and not _like(_name(fullname), query["name"]):
+        return False
+    if query.get("tags"):
+        tags = set(page["tags"])
+        any_of = []
+        for term in query["tags"].split():
+            if term.startswith("+"):
+                if term[1:] not in tags:
+                    return False
+            elif term.startswith("-"):
+                if term[1:] in tags:
+                    return False
+            else:
+                any_of.append(term)
+        if any_of and tags.isdisjoint(any_of):
+            return False
+    return True
+
+
+class SyntheticWikidot:
+    """合成サイトを応答するトランスポートのバックエンド（ネットワークに接続しない）"""
+
+    def __init__(self, path: Path, latency: float = 0.0):
+        self.path = path
+        self.latency = latency
+        started = time.perf_counter()
+        data = load_site(path)
+        self.users = data["users"]
+        self.users_by_name = {user["unix_name"]: user for user in self.users}
+        self.sites = {name: _SiteState(name, site) for name, site in data["sites"].items()}
+        self.requests: Counter[str] = Counter()
+        self.account = "synthetic"
+        self._lock = threading.Lock()
+        # 起動時間の計測用（合成サイトの読み込み時間と、最初のリクエストを受けた時刻）
+        self.load_seconds = time.perf_counter() - started
+        self.first_request_at: float | None = None
+
+    # ----- HTML -----
+
+    def _printuser(self, index: int | None) -> str:
+        if index is None:
+            return ""
+        user = self.users[index]
+        name = html.escape(user["name"])
+        link = (
+            f'href="http://www.wikidot.com/user:info/{user["unix_name"]}" '
+            f'onclick="WIKIDOT.page.listeners.userInfo({user["id"]}); return false;"'
+        )
+        avatar = f'<img class="small" src="https://www.wikidot.com/avatar.php?userid={user["id"]}" alt="{name}"/>'
+        return f'<span class="printuser avatarhover"><a {link}>{avatar}</a><a {link}>{name}</a></span>'
+
+    def _account_printuser(self) -> str:
+        name = html.escape(self.account)
+        unix_name = re.sub(r"[^a-z0-9]+", "-", self.account.lower())
+        return f'<span class="printuser"><a href="http://www.wikidot.com/user:info/{unix_name}">{name}</a></span>'
+
+    @staticmethod
+    def _odate(timestamp: int | None) -> str:
+        if timestamp is None:
+            return ""
+        text = time.strftime("%d %b %Y %H:%M", time.gmtime(timestamp))
+        return f'<span class="odate time_{timestamp} format_%25e%20%25b%20%25Y">{text}</span>'
+
+    @staticmethod
+    def _pager(current: int, total: int) -> str:
+        if total <= 1:
+            return ""
+        # Wikidotと同じく先頭・現在の前後・末尾だけを表示する
+        shown = sorted({1, total, *range(max(current - 2, 1), min(current + 2, total) + 1)})
+        targets = "".join(
+            f'<span class="target current">{i}</span>' if i == current else f'<span class="target"><a href="#">{i}</a></span>'
+            for i in shown
+        )
+        return (
+            f'<div class="pager"><span class="pager-no">page {current} of {total}</span>{targets}'
+            '<span class="target"><a href="#">next »</a></span></div>'
+        )
+
+    def _field(self, site: _SiteState, page: dict, key: str) -> str:
+        fullname = page["fullname"]
+        thread = site.threads.get(page["thread"]) if page["thread"] else None
+        values = {
+            "fullname": lambda: fullname,
+            "category": lambda: _category(fullname),
+            "name": lambda: _name(fullname),
+            "title": lambda: html.escape(page["title"]),
+            "created_at": lambda: self._odate(page["created_at"]),
+            "created_by_linked": lambda: self._printuser(page["created_by"]),
+            "updated_at": lambda: self._odate(page["created_at"]),
+            "updated_by_linked": lambda: self._printuser(page["created_by"]),
+            "commented_at": lambda: self._odate(thread["posts"][-1]["created_at"]) if thread else "",
+            "commented_by_linked": lambda: self._printuser(thread["posts"][-1]["created_by"]) if thread else "",
+            "parent_fullname": lambda: "",
+            "comments": lambda: str(len(thread["posts"])) if thread else "0",
+            "size": lambda: str(len(page["source"].encode("utf-8"))),
+            "children": lambda: "0",
+            "rating_votes": lambda: str(page["votes"]),
+            "rating": lambda: str(page["rating"]),
+            "rating_percent": lambda: "",
+            "revisions": lambda: str(page["revisions"]),
+            "tags": lambda: " ".join(t for t in page["tags"] if not t.startswith("_")),
+            "_tags": lambda: " ".join(t for t in page["tags"] if t.startswith("_")),
+        }
+        value = values[key]() if key in values else ""
+        return f'<span class="set {key}"><span class="name"> {key} </span><span class="value"> {value} </span></span>'
+
+    def _list_pages(self, site: _SiteState, query: dict) -> str:
+        per_page = int(query.get("perPage") or PER_PAGE_DEFAULT)
+        offset = int(query.get("offset") or 0)
+        keys = _SET_KEY_PATTERN.findall(query.get("module_body", ""))
+        with self._lock:
+            pages = site.listing(query)
+        total = max(1, -(-len(pages) // per_page))
+        rows = [
+            '<div class="page">' + "".join(self._field(site, page, key) for key in keys) + "</div>"
+            for page in pages[offset : offset + per_page]
+        ]
+        return f'<div class="list-pages-box">{"".join(rows)}{self._pager(offset // per_page + 1, total)}</div>'
+
+    def _thread_info(self, thread: dict) -> str:
+        return (
+            '<div class="forum-thread-box">'
+            '<div class="forum-breadcrumbs"><a href="/forum/start">フォーラム</a> » '
+            f'<a href="/forum/c-1">ディスカッション</a> » {html.escape(thread["title"])}</div>'
+            f'<div class="description-block well">{html.escape(thread["description"])}</div>'
+            f'<div class="statistics">作成者: {self._printuser(thread["created_by"])}<br/>'
+            f"作成日時: {self._odate(thread['created_at'])}<br/>投稿数: {len(thread['posts'])}<br/></div>"
+            f'</div><script type="text/javascript">WIKIDOT.forumThreadId = {thread["id"]};</script>'
+        )
+
+    def _thread_posts(self, thread: dict, page_no: int) -> str:
+        posts = thread["posts"]
+        total = max(1, -(-len(posts) // POSTS_PER_PAGE))
+        rows = [
+            f'<div class="post-container" id="fpc-{post["id"]}">'
+            f'<div class="post" id="post-{post["id"]}"><div class="long">'
+            f'<div class="head"><div class="title">{html.escape(post["title"])}</div>'
+            f'<div class="info">{self._printuser(post["created_by"])} {self._odate(post["created_at"])}</div></div>'
+            f'<div class="content">{post["text"]}</div></div></div></div>'
+            for post in posts[(page_no - 1) * POSTS_PER_PAGE : page_no * POSTS_PER_PAGE]
+        ]
+        return f'<div id="thread-container-posts">{"".join(rows)}</div>{self._pager(page_no, total)}'
+
+    def _backlinks(self, site: _SiteState, page: dict) -> str:
+        pattern = re.compile(rf"\[\[\[{re.escape(page['fullname'])}(?:\||\]\]\])", re.IGNORECASE)
+        referrers = [p["fullname"] for p in site.pages_by_id.values() if p is not page and pattern.search(p["source"])]
+        return "<ul>" + "".join(f'<li><a href="/{name}">{name}</a></li>' for name in referrers) + "</ul>"
+
+    def _site_changes(self, site: _SiteState, per_page: int, page_no: int) -> str:
+        end = len(site.changes) - (page_no - 1) * per_page
+        rows = []
+        for change in reversed(site.changes[max(end - per_page, 0) : max(end, 0)]):
+            page = site.pages_by_id[change["page"]]
+            by = change["changed_by"]
+            printuser = self._account_printuser() if by is None else self._printuser(by)
+            rows.append(
+                '<div class="changes-list-item"><table><tr>'
+                f'<td class="title"><a href="/{page["fullname"]}">{html.escape(page["title"])}</a></td>'
+                f'<td class="flags">{"".join(f"<span>{flag}</span>" for flag in change["flags"])}</td>'
+                f'<td class="mod-date">{self._odate(change["at"])}</td>'
+                f'<td class="revision-no">(rev. {change["revision"]})</td>'
+                f'<td class="mod-by">{printuser}</td></tr></table></div>'
+            )
+        total = -(-len(site.changes) // per_page)
+        return "".join(rows) + self._pager(page_no, total)
+
+    # ----- AMC -----
+
+    def _amc(self, site: _SiteState | None, body: dict) -> tuple[str, dict]:
+        module, action, event = body.get("moduleName", ""), body.get("action"), body.get("event")
+        kind = f"{action}.{event}" if action else module
+        if site is None:
+            return kind, {"status": "ok", "body": ""}
+
+        page_id = body.get("pageId") or body.get("page_id")
+        page = site.pages_by_id.get(int(page_id)) if page_id else None
+        if page_id and page is None:
+            return kind, {"status": "no_page", "message": "Page does not exist."}
+
+        if module == "list/ListPagesModule":
+            return kind, {"status": "ok", "body": self._list_pages(site, body)}
+        if module == "viewsource/ViewSourceModule":
+            return kind, {"status": "ok", "body": f'<div class="page-source">{html.escape(page["source"])}</div>'}
+        if module == "changes/SiteChangesListModule":
+            body = self._site_changes(site, int(body.get("perpage") or 20), int(body.get("page") or 1))
+            return kind, {"status": "ok", "body": body}
+        if module == "backlinks/BacklinksModule":
+            return kind, {"status": "ok", "body": self._backlinks(site, page)}
+        if module == "forum/ForumCommentsListModule":
+            body = '<div id="thread-container"></div>'
+            if page["thread"]:
+                body += f'<script type="text/javascript">WIKIDOT.forumThreadId = {page["thread"]};</script>'
+            return kind, {"status": "ok", "body": body}
+        if module in ("forum/ForumViewThreadModule", "forum/ForumViewThreadPostsModule"):
+            thread = site.threads.get(int(body["t"]))
+            if thread is None:
+                return kind, {"status": "no_thread", "message": "Thread does not exist."}
+            if module == "forum/ForumViewThreadModule":
+                return kind, {"status": "ok", "body": self._thread_info(thread)}
+            return kind, {"status": "ok", "body": self._thread_posts(thread, int(body.get("pageNo") or 1))}
+        if module == "edit/PageEditModule":
+            existing = site.pages_by_name.get(body.get("wiki_page", ""))
+            response = {"status": "ok", "lock_id": 1, "lock_secret": "synthetic"}
+            if existing is not None:
+                response["page_revision_id"] = existing["revisions"]
+            return kind, response
+
+        with self._lock:
+            if (action, event) == ("WikiPageAction", "saveTags"):
+                page["tags"] = body.get("tags", "").split()
+                page["revisions"] += 1
+                site.version += 1
+                site.record_change(page, "A")
+            elif (action, event) == ("WikiPageAction", "renamePage"):
+                if not site.rename(page, body["new_name"]):
+                    return kind, {"status": "page_exists", "message": "The page already exists."}
+            elif (action, event) == ("WikiPageAction", "savePage"):
+                existing = site.pages_by_name.get(body["wiki_page"])
+                if existing is not None:
+                    existing.update(title=body.get("title", existing["title"]), source=body.get("source", ""))
+                    existing["revisions"] += 1
+                    site.record_change(existing, "S")
+                site.version += 1
+            elif (action, event) == ("ForumAction", "savePost"):
+                thread = site.threads[int(body["threadId"])]
+                thread["posts"].append(
+                    {
+                        "id": 90_000_000 + len(thread["posts"]),
+                        "title": body.get("title", ""),
+                        "text": body.get("source", ""),
+                        "created_by": 0,
+                        "created_at": int(time.time()),
+                    }
+                )
+        return kind, {"status": "ok", "body": ""}
+
+    # ----- ルーティング -----
+
+    def _site_of(self, host: str) -> _SiteState | None:
+        return self.sites.get(host.removesuffix(".wikidot.com"))
+
+    def _dispatch(self, request: httpx.Request) -> tuple[str, httpx.Response]:
+        host, path = request.url.host, unquote(request.url.path)
+
+        if host in ("discord.com", "discordapp.com"):
+            return "discord", httpx.Response(204, request=request)
+
+        if path == "/ajax-module-connector.php":
+            body = dict(parse_qsl(request.content.decode("utf-8"), keep_blank_values=True))
+            kind, payload = self._amc(self._site_of(host), body)
+            return f"amc:{kind}", httpx.Response(200, json=payload, request=request)
+
+        if host == "www.wikidot.com":
+            if path.startswith("/default--flow/login"):
+                login = dict(parse_qsl(request.content.decode("utf-8"))).get("login")
+                self.account = login or self.account
+                headers = {"set-cookie": "WIKIDOT_SESSION_ID=synthetic; Path=/; Domain=.wikidot.com"}
+                return "login", httpx.Response(200, headers=headers, text="", request=request)
+            if path.startswith("/user:info/"):
+                user = self.users_by_name.get(path.removeprefix("/user:info/"))
+                if user is None:
+                    text = '<div class="error-block">User does not exist.</div>'
+                    return "user", httpx.Response(200, text=text, request=request)
+                text = (
+                    f'<h1 class="profile-title">{html.escape(user["name"])}</h1>'
+                    '<a class="btn btn-default btn-xs" '
+                    f'href="http://www.wikidot.com/account/messages#/new/{user["id"]}">PM</a>'
+                )
+                return "user", httpx.Response(200, text=text, request=request)
+
+        site = self._site_of(host)
+        if site is None:
+            raise httpx.ConnectError(f"合成サイトにないホスト: {host}", request=request)
+
+        if path in ("", "/"):
+            text = (
+                f"<html><head><title>{html.escape(site.title)}</title><script>"
+                f"WIKIREQUEST.info.siteId = {site.id};"
+                f'WIKIREQUEST.info.siteUnixName = "{site.unix_name}";'
+                f'WIKIREQUEST.info.domain = "{site.unix_name}.wikidot.com";'
+                "</script></head><body></body></html>"
+            )
+            return "site", httpx.Response(200, text=text, request=request)
+
+        page = site.pages_by_name.get(path.strip("/").removesuffix(_NORENDER_SUFFIX))
+        if page is None:
+            return "page", httpx.Response(404, text="", request=request)
+        text = f"<script>WIKIREQUEST.info.pageId = {page['id']};</script>"
+        return "page", httpx.Response(200, text=text, request=request)
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        if self.first_request_at is None:
+            self.first_request_at = time.time()
+        kind, response = self._dispatch(request)
+        with self._lock:
+            self.requests[kind] += 1
+        return response
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._handle(request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._handle(request)
+
+    def close(self) -> None:
+        total = sum(self.requests.values())
+        stats = {
+            "site": str(self.path),
+            "latency": self.latency,
+            "requests": total,
+            "by_kind": dict(self.requests.most_common()),
+            "load_seconds": round(self.load_seconds, 4),
+            "first_request_at": self.first_request_at,
+        }
+        path = state_path("synthetic", "stats.json")
+        path.write_text(json.dumps(stats, ensure_ascii=False, indent=1), encoding="utf-8")
+        logger.info(f"合成サイト: {self.path} (応答 {total}件)")
+
+
+def start_synthetic(path: Path, latency: float = 0.0) -> SyntheticWikidot:
+    server = SyntheticWikidot(path, latency=latency)
+    get_transport().set_backend(server)
+    return server
@@ -0,0 +1,306 @@
+"""
+タグの転置インデックス
+
+サイトごとに タグ → ページのビットマップ を .state/tag_index/<site>.json に保持し、
+ListPagesと同じtags条件（+必須 -除外 それ以外はいずれか）を手元でAND / ANDNOT / ORとして評価する。
+ビットマップはPythonのintで、ページにはインデックス内の通し番号を割り当てる
+（ListPagesの一覧からはページIDが得られないため）。保存時はzlibで圧縮する。
+
+インデックスは一覧（search_all）から作り、以降は最近の更新のうち新規作成・タグの変更があったページだけを
+読み直して更新する。リネーム（削除を含む）があったとき、更新を遡り切れなかったとき、
+MAX_AGEを過ぎたときは作り直す。
+"""
+
+import base64
+import json
+import logging
+import time
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+
+from .paths import state_path
+from .recent_changes import FLAG_NEW, FLAG_RENAMED, FLAG_TAGS, ChangeFeed
+from .search import FIELD_KEYS, search_all, search_many
+
+logger = logging.getLogger(__name__)
+
+# これより古いインデックスは一覧から作り直す（秒）
+MAX_AGE = 24 * 60 * 60
+FORMAT_VERSION = 1
+
+
+def _category_of(fullname: str) -> str:
+    return fullname.split(":", 1)[0] if ":" in fullname else "_default"
+
+
+def _covers(categories: str, category: str) -> bool:
+    """categories（ListPagesのcategory指定）の一覧にcategoryの一覧が含まれるか"""
+    if categories == "*":
+        return True
+    return category != "*" and set(category.split()) <= set(categories.split())
+
+
+def _merge(categories: str, category: str) -> str:
+    if "*" in (categories, category):
+        return "*"
+    return " ".join(sorted(set(categories.split()) | set(category.split())))
+
+
+def _encode(bitmap: int) -> str:
+    return base64.b64encode(zlib.compress(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little"))).decode("ascii")
+
+
+def _decode(data: str) -> int:
+    return int.from_bytes(zlib.decompress(base64.b64decode(data)), "little")
+
+
+@dataclass(frozen=True)
+class TagQuery:
+    """ListPagesのtags条件（scriptsの tags=[...] と同じ書式）"""
+
+    required: frozenset[str] = frozenset()
+    excluded: frozenset[str] = frozenset()
+    any_of: frozenset[str] = frozenset()
+
+    @classmethod
+    def parse(cls, tags: str | list[str]) -> "TagQuery":
+        """ "+4000jp -ハブ" / ["+4000jp", "-ハブ"] を解釈する（= による完全一致は扱わない）"""
+        terms = tags.split() if isinstance(tags, str) else [term for tag in tags for term in tag.split()]
+        required, excluded, any_of = set(), set(), set()
+        for term in terms:
+            if term.startswith("=") or term in ("+", "-"):
+                raise ValueError(f"タグインデックスで評価できないタグ条件です: {term}")
+            if term.startswith("+"):
+                required.add(term[1:])
+            elif term.startswith("-"):
+                excluded.add(term[1:])
+            else:
+                any_of.add(term)
+        return cls(frozenset(required), frozenset(excluded), frozenset(any_of))
+
+    def matches(self, tags) -> bool:
+        tags = set(tags)
+        if not self.required <= tags or not tags.isdisjoint(self.excluded):
+            return False
+        return not self.any_of or not tags.isdisjoint(self.any_of)
+
+
+class TagIndex:
+    """1サイト分のタグの転置インデックス"""
+
+    def __init__(self, site_name: str, categories: str = "*"):
+        self.site_name = site_name
+        self.categories = categories
+        self.path = state_path("tag_index", f"{site_name}.json")
+        self.built_at = 0.0
+        # 通し番号 → fullname（削除したページはNone）
+        self.fullnames: list[str | None] = []
+        self.slots: dict[str, int] = {}
+        self.tags: dict[str, tuple[str, ...]] = {}
+        self.bitmaps: dict[str, int] = defaultdict(int)
+        self.category_bitmaps: dict[str, int] = defaultdict(int)
+        self.live = 0
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def __contains__(self, fullname: str) -> bool:
+        return fullname in self.slots
+
+    # ----------
+    # 更新
+    # ----------
+
+    def set(self, fullname: str, tags) -> None:
+        """ページのタグを登録する（新しいページなら番号を割り当てる）"""
+        slot = self.slots.get(fullname)
+        if slot is None:
+            slot = self.slots[fullname] = len(self.fullnames)
+            self.fullnames.append(fullname)
+            self.category_bitmaps[_category_of(fullname)] |= 1 << slot
+            self.live |= 1 << slot
+        bit = 1 << slot
+        old, new = set(self.tags.get(fullname, ())), set(tags)
+        for tag in old - new:
+            self.bitmaps[tag] &= ~bit
+            if not self.bitmaps[tag]:
+                del self.bitmaps[tag]
+        for tag in new - old:
+            self.bitmaps[tag] |= bit
+        self.tags[fullname] = tuple(tags)
+
+    def discard(self, fullname: str) -> None:
+        """ページをインデックスから除く（番号は作り直すまで再利用しない）"""
+        if fullname not in self.slots:
+            return
+        self.set(fullname, ())
+        slot = self.slots.pop(fullname)
+        bit = 1 << slot
+        self.fullnames[slot] = None
+        self.category_bitmaps[_category_of(fullname)] &= ~bit
+        self.live &= ~bit
+        del self.tags[fullname]
+
+    # ----------
+    # 評価
+    # ----------
+
+    def bitmap(self, tags: str | list[str] | TagQuery = (), category: str = "*") -> int:
+        """条件に一致するページのビットマップ"""
+        query = tags if isinstance(tags, TagQuery) else TagQuery.parse(tags)
+        if not _covers(self.categories, category):
+            raise ValueError(f"{self.site_name}: インデックスの対象カテゴリ（{self.categories}）外です: {category}")
+
+        result = self.live
+        if category != "*":
+            categories = 0
+            for c in category.split():
+                categories |= self.category_bitmaps.get(c, 0)
+            result &= categories
+        for tag in query.required:
+            result &= self.bitmaps.get(tag, 0)
+        if query.any_of:
+            any_of = 0
+            for tag in query.any_of:
+                any_of |= self.bitmaps.get(tag, 0)
+            result &= any_of
+        for tag in query.excluded:
+            result &= ~self.bitmaps.get(tag, 0)
+        return result
+
+    def members(self, bitmap: int) -> list[str]:
+        """ビットマップのページ名（番号順）"""
+        return [self.fullnames[slot] for slot, bit in enumerate(reversed(bin(bitmap)[2:])) if bit == "1"]
+
+    def select(self, tags: str | list[str] | TagQuery = (), category: str = "*") -> list[str]:
+        """条件（search の tags=[...] / category と同じ書式）に一致するページ名"""
+        return self.members(self.bitmap(tags, category))
+
+    def count(self, tags: str | list[str] | TagQuery = (), category: str = "*") -> int:
+        return self.bitmap(tags, category).bit_count()
+
+    def pages(self, site, fullnames: list[str]):
+        """インデックスのタグを持つPage（search(fields=("tags",)) の結果と同じ形）"""
+        from wikidot.module.page import Page, PageCollection
+
+        pages = []
+        for fullname in fullnames:
+            category = _category_of(fullname)
+            name = fullname.split(":", 1)[1] if ":" in fullname else fullname
+            params = {**dict.fromkeys(FIELD_KEYS), "fullname": fullname, "name": name, "category": category}
+            pages.append(Page(site, **{**params, "tags": list(self.tags[fullname])}))
+        return PageCollection(site, pages)
+
+    # ----------
+    # 保存・構築
+    # ----------
+
+    def save(self) -> None:
+        data = {
+            "version": FORMAT_VERSION,
+            "categories": self.categories,
+            "built_at": self.built_at,
+            "fullnames": self.fullnames,
+            "bitmaps": {tag: _encode(bitmap) for tag, bitmap in self.bitmaps.items()},
+        }
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        tmp.replace(self.path)
+
+    @classmethod
+    def load(cls, site_name: str) -> "TagIndex | None":
+        """保存したインデックス（なければNone）"""
+        path = state_path("tag_index", f"{site_name}.json")
+        if not path.exists():
+            return None
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data.get("version") != FORMAT_VERSION:
+            return None
+
+        index = cls(site_name, data["categories"])
+        index.built_at = data["built_at"]
+        index.fullnames = data["fullnames"]
+        tags = defaultdict(list)
+        for tag, encoded in data["bitmaps"].items():
+            bitmap = index.bitmaps[tag] = _decode(encoded)
+            for fullname in index.members(bitmap):
+                tags[fullname].append(tag)
+        for slot, fullname in enumerate(index.fullnames):
+            if fullname is None:
+                continue
+            index.slots[fullname] = slot
+            index.tags[fullname] = tuple(tags[fullname])
+            index.category_bitmaps[_category_of(fullname)] |= 1 << slot
+            index.live |= 1 << slot
+        return index
+
+    @classmethod
+    def build(cls, site, category: str = "*") -> "TagIndex":
+        """一覧を取得してインデックスを作り、最近の更新の現在位置を記録する"""
+        feed = _feed(site.unix_name)
+        feed.last, feed.seen = None, set()
+        # 一覧の取得中の更新は次回の更新で読み直す
+        batch = feed.poll(site)
+        index = cls(site.unix_name, category)
+        index.built_at = time.time()
+        for page in search_all(site, fields=("tags",), category=category):
+            index.set(page.fullname, page.tags or ())
+        index.save()
+        feed.commit(batch)
+        logger.info(f"{site.unix_name}: タグインデックスを作成 ({len(index)}ページ, {len(index.bitmaps)}タグ)")
+        return index
+
+    def refresh(self, site) -> bool:
+        """
+        最近の更新のうち新規作成・タグの変更があったページを読み直す
+
+        リネームがあった・更新を遡り切れなかった場合は更新せずにFalseを返す（作り直しが必要）。
+        """
+        feed = _feed(self.site_name)
+        batch = feed.poll(site)
+        if not batch.complete:
+            return False
+        changes = [c for c in batch.changes if c.flags & {FLAG_NEW, FLAG_RENAMED, FLAG_TAGS}]
+        if any(FLAG_RENAMED in c.flags for c in changes):
+            return False
+
+        targets = sorted({c.fullname for c in changes if _covers(self.categories, _category_of(c.fullname))})
+        if targets:
+            found = search_many(site, [{"fullname": fullname} for fullname in targets], fields=("tags",))
+            for fullname, result in zip(targets, found):
+                if len(result) == 0:
+                    self.discard(fullname)
+                else:
+                    self.set(fullname, result[0].tags or ())
+            self.save()
+        feed.commit(batch)
+        logger.info(f"{self.site_name}: タグインデックスを更新 (更新 {len(targets)}ページ)")
+        return True
+
+
+def _feed(site_name: str) -> ChangeFeed:
+    # タグ付与スクリプトの監視とは別のチェックポイントで読む
+    return ChangeFeed(site_name, path=state_path("tag_index", f"{site_name}.changes.json"))
+
+
+def load_tag_index(site, category: str = "*", max_age: float = MAX_AGE) -> TagIndex:
+    """
+    categoryを含むインデックスを最新にして返す
+
+    保存したものがなければ・古ければ・categoryを含まなければ・更新で追いつけなければ一覧から作り直す。
+    """
+    index = TagIndex.load(site.unix_name)
+    if index is None:
+        reason = "未作成"
+    elif not _covers(index.categories, category):
+        reason = f"対象カテゴリ外（{index.categories}）"
+    elif time.time() - index.built_at > max_age:
+        reason = "期限切れ"
+    elif not index.refresh(site):
+        reason = "リネームあり、または更新を遡り切れない"
+    else:
+        return index
+    logger.info(f"{site.unix_name}: タグインデックスを作り直します（{reason}）")
+    # 作り直すときも以前の対象カテゴリは残す
+    return TagIndex.build(site, _merge(index.categories, category) if index is not None else category)
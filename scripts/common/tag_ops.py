@@ -0,0 +1,97 @@
+"""
+タグの一括操作
+
+追加・削除（globパターン可）・正規表現置換をページのタグ列に適用し、
+saveTagsをバッチ単位でまとめて並列送信する。
+"""
+
+import fnmatch
+import logging
+import re
+from dataclasses import dataclass
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TagOperation:
+    """タグに対する操作の組（remove → replace → add の順に適用）"""
+
+    add: tuple[str, ...] = ()
+    remove: tuple[str, ...] = ()
+    replace: tuple[tuple[str, str], ...] = ()
+
+    @classmethod
+    def parse(cls, add: list[str], remove: list[str], replace: list[str]) -> "TagOperation":
+        """CLI引数から生成（replaceは "PATTERN=REPL" 形式）"""
+        pairs = []
+        for spec in replace:
+            if "=" not in spec:
+                raise ValueError(f"置換は PATTERN=REPL 形式で指定してください: {spec}")
+            pattern, repl = spec.split("=", 1)
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"置換のPATTERNが正規表現として不正です: {pattern} ({e})") from e
+            pairs.append((pattern, repl))
+        return cls(add=tuple(add), remove=tuple(remove), replace=tuple(pairs))
+
+    def apply(self, tags: list[str]) -> list[str]:
+        """操作適用後のタグ列を返す（元の順序を保つ）"""
+        result = [t for t in tags if not any(fnmatch.fnmatchcase(t, p) for p in self.remove)]
+        for pattern, repl in self.replace:
+            regex = re.compile(pattern)
+            result = [regex.sub(repl, t) if regex.fullmatch(t) else t for t in result]
+        for tag in self.add:
+            result.append(tag)
+        return list(dict.fromkeys(t for t in result if t))
+
+    def describe(self) -> str:
+        parts = [f"+{t}" for t in self.add] + [f"-{t}" for t in self.remove]
+        parts += [f"{p}=>{r}" for p, r in self.replace]
+        return " ".join(parts)
+
+
+def save_tags_bulk(site, changes: list[tuple["object", list[str]]]) -> list[Exception | None]:
+    """
+    (page, 新しいタグ列) のリストをまとめて保存する
+
+    ページIDの取得とsaveTagsはそれぞれ1回のamc_requestで並列に行う。
+    戻り値は入力と同順の、成功ならNone・失敗なら例外のリスト。
+    """
+    from .page_ids import get_page_ids
+
+    if not changes:
+        return []
+
+    pages = [page for page, _ in changes]
+    try:
+        get_page_ids(site, pages)
+    except Exception as e:
+        return [e] * len(changes)
+
+    responses = site.amc_request(
+        [
+            {
+                "tags": " ".join(tags),
+                "action": "WikiPageAction",
+                "event": "saveTags",
+                "pageId": page.id,
+                "moduleName": "Empty",
+            }
+            for page, tags in changes
+        ],
+        return_exceptions=True,
+    )
+
+    errors: list[Exception | None] = []
+    for (page, tags), response in zip(changes, responses, strict=True):
+        if isinstance(response, Exception):
+            errors.append(response)
+        else:
+            page.tags = list(tags)
+            errors.append(None)
+    metrics.count("pages_mutated", sum(e is None for e in errors))
+    return errors
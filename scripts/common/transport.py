@@ -0,0 +1,339 @@
+"""
+Wikidot通信のトランスポート層
+
+wikidot.pyはリクエストごとに httpx.AsyncClient を作り、呼び出しごとに新しいイベントループを
+回すため、並列フェーズでも毎回TCP/TLS接続からやり直しになる。ここでは以下に差し替える:
+  - 常駐スレッド上の単一イベントループ（接続プールをループ間で使い回せるようにする）
+  - 接続数・keep-alive・タイムアウトを設定した共有の接続プール（同期/非同期それぞれ1つ）
+  - HTTP/2（h2がインストールされている場合）と gzip/deflate（brotliがあればbr）の圧縮転送
+
+差し替えはwikidot.pyのモジュールが参照する httpx / run_coroutine の名前に限り、
+他のライブラリが使う httpx には影響しない。
+"""
+
+import asyncio
+import atexit
+import importlib.util
+import logging
+import threading
+import types
+from collections.abc import Callable, Coroutine
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# httpx / run_coroutine を差し替えるwikidot.pyのモジュール
+_PATCHED_MODULES = (
+    "wikidot.connector.ajax",
+    "wikidot.util.requestutil",
+    "wikidot.util.http",
+)
+
+
+@dataclass(frozen=True)
+class TransportConfig:
+    """接続プールの設定"""
+
+    max_connections: int = 10
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 10.0
+    read_timeout: float = 20.0
+    # プールの空き待ち。並列数より多いリクエストは空くまで待つ
+    pool_timeout: float = 60.0
+    # 接続確立の失敗のみトランスポート側で再試行（応答エラーの再試行はwikidot.py側）
+    connect_retries: int = 1
+    http2: bool = True
+
+    @classmethod
+    def for_concurrency(cls, workers: int, **kwargs) -> "TransportConfig":
+        """並列数に合わせた接続プール"""
+        return cls(max_connections=max(workers, 1), **kwargs)
+
+    @property
+    def http2_enabled(self) -> bool:
+        return self.http2 and importlib.util.find_spec("h2") is not None
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            self.read_timeout, connect=self.connect_timeout, pool=self.pool_timeout
+        )
+
+
+# ----------
+# 常駐イベントループ
+# ----------
+
+
+class _LoopThread:
+    """共有接続プールを使うコルーチンを実行する常駐イベントループ"""
+
+    def __init__(self):
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def _ensure(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="wikidot-transport", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        loop = self._ensure()
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("トランスポートのイベントループ内から同期的に待つことはできません")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._loop is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop.close()
+            self._loop = None
+            self._thread = None
+
+
+# ----------
+# 共有トランスポート
+# ----------
+
+# 送信前後に呼ばれるフック。 request を受け取り、戻り値の関数に response（失敗時は例外）を渡す
+RequestHook = Callable[[httpx.Request], Callable[[httpx.Response | None, BaseException | None], None] | None]
+
+
+class _SharedTransportMixin:
+    """クライアントごとのcloseでは閉じず、フックを通して送信する共有トランスポート"""
+
+    def _init_shared(self, config: TransportConfig, hooks: list[RequestHook]) -> None:
+        self.config = config
+        self.hooks = hooks
+        # 設定すると接続プールの代わりにこちらへ送る（カセットの再生など）
+        self.backend = None
+
+    def _prepare(self, request: httpx.Request) -> list:
+        # 呼び出し側の単一タイムアウト指定でも、接続確立とプール待ちは設定値を使う
+        timeout = dict(request.extensions.get("timeout", {}))
+        timeout["connect"] = min(timeout.get("connect") or self.config.connect_timeout, self.config.connect_timeout)
+        timeout["pool"] = self.config.pool_timeout
+        request.extensions["timeout"] = timeout
+        return [after for hook in self.hooks if (after := hook(request)) is not None]
+
+    @staticmethod
+    def _finish(afters: list, response: httpx.Response | None, error: BaseException | None) -> None:
+        for after in afters:
+            after(response, error)
+
+
+class SharedAsyncTransport(_SharedTransportMixin, httpx.AsyncBaseTransport):
+    def __init__(self, config: TransportConfig, hooks: list[RequestHook]):
+        self._init_shared(config, hooks)
+        self._pool = httpx.AsyncHTTPTransport(
+            limits=config.limits(), http2=config.http2_enabled, retries=config.connect_retries
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        afters = self._prepare(request)
+        try:
+            response = await (self.backend or self._pool).handle_async_request(request)
+        except BaseException as e:
+            self._finish(afters, None, e)
+            raise
+        if afters:
+            await response.aread()
+            self._finish(afters, response, None)
+        return response
+
+    async def aclose(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        await self._pool.aclose()
+
+
+class SharedSyncTransport(_SharedTransportMixin, httpx.BaseTransport):
+    def __init__(self, config: TransportConfig, hooks: list[RequestHook]):
+        self._init_shared(config, hooks)
+        self._pool = httpx.HTTPTransport(
+            limits=config.limits(), http2=config.http2_enabled, retries=config.connect_retries
+        )
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        afters = self._prepare(request)
+        try:
+            response = (self.backend or self._pool).handle_request(request)
+        except BaseException as e:
+            self._finish(afters, None, e)
+            raise
+        if afters:
+            response.read()
+            self._finish(afters, response, None)
+        return response
+
+    def close(self) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        self._pool.close()
+
+
+class Transport:
+    """プロセス内で共有する接続プール一式"""
+
+    def __init__(self, config: TransportConfig):
+        self.config = config
+        self.hooks: list[RequestHook] = []
+        self.loop = _LoopThread()
+        self.async_transport = SharedAsyncTransport(config, self.hooks)
+        self.sync_transport = SharedSyncTransport(config, self.hooks)
+
+    def add_hook(self, hook: RequestHook) -> None:
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: RequestHook) -> None:
+        self.hooks.remove(hook)
+
+    def set_backend(self, backend) -> None:
+        """
+        実際の送信先を差し替える（Noneで接続プールに戻す）
+
+        backendは handle_request と handle_async_request の両方を持つオブジェクト。
+        """
+        self.async_transport.backend = backend
+        self.sync_transport.backend = backend
+
+    def async_client(self, **kwargs) -> httpx.AsyncClient:
+        kwargs.setdefault("timeout", self.config.timeout())
+        return httpx.AsyncClient(transport=self.async_transport, **kwargs)
+
+    def client(self, **kwargs) -> httpx.Client:
+        """共有プールを使う同期クライアント（Cookieはクライアントごとに独立）"""
+        kwargs.setdefault("timeout", self.config.timeout())
+        return httpx.Client(transport=self.sync_transport, **kwargs)
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        return self.loop.run(coro)
+
+    def close(self) -> None:
+        if self.loop._loop is not None:
+            self.loop.run(self.async_transport.shutdown())
+        self.loop.stop()
+        self.sync_transport.shutdown()
+
+    def httpx_module(self) -> types.ModuleType:
+        """AsyncClient / get / post を共有プール経由に置き換えた httpx モジュールの複製"""
+        module = types.ModuleType("httpx")
+        module.__dict__.update(httpx.__dict__)
+        transport = self
+
+        class AsyncClient(httpx.AsyncClient):
+            def __init__(self, **kwargs):
+                kwargs.setdefault("timeout", transport.config.timeout())
+                super().__init__(transport=transport.async_transport, **kwargs)
+
+        class Client(httpx.Client):
+            def __init__(self, **kwargs):
+                kwargs.setdefault("timeout", transport.config.timeout())
+                super().__init__(transport=transport.sync_transport, **kwargs)
+
+        def get(url, **kwargs) -> httpx.Response:
+            with transport.client() as client:
+                return client.get(url, **kwargs)
+
+        def post(url, **kwargs) -> httpx.Response:
+            with transport.client() as client:
+                return client.post(url, **kwargs)
+
+        module.AsyncClient = AsyncClient
+        module.Client = Client
+        module.get = get
+        module.post = post
+        return module
+
+
+_transport: Transport | None = None
+_originals: dict[str, tuple[Any, Any]] = {}
+
+
+def install(config: TransportConfig | None = None) -> Transport:
+    """
+    共有トランスポートをwikidot.pyに組み込む
+
+    既に組み込み済みで設定が同じならそのまま返し、異なれば作り直す。
+    """
+    global _transport
+    config = config or TransportConfig()
+    if _transport is not None:
+        if _transport.config == config:
+            return _transport
+        hooks = list(_transport.hooks)
+        backend = _transport.sync_transport.backend
+        uninstall()
+    else:
+        hooks = []
+        backend = None
+
+    import importlib
+
+    _transport = Transport(config)
+    for hook in hooks:
+        _transport.add_hook(hook)
+    _transport.set_backend(backend)
+    patched_httpx = _transport.httpx_module()
+    for name in _PATCHED_MODULES:
+        module = importlib.import_module(name)
+        _originals[name] = (module.httpx, getattr(module, "run_coroutine", None))
+        module.httpx = patched_httpx
+        if hasattr(module, "run_coroutine"):
+            module.run_coroutine = _transport.run
+
+    logger.debug(
+        f"トランスポート: 最大接続 {config.max_connections}, HTTP/2 {'有効' if config.http2_enabled else '無効'}"
+    )
+    return _transport
+
+
+def uninstall() -> None:
+    global _transport
+    if _transport is None:
+        return
+    import importlib
+
+    for name, (orig_httpx, orig_run) in _originals.items():
+        module = importlib.import_module(name)
+        module.httpx = orig_httpx
+        if orig_run is not None:
+            module.run_coroutine = orig_run
+    _originals.clear()
+    _transport.close()
+    _transport = None
+
+
+def get_transport() -> Transport:
+    """組み込み済みのトランスポート（未設定なら既定の設定で組み込む）"""
+    return _transport or install()
+
+
+def http_client(**kwargs) -> httpx.Client:
+    """Wikidot以外（Discordなど）への通信にも共有プールを使う同期クライアント"""
+    return get_transport().client(**kwargs)
+
+
+atexit.register(uninstall)
@@ -0,0 +1,92 @@
+"""
+実行後の検証
+
+書き込みが終わったあと、変更したページをまとめて読み直し（1回のamc_request）、
+fullname・タグ・タイトルが意図した結果と一致しているかを確かめる。
+"""
+
+import logging
+from dataclasses import dataclass
+
+from .search import search_many
+
+logger = logging.getLogger(__name__)
+
+# Discordに列挙する不一致の件数
+DISCORD_LIMIT = 5
+
+
+@dataclass(frozen=True)
+class Expectation:
+    """実行後の1ページのあるべき状態（Noneや空の項目は確認しない）"""
+
+    fullname: str
+    tags: tuple[str, ...] | None = None
+    tags_present: tuple[str, ...] = ()
+    tags_absent: tuple[str, ...] = ()
+    title: str | None = None
+    # リネーム元など、存在しないはずのページ名
+    gone: str | None = None
+
+
+@dataclass(frozen=True)
+class Drift:
+    """意図した結果との不一致"""
+
+    fullname: str
+    problem: str
+
+    def __str__(self) -> str:
+        return f"{self.fullname}: {self.problem}"
+
+
+def _check(expectation: Expectation, page) -> list[str]:
+    problems = []
+    tags = set(page.tags or [])
+    if expectation.tags is not None and tags != set(expectation.tags):
+        problems.append(f"タグが {sorted(tags)} です（期待: {sorted(expectation.tags)}）")
+    missing = [tag for tag in expectation.tags_present if tag not in tags]
+    if missing:
+        problems.append(f"タグ {missing} がありません")
+    remaining = [tag for tag in expectation.tags_absent if tag in tags]
+    if remaining:
+        problems.append(f"タグ {remaining} が残っています")
+    if expectation.title is not None and page.title != expectation.title:
+        problems.append(f"タイトルが「{page.title}」です（期待: 「{expectation.title}」）")
+    return problems
+
+
+def verify(site, expectations: list[Expectation]) -> list[Drift]:
+    """変更したページをまとめて読み直し、意図した結果と一致しないものを返す"""
+    if not expectations:
+        return []
+    fields = ("tags", "title") if any(e.title is not None for e in expectations) else ("tags",)
+    queries = [{"fullname": e.fullname} for e in expectations]
+    queries += [{"fullname": e.gone} for e in expectations if e.gone]
+    # 書き込みは別プロセス（--processes）で行われることもあるため、検索キャッシュを使わずに読み直す
+    found = search_many(site, queries, fields=fields, cache=False)
+    gone_results = iter(found[len(expectations) :])
+
+    drifts = []
+    for expectation, result in zip(expectations, found):
+        if len(result) == 0:
+            drifts.append(Drift(expectation.fullname, "ページが存在しません"))
+        else:
+            drifts += [Drift(expectation.fullname, problem) for problem in _check(expectation, result[0])]
+        if expectation.gone and len(next(gone_results)) > 0:
+            drifts.append(Drift(expectation.gone, "元のページ名が残っています"))
+
+    for drift in drifts:
+        logger.warning(f"事後検証: {drift}")
+    logger.info(f"事後検証: {len(expectations)}件を確認, 不一致 {len(drifts)}件")
+    return drifts
+
+
+def discord_field(expectations: list[Expectation], drifts: list[Drift]) -> dict:
+    """Discord embed用のフィールド"""
+    value = f"確認: {len(expectations)}件\n不一致: {len(drifts)}件"
+    if drifts:
+        value += "\n" + "\n".join(f"- {drift}" for drift in drifts[:DISCORD_LIMIT])
+        if len(drifts) > DISCORD_LIMIT:
+            value += f"\n...他 {len(drifts) - DISCORD_LIMIT}件"
+    return {"name": "事後検証", "value": value, "inline": False}
@@ -12,14 +12,22 @@ SCP-4000-JPコンテスト希望順位取得スクリプト
 希望順位を出力する。
 """
 
+import argparse
 import logging
 import re
+import sys
+from pathlib import Path
 from typing import TypedDict
 
-import wikidot
 from wikidot.module.forum_post import ForumPostCollection
 from wikidot.module.forum_thread import ForumThreadCollection
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.cli import add_common_arguments, apply_common_arguments  # noqa: E402
+from common.metrics import RunMetrics  # noqa: E402
+from common.page_ids import get_page_ids  # noqa: E402
+from common.session import create_client  # noqa: E402
+
 logging.basicConfig(
     level=logging.WARN,
     format="%(asctime)s [%(levelname)s] %(message)s",
@@ -159,10 +167,16 @@ def parse_preferences(html_text: str) -> PreferenceResult:
 
 
 def main():
+    parser = argparse.ArgumentParser(description="SCP-4000-JPコンテスト希望順位取得")
+    add_common_arguments(parser)
+    args = parser.parse_args()
+    apply_common_arguments(args)
+
     logger.info("SCP-4000-JP希望順位取得スクリプト開始")
 
     # ログインなしでクライアント作成
-    with wikidot.Client() as client:
+    with RunMetrics("4000jp-preferences") as run_metrics, create_client() as client:
+        run_metrics.start_phase("scan")
         site = client.site.get("scp-jp")
 
         # ページ検索
@@ -172,13 +186,14 @@ def main():
 
         # ページIDをバルク取得
         logger.info("ページIDを取得中...")
-        pages.get_page_ids()
+        get_page_ids(site, pages)
 
         # scp-4000-jp（プレースホルダ）を除外
         pages = [p for p in pages if p.fullname != "scp-4000-jp"]
         logger.info(f"プレースホルダ除外後: {len(pages)}件")
 
         # ForumCommentsListModuleをバルク呼び出し
+        run_metrics.start_phase("threads")
         logger.info("ディスカッションスレッドIDを取得中...")
         responses = site.amc_request(
             [{"moduleName": "forum/ForumCommentsListModule", "pageId": page.id} for page in pages]
@@ -204,6 +219,7 @@ def main():
         threads = ForumThreadCollection.acquire_from_thread_ids(site, thread_ids)
 
         # ポストをバルク取得
+        run_metrics.start_phase("posts")
         logger.info("ポストを取得中...")
         posts_dict = ForumPostCollection.acquire_all_in_threads(list(threads))
 
@@ -217,6 +233,7 @@ def main():
         logger.info(f"最初のポスト数: {len(first_posts)}件")
 
         # パース結果を収集
+        run_metrics.start_phase("parse")
         all_results: dict[str, PreferenceResult] = {}
 
         for page, post in sorted(first_posts, key=lambda x: x[0].fullname):
@@ -13,8 +13,14 @@
 import argparse
 import logging
 import os
-from dotenv import load_dotenv
-import wikidot
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.cli import add_common_arguments, apply_common_arguments, load_env  # noqa: E402
+from common.metrics import RunMetrics  # noqa: E402
+from common.rules import INACTIVE_USER_INITIAL_RULE, apply_fixes, scan_site  # noqa: E402
+from common.session import create_client  # noqa: E402
 
 logging.basicConfig(
     level=logging.WARN,
@@ -24,56 +30,35 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-INACTIVE_USER_TAG = "非使用ユーザー"
-INITIAL_TAGS = [f"initial_{c}" for c in "abcdefghijklmnopqrstuvwxyz0123456789"] + ["initial_null"]
-
 
 def main():
     parser = argparse.ArgumentParser(description="非使用ユーザーのポータルからinitial_*タグを削除")
     parser.add_argument("--dry-run", action="store_true", help="実際の変更を行わずに対象を表示")
+    add_common_arguments(parser)
     args = parser.parse_args()
+    apply_common_arguments(args)
 
-    load_dotenv()
+    load_env()
 
     if args.dry_run:
         logger.info("=== DRY-RUN MODE ===")
 
-    results = {"processed": [], "skipped": 0, "errors": []}
-
-    with wikidot.Client(
-        username=os.environ["WIKIDOT_USERNAME"],
-        password=os.environ["WIKIDOT_PASSWORD"],
-    ) as client:
+    with (
+        RunMetrics("remove-initial-tags", dry_run=args.dry_run) as run_metrics,
+        create_client(
+            username=os.environ["WIKIDOT_USERNAME"],
+            password=os.environ["WIKIDOT_PASSWORD"],
+        ) as client,
+    ):
+        run_metrics.start_phase("scan")
         site = client.site.get("scp-jp-sandbox3")
-        pages = site.pages.search(category="portal", tags=[INACTIVE_USER_TAG])
-
-        for page in pages:
-            initial_tags_on_page = [t for t in page.tags if t in INITIAL_TAGS]
-
-            if not initial_tags_on_page:
-                results["skipped"] += 1
-                continue
-
-            try:
-                if args.dry_run:
-                    logger.info(f"[DRY-RUN] {page.fullname}: -{initial_tags_on_page}")
-                else:
-                    for tag in initial_tags_on_page:
-                        page.tags.remove(tag)
-                    page.commit_tags()
-                    logger.info(f"{page.fullname}: -{initial_tags_on_page}")
-
-                results["processed"].append({
-                    "page": page.fullname,
-                    "removed_tags": initial_tags_on_page,
-                })
-            except Exception as e:
-                logger.exception(f"Error processing page {page.fullname}: {e}")
-                results["errors"].append({"page": page.fullname, "error": str(e)})
+        scan = scan_site(site, [INACTIVE_USER_INITIAL_RULE])
+        run_metrics.start_phase("fix")
+        results = apply_fixes(scan.violations, dry_run=args.dry_run)
 
     logger.info("=== SUMMARY ===")
     logger.info(f"処理: {len(results['processed'])}件")
-    logger.info(f"スキップ（initial_*タグなし）: {results['skipped']}件")
+    logger.info(f"スキャン: {scan.scanned}件")
     logger.info(f"エラー: {len(results['errors'])}件")
 
 
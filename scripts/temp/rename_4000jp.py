@@ -14,16 +14,32 @@ SCP-4000-JPコンテスト終了に伴うリネーム・編集スクリプト
   1. ページをscp-<num>-jpにリネーム
   2. タイトルが"SCP-4000-JP - xxx"形式の場合、"SCP-<num>-JP"に変更
   3. ソース内のSCP-4000-JP/scp-4000-jpを置換
+
+--processes を指定すると確認なしで、ページごとのリネーム・編集をジョブキューに登録して
+複数のワーカープロセスで実行する（中断しても同じ入力で再実行すれば続きから処理する）。
 """
 
 import argparse
-import difflib
 import logging
 import os
 import re
 import sys
-from dotenv import load_dotenv
-import wikidot
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import TextIO
+from wikidot.module.page import PageCollection
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.backlinks import BacklinkIndex  # noqa: E402
+from common.cli import add_common_arguments, apply_common_arguments, load_env  # noqa: E402
+from common.metrics import RunMetrics  # noqa: E402
+from common.page_edit import PageEdit, edit_pages  # noqa: E402
+from common.page_ids import get_page_ids  # noqa: E402
+from common.paths import state_path  # noqa: E402
+from common.retry import rename  # noqa: E402
+from common.search import search, search_many  # noqa: E402
+from common.session import create_client  # noqa: E402
+from common.verify import Expectation, verify  # noqa: E402
 
 logging.basicConfig(
     level=logging.WARN,
@@ -34,11 +50,14 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 TITLE_PATTERN = re.compile(r"^SCP-4000-JP - .+$")
+QUEUE_JOB = "rename-4000jp"
+# 確認なしで処理するとき、編集をまとめて保存するページ数
+EDIT_FLUSH_SIZE = 50
 
 
-def parse_input(lines: list[str]) -> dict[str, str]:
-    """TSVデータをパースして {ページ名: ナンバー} の辞書を返す"""
-    mapping = {}
+def parse_entries(lines: list[str]) -> list[tuple[str, str]]:
+    """TSVデータをパースして (ページ名, ナンバー) のリストを入力順に返す（重複もそのまま含む）"""
+    entries = []
     for i, line in enumerate(lines):
         line = line.strip()
         if not line:
@@ -51,29 +70,127 @@ def parse_input(lines: list[str]) -> dict[str, str]:
             num = parts[0].strip()
             page_name = parts[1].strip()
             if num and page_name:
-                mapping[page_name] = num
-    return mapping
+                entries.append((page_name, num))
+    return entries
+
+
+def parse_input(lines: list[str]) -> dict[str, str]:
+    """TSVデータをパースして {ページ名: ナンバー} の辞書を返す"""
+    return dict(parse_entries(lines))
+
+
+def preflight(site, entries: list[tuple[str, str]], candidates: set[str]) -> dict:
+    """
+    リネームを始める前に入力全体を検査する
 
+    入力の重複と、リネーム元・リネーム先の有無（まとめて1回の検索で確認）を調べ、
+    {"fatal": [...], "warnings": [...]} を返す。fatalが1件でもあれば処理を始めない。
+    candidatesは処理対象の検索（4000jpタグ付き・ハブ除く）で見つかったページ名。
+    """
+    report = {"fatal": [], "warnings": []}
+
+    nums_of = defaultdict(list)
+    for page_name, num in entries:
+        nums_of[page_name].append(num)
+    for page_name, nums in nums_of.items():
+        if len(set(nums)) > 1:
+            report["fatal"].append(f"{page_name}: 異なるナンバーが重複して指定されています ({', '.join(nums)})")
+        elif len(nums) > 1:
+            report["warnings"].append(f"{page_name}: 同じ行が{len(nums)}回指定されています")
+
+    mapping = dict(entries)
+    for num, count in Counter(mapping.values()).items():
+        if count > 1:
+            pages = ", ".join(sorted(page_name for page_name, n in mapping.items() if n == num))
+            report["fatal"].append(f"SCP-{num}-JP: 複数のページに割り当てられています ({pages})")
+    for page_name, num in mapping.items():
+        if not num.isdigit():
+            report["fatal"].append(f"{page_name}: ナンバーが数字ではありません ({num})")
+
+    targets = {page_name: f"scp-{num}-jp" for page_name, num in mapping.items()}
+    queries = [{"fullname": name} for page_name in mapping for name in (page_name, targets[page_name])]
+    found = search_many(site, queries, fields=())
+    for i, page_name in enumerate(mapping):
+        source_exists, target_exists = len(found[2 * i]) > 0, len(found[2 * i + 1]) > 0
+        target = targets[page_name]
+        if source_exists and target_exists:
+            report["fatal"].append(f"{page_name}: リネーム先 {target} が既に存在します")
+        elif not source_exists and target_exists:
+            report["warnings"].append(f"{page_name}: リネーム済みのためスキップします（{target} が存在）")
+        elif not source_exists:
+            report["fatal"].append(f"{page_name}: ページが存在しません")
+        elif page_name not in candidates:
+            report["warnings"].append(f"{page_name}: 4000jpタグがない（またはハブ）ためスキップされます")
+    return report
+
+
+def generate_diff(old_text: str, new_text: str, filename: str):
+    """差分を1行ずつ生成（unified diff）"""
+    # --diff-mode unified のときだけ使うため、ここで読み込む
+    import difflib
 
-def generate_diff(old_text: str, new_text: str, filename: str) -> str:
-    """差分を生成"""
     old_lines = old_text.splitlines(keepends=True)
     new_lines = new_text.splitlines(keepends=True)
-    diff = difflib.unified_diff(old_lines, new_lines, fromfile=f"a/{filename}", tofile=f"b/{filename}")
-    return "".join(diff)
+    return difflib.unified_diff(old_lines, new_lines, fromfile=f"a/{filename}", tofile=f"b/{filename}")
+
+
+def generate_fast_diff(old_text: str, new_text: str, filename: str):
+    """
+    変更行のみの差分を1行ずつ生成
+
+    replace_sourceは行単位のトークン置換のみで行数が変わらないため、
+    difflibのシーケンスマッチングを使わずに対応する行同士を比較する。
+    行数が異なる場合はunified diffにフォールバックする。
+    """
+    old_lines = old_text.split("\n")
+    new_lines = new_text.split("\n")
+    if len(old_lines) != len(new_lines):
+        yield from generate_diff(old_text, new_text, filename)
+        return
+
+    yield f"--- a/{filename}\n+++ b/{filename}\n"
+    for lineno, (old_line, new_line) in enumerate(zip(old_lines, new_lines), start=1):
+        if old_line != new_line:
+            yield f"@@ -{lineno} +{lineno} @@\n-{old_line}\n+{new_line}\n"
+
+
+DIFF_GENERATORS = {"unified": generate_diff, "fast": generate_fast_diff}
+
+
+class DiffWriter:
+    """差分を表示する場合のみ生成し、stdoutまたはページごとのファイルへ逐次書き出す"""
+
+    def __init__(self, mode: str = "unified", output_dir: Path | None = None, stream: TextIO = sys.stdout):
+        self.generate = DIFF_GENERATORS[mode]
+        self.output_dir = output_dir
+        self.stream = stream
+        if output_dir is not None:
+            output_dir.mkdir(parents=True, exist_ok=True)
+
+    def write(self, old_text: str, new_text: str, filename: str) -> None:
+        if self.output_dir is None:
+            self.stream.writelines(self.generate(old_text, new_text, filename))
+            self.stream.write("\n")
+            self.stream.flush()
+            return
+
+        path = self.output_dir / f"{filename.replace(':', '_')}.diff"
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(self.generate(old_text, new_text, filename))
+        logger.info(f"  差分: {path}")
 
 
 # fragment:scp-4000-jp-xxx パターン（置換から除外）
 FRAGMENT_PATTERN = re.compile(r"(fragment:)(scp-4000-jp-[a-z0-9-]+)")
 
 
-def replace_source(source: str, new_num: str, mapping: dict[str, str]) -> str:
+def replace_source(source: str, new_num: str | None, mapping: dict[str, str]) -> str:
     """
     ソース置換を行う
 
     Args:
         source: 元のソース
-        new_num: 現在のページの新ナンバー
+        new_num: 現在のページの新ナンバー（Noneの場合はfullname置換のみ行う）
         mapping: {fullname: num} の辞書（全エントリ）
 
     Returns:
@@ -111,8 +228,9 @@ def replace_source(source: str, new_num: str, mapping: dict[str, str]) -> str:
 
         # 4. 汎用置換（残りの4000-JP/4000-jp）
         # 前に数字がない場合のみ置換（14000-JPのような誤置換を防ぐ）
-        new_line = re.sub(r"(?<![0-9])4000-JP", f"{new_num}-JP", new_line)
-        new_line = re.sub(r"(?<![0-9])4000-jp", f"{new_num}-jp", new_line)
+        if new_num is not None:
+            new_line = re.sub(r"(?<![0-9])4000-JP", f"{new_num}-JP", new_line)
+            new_line = re.sub(r"(?<![0-9])4000-jp", f"{new_num}-jp", new_line)
 
         # 5. プレースホルダを元に戻す（fullname）
         for old_fullname, (placeholder, new_fullname) in fullname_placeholders.items():
@@ -127,30 +245,42 @@ def replace_source(source: str, new_num: str, mapping: dict[str, str]) -> str:
     return "\n".join(result_lines)
 
 
-def process_page(page, num: str, mapping: dict[str, str], dry_run: bool) -> dict:
-    """ページを処理"""
+def process_page(
+    page,
+    num: str,
+    mapping: dict[str, str],
+    dry_run: bool,
+    diff_writer: DiffWriter | None = None,
+    queued: bool = False,
+) -> dict:
+    """ページを処理（diff_writer指定時のみ差分を生成して書き出す。queued時は実行せずにresult["task"]を返す）"""
     result = {
         "fullname": page.fullname,
         "num": num,
         "actions": [],
-        "diffs": [],
     }
 
     new_fullname = f"scp-{num}-jp"
+    result["new_fullname"] = new_fullname
 
     # リネーム
     result["actions"].append(f"リネーム: {page.fullname} -> {new_fullname}")
 
     # num == "4000" の場合はリネームのみ
     if num == "4000":
-        if not dry_run:
-            page.rename(new_fullname)
+        if queued:
+            from common.jobqueue import page_task
+
+            result["task"] = page_task(rename_to=new_fullname)
+        elif not dry_run:
+            rename(page, new_fullname)
         return result
 
     # タイトル変更判定
     new_title = None
     if TITLE_PATTERN.match(page.title):
         new_title = f"SCP-{num}-JP"
+        result["new_title"] = new_title
         result["actions"].append(f"タイトル変更: {page.title} -> {new_title}")
 
     # ソース置換
@@ -159,34 +289,161 @@ def process_page(page, num: str, mapping: dict[str, str], dry_run: bool) -> dict
 
     source_changed = old_source != new_source
     if source_changed:
-        diff = generate_diff(old_source, new_source, page.fullname)
-        result["diffs"].append(diff)
         result["actions"].append("ソース置換: SCP-4000-JP -> SCP-{}-JP, scp-4000-jp -> scp-{}-jp".format(num, num))
+        if diff_writer is not None:
+            diff_writer.write(old_source, new_source, page.fullname)
+
+    comment = f"SCP-4000-JPコンテスト終了に伴う編集（割当: SCP-{num}-JP）"
+    if queued:
+        from common.jobqueue import page_task
 
-    if not dry_run:
+        edit = {"title": new_title, "source": new_source, "comment": comment} if new_title or source_changed else None
+        result["task"] = page_task(rename_to=new_fullname, edit=edit)
+    elif not dry_run:
         # リネーム実行
-        page = page.rename(new_fullname)
+        page = rename(page, new_fullname)
 
-        # 編集実行（タイトルまたはソースが変更される場合）
+        # 編集（タイトルまたはソースが変更される場合）は呼び出し側で save_edits にまとめて保存する
         if new_title or source_changed:
-            comment = f"SCP-4000-JPコンテスト終了に伴う編集（割当: SCP-{num}-JP）"
-            page.edit(
-                title=new_title,
-                source=new_source if source_changed else None,
-                comment=comment,
-                force_edit=True
-            )
+            result["edit"] = PageEdit(page, title=new_title or page.title, source=new_source, comment=comment)
 
+    # 処理済みページのソースを保持し続けないよう解放
+    page.source = None
     return result
 
 
+def save_edits(site, pending: list[tuple[object, str, PageEdit]], results: dict) -> None:
+    """保留中の (processedの要素, ページ名, 編集) をまとめて保存し、失敗したものをerrorsに移す"""
+    if not pending:
+        return
+    logger.info(f"編集を保存中: {len(pending)}件")
+    for (entry, fullname, _), error in zip(pending, edit_pages(site, [edit for _, _, edit in pending])):
+        if error is not None:
+            logger.error(f"エラー: {fullname}: 編集に失敗: {error}")
+            results["processed"].remove(entry)
+            results["errors"].append({"page": fullname, "error": str(error)})
+    pending.clear()
+
+
+def rewrite_backlinks(
+    site,
+    index: BacklinkIndex,
+    mapping: dict[str, str],
+    dry_run: bool,
+    diff_writer: DiffWriter | None = None,
+    tasks: list | None = None,
+) -> dict:
+    """
+    リネームしたページを参照している他ページのリンクを書き換える（除外ルールはreplace_sourceと同じ）
+
+    tasksを渡した場合は編集せず、(ページ名, タスク) をtasksに追加する。
+    """
+    results = {"processed": [], "unchanged": [], "errors": []}
+
+    referrers = {k: v for k, v in index.referrers_of(mapping).items() if k not in mapping}
+    logger.info(f"参照元ページ: {len(referrers)}件")
+    if not referrers:
+        return results
+
+    # 参照元の一覧はまとめて1回のリクエストで取得（存在しないページは空の結果になる）
+    found = search_many(site, [{"fullname": fullname} for fullname in sorted(referrers)], fields=("title",))
+    pages = PageCollection(site, [p for result in found for p in result])
+    get_page_ids(site, pages)
+    pages.get_page_sources()
+
+    pending = []
+    for page in pages:
+        try:
+            old_source = page.source.wiki_text
+            new_source = replace_source(old_source, None, mapping)
+            page.source = None
+
+            if old_source == new_source:
+                results["unchanged"].append(page.fullname)
+                continue
+
+            targets = ", ".join(sorted(referrers[page.fullname]))
+            logger.info(f"[{page.fullname}] リンク修正: {targets}")
+            if diff_writer is not None:
+                diff_writer.write(old_source, new_source, page.fullname)
+            results["processed"].append(page.fullname)
+            comment = "SCP-4000-JPコンテスト終了に伴うリンク修正"
+            if tasks is not None:
+                from common.jobqueue import page_task
+
+                tasks.append((page.fullname, page_task(edit={"title": None, "source": new_source, "comment": comment})))
+            elif not dry_run:
+                edit = PageEdit(page, title=page.title, source=new_source, comment=comment)
+                pending.append((page.fullname, page.fullname, edit))
+                if len(pending) >= EDIT_FLUSH_SIZE:
+                    save_edits(site, pending, results)
+        except Exception as e:
+            logger.exception(f"エラー: {page.fullname}: {e}")
+            results["errors"].append({"page": page.fullname, "error": str(e)})
+
+    save_edits(site, pending, results)
+    return results
+
+
+def run_queued(site_name: str, tasks: list[tuple[str, dict]], args, results: dict) -> None:
+    """登録したリネーム・編集をワーカープロセスで実行し、失敗したものをerrorsに移す"""
+    from common.jobqueue import DONE, JobQueue, run_workers
+
+    with JobQueue() as queue:
+        queue.enqueue(QUEUE_JOB, site_name, tasks)
+        run_workers(QUEUE_JOB, args.processes)
+        failed = {task.key: task.error or task.status for task in queue.results(QUEUE_JOB) if task.status != DONE}
+        if not failed:
+            queue.delete(QUEUE_JOB)
+
+    # 対象ページ自体のタスクかどうかは、失敗したものを除く前に判定する
+    main_keys = {entry["fullname"] for entry in results["processed"]}
+    results["processed"] = [entry for entry in results["processed"] if entry["fullname"] not in failed]
+    backlinks = results.get("backlinks")
+    if backlinks is not None:
+        backlinks["processed"] = [fullname for fullname in backlinks["processed"] if fullname not in failed]
+    for fullname, error in failed.items():
+        logger.error(f"エラー: {fullname}: {error}")
+        target = results if fullname in main_keys or backlinks is None else backlinks
+        target["errors"].append({"page": fullname, "error": error})
+
+
 def main():
     parser = argparse.ArgumentParser(description="SCP-4000-JPコンテスト終了に伴うリネーム・編集")
     parser.add_argument("--dry-run", action="store_true", help="実際の変更を行わずに対象と差分を表示")
     parser.add_argument("--input", type=str, help="入力TSVファイル（省略時はstdinから読み込み）")
+    parser.add_argument(
+        "--diff-mode",
+        choices=["unified", "fast", "none"],
+        default="unified",
+        help="差分表示形式（fast: 変更行のみ、difflibを使わない / none: 差分を生成しない）",
+    )
+    parser.add_argument("--diff-dir", type=Path, help="差分をページごとのファイルに書き出すディレクトリ（省略時はstdout）")
+    parser.add_argument("--backlinks", action="store_true", help="リネーム対象を参照している他ページのリンクも書き換える")
+    parser.add_argument(
+        "--backlinks-index",
+        type=Path,
+        help="バックリンクインデックスの保存先（既定: .state/backlinks/scp-4000-jp.json）。"
+        "既存ならリネーム前に保存したものを再利用し、含まれないページの分だけ構築して加える",
+    )
+    parser.add_argument(
+        "--backlinks-from",
+        choices=["module", "mirror"],
+        default="module",
+        help="バックリンクの取得元（module: サイトのBacklinksModule / mirror: ローカルのソースミラー）",
+    )
+    parser.add_argument("--preflight-only", action="store_true", help="事前検査だけを行って終了")
+    parser.add_argument(
+        "--processes", type=int, default=0, help="確認なしでジョブキューに登録し、このプロセス数のワーカーで実行"
+    )
+    add_common_arguments(parser)
     args = parser.parse_args()
+    if args.synthetic and args.processes:
+        # 合成サイトはプロセスごとに別のコピーになり、ワーカーの書き込みがこのプロセスから見えない
+        parser.error("--synthetic と --processes は併用できません")
+    apply_common_arguments(args)
 
-    load_dotenv()
+    load_env()
 
     # 入力読み込み
     if args.input:
@@ -195,7 +452,8 @@ def main():
     else:
         lines = sys.stdin.readlines()
 
-    mapping = parse_input(lines)
+    entries = parse_entries(lines)
+    mapping = dict(entries)
     logger.info(f"入力データ: {len(mapping)}件")
 
     if args.dry_run:
@@ -205,25 +463,79 @@ def main():
 
     results = {"processed": [], "skipped": [], "errors": []}
 
-    with wikidot.Client(
-        username=os.environ["WIKIDOT_USERNAME"],
-        password=os.environ["WIKIDOT_PASSWORD"],
-    ) as client:
+    with (
+        RunMetrics(QUEUE_JOB, dry_run=args.dry_run) as run_metrics,
+        create_client(
+            username=os.environ["WIKIDOT_USERNAME"],
+            password=os.environ["WIKIDOT_PASSWORD"],
+        ) as client,
+    ):
+        run_metrics.start_phase("scan")
         site = client.site.get("scp-jp")
 
         # ページ検索
         logger.info("ページを検索中...")
-        pages = site.pages.search(category="_default", tags=["+4000jp", "-ハブ"])
+        pages = search(site, fields=("title",), category="_default", tags=["+4000jp", "-ハブ"])
         logger.info(f"検索結果: {len(pages)}件")
 
+        # 事前検査（途中で失敗して手作業で直すことにならないよう、問題は開始前にまとめて報告する）
+        run_metrics.start_phase("preflight")
+        logger.info("事前検査中...")
+        report = preflight(site, entries, {page.fullname for page in pages})
+        for warning in report["warnings"]:
+            logger.warning(f"事前検査: {warning}")
+        for problem in report["fatal"]:
+            logger.error(f"事前検査: {problem}")
+        if report["fatal"]:
+            logger.error(f"事前検査で{len(report['fatal'])}件の問題が見つかったため、処理を中止します")
+            sys.exit(1)
+        logger.info(f"事前検査: 問題なし（警告 {len(report['warnings'])}件）")
+        if args.preflight_only:
+            return
+
         # PageIDをバルク取得
+        run_metrics.start_phase("page_ids")
         logger.info("PageIDを取得中...")
-        pages.get_page_ids()
+        get_page_ids(site, pages)
+
+        # バックリンクインデックス（リネーム前に構築して保存）
+        backlink_index = None
+        if args.backlinks:
+            run_metrics.start_phase("backlinks_index")
+            index_path = args.backlinks_index or state_path("backlinks", "scp-4000-jp.json")
+            backlink_index = BacklinkIndex()
+            if index_path.exists():
+                logger.info(f"バックリンクインデックスを読み込み: {index_path}")
+                backlink_index = BacklinkIndex.load(index_path)
+            # 今回の対象のうち、まだリネームしておらずインデックスに含まれないページの分を構築する
+            missing = set(backlink_index.missing(page.fullname for page in pages if page.fullname in mapping))
+            if missing and args.backlinks_from == "mirror":
+                from common.source_mirror import SourceMirror
+
+                logger.info(f"ローカルミラーからバックリンクを構築中（{len(missing)}ページ）...")
+                with SourceMirror(site.unix_name) as mirror:
+                    backlink_index.update(BacklinkIndex.from_mirror(mirror, missing))
+            elif missing:
+                logger.info(f"バックリンクを取得中（{len(missing)}ページ）...")
+                targets = [page for page in pages if page.fullname in missing]
+                backlink_index.update(BacklinkIndex.from_backlinks_module(site, targets))
+            if missing:
+                backlink_index.save(index_path)
 
         # 各ページを処理
-        interactive = not args.dry_run  # dry-runでなければ対話モード
+        run_metrics.start_phase("process")
+        queued = args.processes > 0 and not args.dry_run
+        tasks = []
+        interactive = not args.dry_run and not queued  # dry-runでもキューでもなければ対話モード
         bypass = False  # bypass入力後はTrue
 
+        diff_writer = None
+        if args.diff_mode != "none":
+            diff_writer = DiffWriter(args.diff_mode, args.diff_dir)
+
+        # 編集は確認なしの間はまとめて保存する（ロック取得と保存をパイプラインで重ねる）
+        pending_edits = []
+
         for page in pages:
             if page.fullname not in mapping:
                 results["skipped"].append(page.fullname)
@@ -232,16 +544,23 @@ def main():
             num = mapping[page.fullname]
 
             try:
-                result = process_page(page, num, mapping, args.dry_run)
+                # 差分は表示する場合（dry-runまたは対話確認中）のみ生成する
+                show_diff = args.dry_run or (interactive and not bypass)
+                logger.info("-" * 60)
+                logger.info(f"[{page.fullname}] -> SCP-{num}-JP")
+                result = process_page(page, num, mapping, args.dry_run, diff_writer if show_diff else None, queued)
                 results["processed"].append(result)
 
                 # ログ出力
-                logger.info("-" * 60)
-                logger.info(f"[{page.fullname}] -> SCP-{num}-JP")
                 for action in result["actions"]:
                     logger.info(f"  {action}")
-                for diff in result["diffs"]:
-                    print(diff)
+
+                if "task" in result:
+                    tasks.append((result["fullname"], result.pop("task")))
+                if "edit" in result:
+                    pending_edits.append((result, result["fullname"], result.pop("edit")))
+                if interactive and not bypass or len(pending_edits) >= EDIT_FLUSH_SIZE:
+                    save_edits(site, pending_edits, results)
 
                 # 対話モード: 1ページずつ確認
                 if interactive and not bypass:
@@ -254,6 +573,35 @@ def main():
                 logger.exception(f"エラー: {page.fullname}: {e}")
                 results["errors"].append({"page": page.fullname, "error": str(e)})
 
+        save_edits(site, pending_edits, results)
+
+        # 参照元ページのリンク書き換え
+        if backlink_index is not None:
+            run_metrics.start_phase("backlinks")
+            logger.info("=" * 60)
+            logger.info("参照元ページのリンクを書き換え中...")
+            results["backlinks"] = rewrite_backlinks(
+                site,
+                backlink_index,
+                mapping,
+                args.dry_run,
+                diff_writer if args.dry_run or not (bypass or queued) else None,
+                tasks if queued else None,
+            )
+
+        if queued:
+            run_metrics.start_phase("queue")
+            run_queued(site.unix_name, tasks, args, results)
+
+        # 事後検証: リネーム・タイトル変更したページをまとめて読み直す
+        if not args.dry_run and results["processed"]:
+            run_metrics.start_phase("verify")
+            expectations = [
+                Expectation(r["new_fullname"], title=r.get("new_title"), gone=r["fullname"])
+                for r in results["processed"]
+            ]
+            results["drifts"] = verify(site, expectations)
+
     # サマリー
     logger.info("=" * 60)
     logger.info("SUMMARY")
@@ -261,11 +609,19 @@ def main():
     logger.info(f"処理: {len(results['processed'])}件")
     logger.info(f"スキップ（マッピングなし）: {len(results['skipped'])}件")
     logger.info(f"エラー: {len(results['errors'])}件")
+    if "drifts" in results:
+        logger.info(f"事後検証の不一致: {len(results['drifts'])}件")
+    if "backlinks" in results:
+        logger.info(f"参照元リンク修正: {len(results['backlinks']['processed'])}件")
+        logger.info(f"参照元リンク修正エラー: {len(results['backlinks']['errors'])}件")
+        results["errors"].extend(results["backlinks"]["errors"])
 
     if results["errors"]:
         logger.info("エラー詳細:")
         for err in results["errors"]:
             logger.info(f"  {err['page']}: {err['error']}")
+    for drift in results.get("drifts", []):
+        logger.info(f"  不一致: {drift}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "wikidot>=4.0.1,<5",
+#     "python-dotenv>=1.0.0",
+# ]
+# ///
+"""
+タグの一括操作
+
+サイト・カテゴリ・タグ条件で対象を検索し、追加/削除/置換をバッチ単位で並列に実行する。
+進捗は .state/bulk_tag/<job>.json に記録され、中断しても同じ引数で再実行すれば続きから処理する。
+--index を指定すると対象をサイトを検索せずにローカルのタグインデックス（.state/tag_index/）から選ぶ。
+--processes を指定するとページごとのタスクをジョブキューに登録し、複数のワーカープロセスで実行する。
+
+例: 非使用ユーザーのポータルからinitial_*タグを削除
+  uv run scripts/tool/bulk_tag.py --site scp-jp-sandbox3 --category portal \\
+      --tags=+非使用ユーザー --remove 'initial_*'
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from wikidot.connector.ajax import AjaxModuleConnectorConfig
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.cli import add_common_arguments, apply_common_arguments, load_env  # noqa: E402
+from common.metrics import RunMetrics  # noqa: E402
+from common.paths import state_path  # noqa: E402
+from common.search import search_all  # noqa: E402
+from common.session import create_client  # noqa: E402
+from common.tag_index import load_tag_index  # noqa: E402
+from common.tag_ops import TagOperation, save_tags_bulk  # noqa: E402
+
+logging.basicConfig(
+    level=logging.WARN,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def job_id(args) -> str:
+    """引数から再実行時にも同じになるジョブIDを生成"""
+    key = json.dumps(
+        [args.site, args.category, args.tags, args.add, args.remove, args.replace], ensure_ascii=False
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+
+def load_progress(path: Path) -> set[str]:
+    if not path.exists():
+        return set()
+    return set(json.loads(path.read_text(encoding="utf-8"))["done"])
+
+
+def save_progress(path: Path, done: set[str]) -> None:
+    path.write_text(json.dumps({"done": sorted(done)}, ensure_ascii=False), encoding="utf-8")
+
+
+def run_queued(job: str, site_name: str, changes: list, args, results: dict) -> None:
+    """変更をジョブキューに登録してワーカープロセスで実行し、結果をresultsに反映する"""
+    # ジョブキュー（sqlite3・subprocess）は --processes のときだけ読み込む
+    from common.jobqueue import DONE, JobQueue, page_task, run_workers
+
+    with JobQueue() as queue:
+        if args.restart:
+            queue.delete(job)
+        queue.enqueue(job, site_name, [(page.fullname, page_task(tags=new_tags)) for page, new_tags in changes])
+        run_workers(job, args.processes)
+        for task in queue.results(job):
+            if task.status == DONE:
+                results["processed"].append(task.key)
+            else:
+                results["errors"].append({"page": task.key, "error": task.error or task.status})
+        if not results["errors"]:
+            queue.delete(job)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="タグの一括操作")
+    parser.add_argument("--site", required=True, help="対象サイト")
+    parser.add_argument("--category", default="*", help="対象カテゴリ（スペース区切りで複数指定可）")
+    parser.add_argument("--tags", default="", help="タグ条件（スペース区切り、例: --tags='+4000jp -ハブ'）")
+    parser.add_argument("--add", action="append", default=[], help="追加するタグ")
+    parser.add_argument("--remove", action="append", default=[], help="削除するタグ（globパターン可: initial_*）")
+    parser.add_argument("--replace", action="append", default=[], help="タグの正規表現置換（PATTERN=REPL）")
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="対象をローカルのタグインデックスで選ぶ（最近の更新だけを読み直し、一覧の検索を省く）",
+    )
+    parser.add_argument("--batch-size", type=int, default=50, help="1バッチで保存するページ数")
+    parser.add_argument("--workers", type=int, default=10, help="並列リクエスト数")
+    parser.add_argument("--processes", type=int, default=0, help="ジョブキューに登録し、このプロセス数のワーカーで実行")
+    parser.add_argument("--job", help="ジョブ名（省略時は引数から自動生成）")
+    parser.add_argument("--restart", action="store_true", help="進捗を破棄して最初から実行")
+    parser.add_argument("--dry-run", action="store_true", help="実際の変更を行わずに対象を表示")
+    add_common_arguments(parser)
+    args = parser.parse_args()
+    if args.synthetic and args.processes:
+        # 合成サイトはプロセスごとに別のコピーになり、ワーカーの書き込みがこのプロセスから見えない
+        parser.error("--synthetic と --processes は併用できません")
+    apply_common_arguments(args)
+
+    try:
+        operation = TagOperation.parse(args.add, args.remove, args.replace)
+    except ValueError as e:
+        parser.error(str(e))
+    if not (operation.add or operation.remove or operation.replace):
+        parser.error("--add / --remove / --replace のいずれかを指定してください")
+
+    load_env()
+
+    job = args.job or job_id(args)
+    progress_path = state_path("bulk_tag", f"{job}.json")
+    done = set() if args.restart else load_progress(progress_path)
+    if done:
+        logger.info(f"再開: 処理済み {len(done)}件 ({progress_path})")
+
+    if args.dry_run:
+        logger.info("=== DRY-RUN MODE ===")
+    logger.info(f"操作: {operation.describe()}")
+
+    results = {"processed": [], "unchanged": 0, "errors": []}
+
+    with (
+        RunMetrics("bulk-tag", dry_run=args.dry_run),
+        create_client(
+            username=os.environ["WIKIDOT_USERNAME"],
+            password=os.environ["WIKIDOT_PASSWORD"],
+            amc_config=AjaxModuleConnectorConfig(semaphore_limit=args.workers),
+        ) as client,
+    ):
+        site = client.site.get(args.site)
+        if args.index:
+            index = load_tag_index(site, args.category)
+            pages = index.pages(site, index.select(args.tags, category=args.category))
+            logger.info(f"タグインデックスの検索結果: {len(pages)}件")
+        else:
+            query = {"category": args.category}
+            if args.tags:
+                query["tags"] = args.tags.split()
+            pages = search_all(site, fields=("tags",), **query)
+            logger.info(f"検索結果: {len(pages)}件")
+
+        changes = []
+        for page in pages:
+            if page.fullname in done:
+                continue
+            new_tags = operation.apply(page.tags)
+            if new_tags == page.tags:
+                results["unchanged"] += 1
+                continue
+            changes.append((page, new_tags))
+
+        logger.info(f"変更対象: {len(changes)}件")
+        started = time.monotonic()
+
+        if args.processes and not args.dry_run:
+            run_queued(f"bulk-tag-{job}", site.unix_name, changes, args, results)
+            changes = []
+
+        for i in range(0, len(changes), args.batch_size):
+            batch = changes[i : i + args.batch_size]
+
+            if args.dry_run:
+                for page, new_tags in batch:
+                    logger.info(f"[DRY-RUN] {page.fullname}: {page.tags} -> {new_tags}")
+                results["processed"].extend(page.fullname for page, _ in batch)
+                continue
+
+            errors = save_tags_bulk(site, batch)
+            for (page, new_tags), error in zip(batch, errors, strict=True):
+                if error is None:
+                    done.add(page.fullname)
+                    results["processed"].append(page.fullname)
+                else:
+                    logger.error(f"Error processing page {page.fullname}: {error}")
+                    results["errors"].append({"page": page.fullname, "error": str(error)})
+            save_progress(progress_path, done)
+
+            finished = min(i + args.batch_size, len(changes))
+            rate = finished / max(time.monotonic() - started, 1e-9)
+            logger.info(f"進捗: {finished}/{len(changes)} ({rate:.1f}ページ/秒)")
+
+    logger.info("=== SUMMARY ===")
+    logger.info(f"処理: {len(results['processed'])}件")
+    logger.info(f"変更不要: {results['unchanged']}件")
+    logger.info(f"エラー: {len(results['errors'])}件")
+
+    if not args.dry_run and not results["errors"]:
+        progress_path.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "wikidot>=4.0.1,<5",
+#     "python-dotenv>=1.0.0",
+# ]
+# ///
+"""
+ジョブキューのワーカー
+
+exec.py / rename_4000jp.py / bulk_tag.py が --processes で .state/jobqueue.sqlite3 に登録したタスクを
+リースして実行する。各スクリプトは自分でワーカーを起動するが、中断したジョブの再開や
+ワーカーの追加は単独でも実行できる（複数起動すればそれぞれが別のタスクをリースする）。
+
+例:
+  uv run scripts/tool/job_worker.py --status
+  uv run scripts/tool/job_worker.py --job rename-4000jp --processes 4
+"""
+
+import argparse
+import logging
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.cli import add_common_arguments, apply_common_arguments, load_env  # noqa: E402
+from common.jobqueue import LEASE_SIZE, VISIBILITY_TIMEOUT, JobQueue, run_workers, work  # noqa: E402
+from common.metrics import RunMetrics  # noqa: E402
+from common.session import create_client  # noqa: E402
+
+logging.basicConfig(
+    level=logging.WARN,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def show_status(queue: JobQueue, jobs: list[str]) -> None:
+    if not jobs:
+        logger.info("登録されたジョブはありません")
+    for job in jobs:
+        counts = queue.counts(job)
+        logger.info(f"{job}: " + ", ".join(f"{status} {n}件" for status, n in counts.items()))
+        for task in queue.results(job):
+            if task.error:
+                logger.info(f"  {task.key}: {task.error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ジョブキューのワーカー")
+    parser.add_argument("--job", action="append", help="処理するジョブ（複数指定可、省略時は全ジョブ）")
+    parser.add_argument("--processes", type=int, default=1, help="起動するワーカープロセス数")
+    parser.add_argument("--lease-size", type=int, default=LEASE_SIZE, help="1回にリースするタスク数")
+    parser.add_argument(
+        "--visibility-timeout",
+        type=float,
+        default=VISIBILITY_TIMEOUT,
+        help="リースの期限（秒）。期限までに完了しなかったタスクは他のワーカーが取り直す",
+    )
+    parser.add_argument("--name", default="worker", help="ワーカー名（ログ・メトリクスの記録に使う）")
+    parser.add_argument("--status", action="store_true", help="ジョブの進捗と失敗したタスクを表示して終了")
+    parser.add_argument("--retry-failed", action="store_true", help="失敗したタスクを未処理に戻してから実行")
+    add_common_arguments(parser)
+    args = parser.parse_args()
+    if args.synthetic and args.processes > 1:
+        # 合成サイトはプロセスごとに別のコピーになり、ワーカーの書き込みがこのプロセスから見えない
+        parser.error("--synthetic と --processes は併用できません")
+    apply_common_arguments(args)
+
+    load_env()
+
+    with JobQueue() as queue:
+        jobs = args.job or queue.jobs()
+        if args.status:
+            show_status(queue, jobs)
+            return
+        if args.retry_failed:
+            for job in jobs:
+                logger.info(f"{job}: 失敗したタスク {queue.retry_failed(job)}件を未処理に戻しました")
+
+    if args.processes > 1:
+        for job in jobs:
+            options = ["--lease-size", str(args.lease_size), "--visibility-timeout", str(args.visibility_timeout)]
+            run_workers(job, args.processes, options)
+        return
+
+    with (
+        RunMetrics(f"job-worker-{args.name}"),
+        JobQueue() as queue,
+        create_client(
+            username=os.environ["WIKIDOT_USERNAME"],
+            password=os.environ["WIKIDOT_PASSWORD"],
+        ) as client,
+    ):
+        for job in jobs:
+            result = work(client, queue, job, args.name, args.lease_size, args.visibility_timeout)
+            logger.info(f"[{args.name}] {job}: 完了 {result['done']}件, 失敗 {result['failed']}件")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,21 +4,49 @@
 # dependencies = [
 #     "wikidot>=4.0.1,<5",
 #     "python-dotenv>=1.0.0",
-#     "requests>=2.31.0",
 # ]
 # ///
 """
 タスク1: 剪定対象合作カテゴリへのjp/剪定対象-子タグ付与
 タスク2: SB3ポータルページへのinitial_Xタグ付与
+
+--watch で常駐し、最近の更新を短い間隔で確認して新規作成・リネーム・タグ変更されたページだけを処理する
+（--full-scan-interval ごと、および更新を取りこぼした可能性があるときは全件スキャン）
+
+--deadline を指定すると時間予算を使い切りそうになった残りを次回に持ち越し、次回はそれらから処理する
+（タスク1は残りの予算の半分まで、タスク2はタスク1が使わなかった分を含む残りのすべてを使う）
 """
 
 import argparse
+import json
 import logging
 import os
-import requests
-from datetime import datetime, UTC
-from dotenv import load_dotenv
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
 import wikidot
+from wikidot.util.stringutil import StringUtil
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.cli import add_common_arguments, apply_common_arguments, load_env  # noqa: E402
+from common.deadline import Backlog, Deadline  # noqa: E402
+from common.discord import COLOR_ERROR, COLOR_SUCCESS, COLOR_WARNING, send_discord_notification  # noqa: E402
+from common.metrics import RunMetrics  # noqa: E402
+from common.paths import state_path  # noqa: E402
+from common.rating_history import RatingHistory  # noqa: E402
+from common.recent_changes import FLAG_NEW, FLAG_RENAMED, FLAG_TAGS, ChangeFeed  # noqa: E402
+from common.rules import (  # noqa: E402
+    COLLAB_TAG_RULE,
+    PORTAL_INITIAL_RULE,
+    apply_fixes,
+    check_pages,
+    run_rules,
+)
+from common.search import SearchCache  # noqa: E402
+from common.session import create_client  # noqa: E402
 
 logging.basicConfig(
     level=logging.WARN,
@@ -28,164 +56,61 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-COLLAB_CATEGORIES = [
-    "anomalous-jp",
-    "extranormal-events-jp",
-    "video-log-of-scp-1779-jp",
-    "poem",
-    "log-of-unexplained-locations-jp",
-    "scp-flavor",
-]
-
-COLOR_SUCCESS = 0x00FF00
-COLOR_WARNING = 0xFFFF00
-COLOR_ERROR = 0xFF0000
+TASK1_RULES = [COLLAB_TAG_RULE]
+# 非使用ユーザーのポータルからのinitial_*の削除は定期実行では行わない（temp/remove_initial_tags.py / site_audit --fix）
+TASK2_RULES = [PORTAL_INITIAL_RULE]
+
+# 監視モードで処理する更新（新規作成・リネーム/移動・タグの変更）
+WATCH_FLAGS = {FLAG_NEW, FLAG_RENAMED, FLAG_TAGS}
+
+
+def task1_collab_tagging(
+    client: wikidot.Client,
+    dry_run: bool = False,
+    deadline: Deadline | None = None,
+    backlog: Backlog | None = None,
+) -> dict:
+    """剪定対象合作へのタグ付与（スキャンしたratingはdry-runでなければ履歴に記録）"""
+    with RatingHistory() as history:
+        return run_rules(
+            client,
+            TASK1_RULES,
+            dry_run=dry_run,
+            on_scan=None if dry_run else lambda scan: history.record(scan.site, scan.pages, source="tagging"),
+            deadline=deadline,
+            backlog=backlog,
+        )
 
 
-def send_discord_notification(
-    webhook_url: str,
-    title: str,
-    description: str,
-    fields: list[dict] | None = None,
-    color: int = COLOR_SUCCESS,
-) -> bool:
-    """Discord webhookにembed形式で通知を送信"""
-    embed = {
-        "title": title,
-        "description": description,
-        "color": color,
-        "timestamp": datetime.now(UTC).isoformat(),
-        "footer": {"text": "SCP-JP Scripts"},
-    }
-    if fields:
-        embed["fields"] = fields
-
-    try:
-        response = requests.post(webhook_url, json={"embeds": [embed]}, timeout=10)
-        return 200 <= response.status_code < 300
-    except requests.RequestException as e:
-        logger.exception(f"Error sending Discord notification: {e}")
-        return False
-
-
-def get_initial_tag(unix_name: str) -> str:
-    """unix_nameの頭文字からinitial_Xタグを生成"""
-    if not unix_name:
-        return "initial_null"
-    first_char = unix_name[0].lower()
-    if first_char.isalnum():
-        return f"initial_{first_char}"
-    return "initial_null"
-
-
-def should_skip_page(page, processed_pages: set) -> bool:
-    """ページをスキップすべきか判定"""
-    return page.fullname in processed_pages or page.name.startswith("_")
-
-
-def add_tags_to_page(page, tags: list[str], dry_run: bool) -> None:
-    """ページにタグを追加"""
-    if dry_run:
-        logger.info(f"[DRY-RUN] {page.fullname}: +{tags}")
-    else:
-        for tag in tags:
-            page.tags.append(tag)
-        page.commit_tags()
-        logger.info(f"{page.fullname}: +{tags}")
-
-
-def task1_collab_tagging(client: wikidot.Client, dry_run: bool = False) -> dict:
-    """剪定対象合作へのタグ付与"""
-    site = client.site.get("scp-jp")
-    results = {"processed": [], "errors": []}
-    processed_pages = set()
-
-    for category in COLLAB_CATEGORIES:
-        # jpタグがないページを検索して両タグを付与
-        pages_without_jp = site.pages.search(category=category, tags=["-jp"])
-        for page in pages_without_jp:
-            if should_skip_page(page, processed_pages):
-                continue
-            processed_pages.add(page.fullname)
-
-            try:
-                tags_to_add = ["jp"]
-                if "剪定対象-子" not in page.tags:
-                    tags_to_add.append("剪定対象-子")
-                add_tags_to_page(page, tags_to_add, dry_run)
-                results["processed"].append(page.fullname)
-            except Exception as e:
-                logger.exception(f"Error processing page {page.fullname}: {e}")
-                results["errors"].append({"page": page.fullname, "error": str(e)})
-
-        # 剪定対象-子タグがないページを検索（jpタグはあるがこちらがない場合）
-        pages_without_sentei = site.pages.search(category=category, tags=["-剪定対象-子"])
-        for page in pages_without_sentei:
-            if should_skip_page(page, processed_pages):
-                continue
-            processed_pages.add(page.fullname)
-
-            try:
-                add_tags_to_page(page, ["剪定対象-子"], dry_run)
-                results["processed"].append(page.fullname)
-            except Exception as e:
-                logger.exception(f"Error processing page {page.fullname}: {e}")
-                results["errors"].append({"page": page.fullname, "error": str(e)})
-
-    return results
-
-
-def task2_sb3_portal_tagging(client: wikidot.Client, dry_run: bool = False) -> dict:
+def task2_sb3_portal_tagging(
+    client: wikidot.Client,
+    dry_run: bool = False,
+    deadline: Deadline | None = None,
+    backlog: Backlog | None = None,
+) -> dict:
     """SB3ポータルページへのinitial_Xタグ付与"""
-    site = client.site.get("scp-jp-sandbox3")
-    results = {"processed": [], "errors": []}
-
-    # initial_*タグを全て除外、非使用ユーザーも除外して検索
-    exclude_tags = [f"-initial_{c}" for c in "abcdefghijklmnopqrstuvwxyz0123456789"] + ["-initial_null", "-非使用ユーザー"]
-    pages = site.pages.search(category="portal", tags=exclude_tags)
-
-    for page in pages:
-        try:
-            if page.name.startswith("_"):
-                continue
-
-            if page.created_by:
-                initial_tag = get_initial_tag(page.created_by.unix_name)
-            else:
-                initial_tag = "非使用ユーザー"
-
-            add_tags_to_page(page, [initial_tag], dry_run)
-            results["processed"].append(page.fullname)
-        except Exception as e:
-            logger.exception(f"Error processing page {page.fullname}: {e}")
-            results["errors"].append({"page": page.fullname, "error": str(e)})
-
-    return results
-
-
-def main():
-    parser = argparse.ArgumentParser(description="タグ付与スクリプト")
-    parser.add_argument("--dry-run", action="store_true", help="実際の変更を行わずに対象を表示")
-    args = parser.parse_args()
-
-    load_dotenv()
-    webhook_url = os.environ["DISCORD_WEBHOOK_URL"]
-
-    if args.dry_run:
-        logger.info("=== DRY-RUN MODE ===")
+    return run_rules(client, TASK2_RULES, dry_run=dry_run, deadline=deadline, backlog=backlog)
 
-    with wikidot.Client(
-        username=os.environ["WIKIDOT_USERNAME"],
-        password=os.environ["WIKIDOT_PASSWORD"],
-    ) as client:
-        task1_results = task1_collab_tagging(client, dry_run=args.dry_run)
-        task2_results = task2_sb3_portal_tagging(client, dry_run=args.dry_run)
 
+def report(
+    task1_results: dict,
+    task2_results: dict,
+    run_metrics: RunMetrics,
+    webhook_url: str,
+    dry_run: bool,
+    deadline: Deadline | None = None,
+    carried_over: int = 0,
+) -> None:
+    deferred = len(task1_results["deferred"]) + len(task2_results["deferred"])
     # Discord通知（dry-run時は送信しない）
-    if args.dry_run:
+    if dry_run:
         logger.info("=== SUMMARY ===")
         logger.info(f"タスク1: 処理対象 {len(task1_results['processed'])}件, エラー {len(task1_results['errors'])}件")
         logger.info(f"タスク2: 処理対象 {len(task2_results['processed'])}件, エラー {len(task2_results['errors'])}件")
+        if deadline is not None:
+            logger.info(f"時間予算: {deadline.describe()}, 持ち越し {deferred}件")
+        for reported in task1_results["reported"] + task2_results["reported"]:
+            logger.info(f"要確認: {reported['page']} ({reported['rule']}: {reported['note']})")
         return
 
     fields = [
@@ -196,20 +121,27 @@ def main():
         },
         {
             "name": "タスク2: SB3 initial_Xタグ付与",
-            "value": f"処理: {len(task2_results['processed'])}件\nエラー: {len(task2_results['errors'])}件",
+            "value": f"処理: {len(task2_results['processed'])}件\nエラー: {len(task2_results['errors'])}件"
+            + (f"\n要確認: {len(task2_results['reported'])}件" if task2_results["reported"] else ""),
             "inline": True,
         },
     ]
+    if deadline is not None:
+        fields.append(deadline.discord_field(carried_over=carried_over))
+    fields.append(run_metrics.discord_field())
 
     total_errors = len(task1_results["errors"]) + len(task2_results["errors"])
     total_processed = len(task1_results["processed"]) + len(task2_results["processed"])
 
     if total_errors > 0:
         color = COLOR_ERROR
+    elif run_metrics.regressions or deferred:
+        color = COLOR_WARNING
     else:
         color = COLOR_SUCCESS
 
-    if total_processed > 0 or total_errors > 0:
+    # 処理・エラー・持ち越し・性能の回帰のいずれかがあれば通知
+    if total_processed > 0 or total_errors > 0 or deferred or run_metrics.regressions:
         send_discord_notification(
             webhook_url=webhook_url,
             title="tool/tagging 完了",
@@ -219,5 +151,151 @@ def main():
         )
 
 
+def check_changed_pages(client: wikidot.Client, site: wikidot.Site, batch, dry_run: bool = False) -> dict:
+    """最近の更新のうち対象の更新だけをタスク1/2のルールで処理する（自分の更新は除く）"""
+    own = StringUtil.to_unix(client.username) if client.username else None
+    fullnames = [c.fullname for c in batch.changes if c.flags & WATCH_FLAGS and c.changed_by != own]
+    if not fullnames:
+        return {"processed": [], "reported": [], "errors": [], "deferred": []}
+    scan = check_pages(site, TASK1_RULES + TASK2_RULES, fullnames)
+    if not dry_run and scan.site == COLLAB_TAG_RULE.site and scan.pages:
+        with RatingHistory() as history:
+            history.record(scan.site, scan.pages, source="tagging")
+    return apply_fixes(scan.violations, dry_run=dry_run)
+
+
+def full_scan(client: wikidot.Client, webhook_url: str, dry_run: bool = False) -> None:
+    """タスク1/2の全件スキャン（監視モードの定期実行）"""
+    with RunMetrics("tagging", dry_run=dry_run) as run_metrics:
+        with run_metrics.phase("task1"):
+            task1_results = task1_collab_tagging(client, dry_run=dry_run)
+        with run_metrics.phase("task2"):
+            task2_results = task2_sb3_portal_tagging(client, dry_run=dry_run)
+    report(task1_results, task2_results, run_metrics, webhook_url, dry_run=dry_run)
+
+
+def watch(client: wikidot.Client, webhook_url: str, interval: float, full_scan_interval: float, dry_run: bool) -> None:
+    """最近の更新をinterval秒ごとに確認し、SIGTERM/Ctrl-Cで終了する"""
+    sites = {name: client.site.get(name) for name in dict.fromkeys(r.site for r in TASK1_RULES + TASK2_RULES)}
+    # dry-runでは読んだ位置を保存しない（本番の監視が同じ更新を処理できるように）
+    feeds = {name: ChangeFeed(name, persist=not dry_run) for name in sites}
+    state = state_path("tagging_watch.json")
+    last_full_scan = json.loads(state.read_text(encoding="utf-8"))["last_full_scan"] if state.exists() else 0.0
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    logger.info(f"監視を開始: {interval:g}秒ごとに最近の更新を確認, {full_scan_interval:g}時間ごとに全件スキャン")
+
+    while not stop.is_set():
+        try:
+            # 検索結果は1回の確認の中だけで再利用する（常駐中に他の利用者が変更するため）
+            with SearchCache():
+                batches = [feeds[name].poll(site) for name, site in sites.items()]
+                if time.time() - last_full_scan >= full_scan_interval * 3600 or not all(b.complete for b in batches):
+                    full_scan(client, webhook_url, dry_run=dry_run)
+                    last_full_scan = time.time()
+                    if not dry_run:
+                        state.write_text(json.dumps({"last_full_scan": last_full_scan}), encoding="utf-8")
+                else:
+                    results = {"processed": [], "reported": [], "errors": [], "deferred": []}
+                    for batch in batches:
+                        checked = check_changed_pages(client, sites[batch.site], batch, dry_run=dry_run)
+                        for key, entries in checked.items():
+                            results[key].extend(entries)
+                    report_changes(results, webhook_url, dry_run=dry_run)
+                for batch in batches:
+                    feeds[batch.site].commit(batch)
+        except KeyboardInterrupt:
+            break
+        except Exception as e:
+            # 通信エラー等は次の確認で再試行（読んだ位置は進めない）
+            logger.exception(f"最近の更新の確認に失敗: {e}")
+        try:
+            stop.wait(interval)
+        except KeyboardInterrupt:
+            break
+    logger.info("監視を終了")
+
+
+def report_changes(results: dict, webhook_url: str, dry_run: bool = False) -> None:
+    """監視モードで処理した更新の通知（処理・エラーがあったときだけ）"""
+    for reported in results["reported"]:
+        logger.info(f"要確認: {reported['page']} ({reported['rule']}: {reported['note']})")
+    if dry_run or not (results["processed"] or results["errors"]):
+        return
+    lines = [f"{entry['page']}: +{entry['added']} -{entry['removed']}" for entry in results["processed"]]
+    lines += [f"エラー: {entry['page']} ({entry['error']})" for entry in results["errors"]]
+    send_discord_notification(
+        webhook_url=webhook_url,
+        title="tool/tagging 更新されたページを処理",
+        description="\n".join(lines)[:4000],
+        color=COLOR_ERROR if results["errors"] else COLOR_SUCCESS,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="タグ付与スクリプト")
+    parser.add_argument("--dry-run", action="store_true", help="実際の変更を行わずに対象を表示")
+    parser.add_argument("--watch", action="store_true", help="常駐して最近の更新を確認し、更新されたページだけを処理")
+    parser.add_argument("--interval", type=float, default=120, help="監視モードで最近の更新を確認する間隔（秒）")
+    parser.add_argument("--full-scan-interval", type=float, default=24, help="監視モードで全件スキャンする間隔（時間）")
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        help="時間予算（秒、監視モードでは使わない）。超えそうになったら残りを .state/backlog/ に保存して次回に持ち越す",
+    )
+    add_common_arguments(parser)
+    args = parser.parse_args()
+    apply_common_arguments(args)
+    deadline = Deadline(args.deadline) if args.deadline and not args.watch else None
+
+    load_env()
+    webhook_url = os.environ["DISCORD_WEBHOOK_URL"]
+
+    if args.dry_run:
+        logger.info("=== DRY-RUN MODE ===")
+
+    if args.watch:
+        with create_client(
+            username=os.environ["WIKIDOT_USERNAME"],
+            password=os.environ["WIKIDOT_PASSWORD"],
+        ) as client:
+            watch(client, webhook_url, args.interval, args.full_scan_interval, dry_run=args.dry_run)
+        return
+
+    backlog = Backlog("tagging")
+    if backlog:
+        logger.info(f"前回からの持ち越し: {len(backlog)}件")
+
+    with (
+        RunMetrics("tagging", dry_run=args.dry_run) as run_metrics,
+        create_client(
+            username=os.environ["WIKIDOT_USERNAME"],
+            password=os.environ["WIKIDOT_PASSWORD"],
+        ) as client,
+    ):
+        # タスク1の持ち越しが多くてもタスク2が毎回止まらないよう、タスク1は残りの予算の半分までにする
+        if deadline is not None:
+            deadline.share(0.5)
+        with run_metrics.phase("task1"):
+            task1_results = task1_collab_tagging(client, dry_run=args.dry_run, deadline=deadline, backlog=backlog)
+        if deadline is not None:
+            deadline.share(1.0)
+        with run_metrics.phase("task2"):
+            task2_results = task2_sb3_portal_tagging(client, dry_run=args.dry_run, deadline=deadline, backlog=backlog)
+    if not args.dry_run:
+        backlog.save(task1_results["deferred"] + task2_results["deferred"])
+
+    report(
+        task1_results,
+        task2_results,
+        run_metrics,
+        webhook_url,
+        dry_run=args.dry_run,
+        deadline=deadline,
+        carried_over=len(backlog),
+    )
+
+
 if __name__ == "__main__":
     main()
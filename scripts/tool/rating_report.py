@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# dependencies = []
+# ///
+"""
+rating履歴レポート（オフライン）
+
+定期実行で記録したrating履歴から、指定月に閾値をまたいだページを集計する。
+"""
+
+import argparse
+import logging
+import sys
+from datetime import datetime, UTC
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.rating_history import RatingHistory  # noqa: E402
+
+logging.basicConfig(
+    level=logging.WARN,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def month_range(month: str) -> tuple[datetime, datetime]:
+    """YYYY-MM から月初と翌月初を返す"""
+    start = datetime.strptime(month, "%Y-%m").replace(tzinfo=UTC)
+    if start.month == 12:
+        end = start.replace(year=start.year + 1, month=1)
+    else:
+        end = start.replace(month=start.month + 1)
+    return start, end
+
+
+def main():
+    parser = argparse.ArgumentParser(description="rating履歴レポート")
+    parser.add_argument("--site", default="scp-jp", help="対象サイト")
+    parser.add_argument("--month", default=datetime.now(UTC).strftime("%Y-%m"), help="対象月 (YYYY-MM)")
+    parser.add_argument("--threshold", type=float, default=-3, help="閾値（rating <= 閾値 を剪定対象とみなす）")
+    parser.add_argument("--page", help="指定ページのrating推移を表示")
+    args = parser.parse_args()
+
+    with RatingHistory() as history:
+        if args.page:
+            for observation in history.history(args.site, args.page):
+                print(f"{observation.observed_at.isoformat()}\t{observation.rating:g}")
+            return
+
+        start, end = month_range(args.month)
+        crossings = history.crossings(args.site, args.threshold, start, end)
+
+    downward = [c for c in crossings if c.downward]
+    upward = [c for c in crossings if not c.downward]
+
+    logger.info(f"=== {args.site} {args.month} (閾値: {args.threshold:g}) ===")
+    logger.info(f"閾値以下へ下落: {len(downward)}件")
+    for c in downward:
+        logger.info(f"  {c.fullname}: {c.before:g} → {c.after:g} ({c.observed_at.date()})")
+    logger.info(f"閾値超へ回復: {len(upward)}件")
+    for c in upward:
+        logger.info(f"  {c.fullname}: {c.before:g} → {c.after:g} ({c.observed_at.date()})")
+
+
+if __name__ == "__main__":
+    main()
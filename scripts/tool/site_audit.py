@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "wikidot>=4.0.1,<5",
+#     "python-dotenv>=1.0.0",
+# ]
+# ///
+"""
+サイト監査: 全てのタグ付与・剪定ルールをサイトごとに1回のスキャンで評価
+
+デフォルトでは違反の報告のみ行い、--fix 指定時にまとめて修正する。
+"""
+
+import argparse
+import logging
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.cli import add_common_arguments, apply_common_arguments, load_env  # noqa: E402
+from common.metrics import RunMetrics  # noqa: E402
+from common.rules import ALL_RULES, apply_fixes, scan_site  # noqa: E402
+from common.session import create_client  # noqa: E402
+
+logging.basicConfig(
+    level=logging.WARN,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def main():
+    rule_names = [r.name for r in ALL_RULES]
+    parser = argparse.ArgumentParser(description="タグ付与・剪定ルールの一括監査")
+    parser.add_argument("--rule", action="append", choices=rule_names, help="評価するルール（複数指定可、省略時は全ルール）")
+    parser.add_argument("--fix", action="store_true", help="違反をまとめて修正する")
+    parser.add_argument("--dry-run", action="store_true", help="--fix 時に実際の変更を行わずに対象を表示")
+    add_common_arguments(parser)
+    args = parser.parse_args()
+    apply_common_arguments(args)
+
+    load_env()
+    rules = [r for r in ALL_RULES if not args.rule or r.name in args.rule]
+
+    for rule in rules:
+        logger.info(f"ルール: {rule.name} ({rule.site}) - {rule.description}")
+
+    summary = {}
+
+    with (
+        RunMetrics("site-audit", dry_run=not args.fix or args.dry_run),
+        create_client(
+            username=os.environ["WIKIDOT_USERNAME"],
+            password=os.environ["WIKIDOT_PASSWORD"],
+        ) as client,
+    ):
+        for site_name in dict.fromkeys(r.site for r in rules):
+            site = client.site.get(site_name)
+            scan = scan_site(site, rules)
+
+            for violation in scan.violations:
+                fix = violation.fix
+                detail = f"+{list(fix.add)} -{list(fix.remove)}" if fix.fixable else fix.note
+                logger.info(f"[{violation.rule.name}] {violation.page.fullname}: {detail}")
+                summary[violation.rule.name] = summary.get(violation.rule.name, 0) + 1
+
+            if args.fix:
+                results = apply_fixes(scan.violations, dry_run=args.dry_run)
+                logger.info(
+                    f"{site_name}: 修正 {len(results['processed'])}件, "
+                    f"要確認 {len(results['reported'])}件, エラー {len(results['errors'])}件"
+                )
+
+    logger.info("=== SUMMARY ===")
+    for rule in rules:
+        logger.info(f"{rule.name}: {summary.get(rule.name, 0)}件")
+
+
+if __name__ == "__main__":
+    main()
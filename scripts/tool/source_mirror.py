@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# dependencies = [
+#     "wikidot>=4.0.1,<5",
+# ]
+# ///
+"""
+ページソースのローカルミラー管理
+
+sync : リビジョン数が変わったページのソースだけを取得してミラーを更新
+grep : ミラー内のソースを正規表現で検索（リクエストなし）
+"""
+
+import argparse
+import logging
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from common.cli import add_common_arguments, apply_common_arguments  # noqa: E402
+from common.metrics import RunMetrics  # noqa: E402
+from common.source_mirror import SourceMirror  # noqa: E402
+
+logging.basicConfig(
+    level=logging.WARN,
+    format="%(asctime)s [%(levelname)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def cmd_sync(args) -> None:
+    from common.search import search_all
+    from common.session import create_client
+
+    # ソース閲覧にログインは不要
+    with (
+        RunMetrics(f"source-mirror-{args.site}") as run_metrics,
+        create_client() as client,
+        SourceMirror(args.site) as mirror,
+    ):
+        run_metrics.start_phase("list")
+        site = client.site.get(args.site)
+        pages = search_all(site, fields=("revisions_count",), category=args.category)
+        run_metrics.start_phase("sync")
+        result = mirror.sync(site, category=args.category, pages=pages)
+    logger.info(f"同期完了: 一覧 {result['listed']}件, 更新 {result['updated']}件, 削除 {result['removed']}件")
+
+
+def cmd_grep(args) -> None:
+    flags = re.IGNORECASE if args.ignore_case else 0
+    count = 0
+    with SourceMirror(args.site) as mirror:
+        for fullname, lineno, line in mirror.grep(args.pattern, flags):
+            print(f"{fullname}:{lineno}:{line}")
+            count += 1
+    logger.info(f"一致: {count}行")
+
+
+def cmd_stats(args) -> None:
+    with SourceMirror(args.site) as mirror:
+        size = mirror.blob_path.stat().st_size
+        logger.info(f"{args.site}: {len(mirror)}ページ, {size / 1024 / 1024:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ページソースのローカルミラー")
+    parser.add_argument("--site", default="scp-jp", help="対象サイト")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_sync = sub.add_parser("sync", help="ミラーを差分同期")
+    p_sync.add_argument("--category", default="*", help="同期するカテゴリ（スペース区切りで複数指定可）")
+    p_sync.set_defaults(func=cmd_sync)
+
+    p_grep = sub.add_parser("grep", help="ミラー内のソースを検索")
+    p_grep.add_argument("pattern", help="正規表現")
+    p_grep.add_argument("-i", "--ignore-case", action="store_true", help="大文字小文字を区別しない")
+    p_grep.set_defaults(func=cmd_grep)
+
+    p_stats = sub.add_parser("stats", help="ミラーの統計を表示")
+    p_stats.set_defaults(func=cmd_stats)
+
+    add_common_arguments(parser)
+    args = parser.parse_args()
+    apply_common_arguments(args)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()